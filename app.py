@@ -1,55 +1,189 @@
 import json
+import sqlite3
+import uuid
 import streamlit as st
-import pandas as pd
-import glob
+import app_metrics
+import connector_diff
+import connector_index
+import connector_similarity
+import connector_sql
+import connector_store
+import harness_graph
+import image_cache
+import part_number_search
+import result_cache
 
 # --- Load Connector Metadata ---
-@st.cache_data # Cache this to avoid reloading on every interaction
+@app_metrics.instrumented(st.cache_data) # Cache this to avoid reloading on every interaction
 def load_connector_metadata():
-    connector_files_metadata = []
-    file_pattern = "connectors/connectors_*.json" 
-
-    for filename in glob.glob(file_pattern):
-        if "old_" in filename.lower(): # Heuristic to skip files like 'old_connectors_prog-13.json'
-            st.info(f"Skipping file with 'old_' in name: {filename}")
-            continue
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-                # Ensure all required top-level keys are present
-                if 'model' in data and 'prog_id' in data and 'sop' in data and 'connectors' in data:
-                    connector_files_metadata.append({
-                        "model": data["model"],
-                        "prog_id": data["prog_id"],
-                        "sop": data["sop"],
-                        "filename": filename,
-                        "build_information": data.get("build_information", [])
-                    })
-                else:
-                    st.warning(f"Skipping {filename}: missing one or more required keys ('model', 'prog_id', 'sop', 'connectors') in JSON structure.")
-        except json.JSONDecodeError:
-            st.error(f"Error decoding JSON from {filename}. Please ensure it's valid.")
-        except Exception as e:
-            st.error(f"An unexpected error occurred while processing {filename}: {e}")
+    # Read the manifest instead of parsing every program file; stale entries are rebuilt automatically
+    connector_files_metadata, messages = connector_store.refresh_manifest()
+    for level, message in messages:
+        getattr(st, level)(message)
     return connector_files_metadata
 
 # --- Load Specific Connector Data ---
-@st.cache_data # Cache data for each specific connector file
+# Not cached itself: load_prepared_program caches the derived program built from it
 def load_specific_connector_data(filename):
+    # `filename` is whichever store connector_store.resolve_program_path picked for the program: its columnar
+    # conversion, its deduplicated refs file, or the program JSON file itself (connector_store.load_program_tables).
+    # Returns (connectors table, cavities table); both are empty if loading failed.
     try:
-        with open(filename, 'r') as f:
-            full_file_data = json.load(f)
-            # Return only the 'connectors' list, or the whole data if needed elsewhere
-            return full_file_data.get("connectors", [])
+        return connector_store.load_program_tables(filename)
     except FileNotFoundError:
         st.error(f"Error: File '{filename}' not found.")
-        return []
     except json.JSONDecodeError:
         st.error(f"Error: Could not decode JSON from '{filename}'. Ensure it is valid.")
-        return []
     except Exception as e:
         st.error(f"An unexpected error occurred while loading data from {filename}: {e}")
-        return []
+    return connector_store.program_to_tables([])
+
+# --- Load Prepared Program ---
+@app_metrics.instrumented(st.cache_resource(max_entries=8)) # Shared by every rerun and session; the content hash invalidates it when the file changes
+def load_prepared_program(filename, content_hash):
+    # Derived columns, facet vocabularies and search columns, so a rerun only has to evaluate the filter mask
+    with app_metrics.stage("load program file"):
+        connectors_table, cavities_table = load_specific_connector_data(filename)
+    with app_metrics.stage("prepare program"):
+        return connector_index.prepare_program(connectors_table, cavities_table)
+
+# --- Load Harness Graph ---
+@app_metrics.instrumented(st.cache_resource(max_entries=8))
+def load_harness_graph(filename, content_hash):
+    # Wire/mating adjacency (CSR) of one program, for circuit traces and neighbour queries
+    prepared_program = load_prepared_program(filename, content_hash)
+    return harness_graph.build_harness_graph(prepared_program.df, prepared_program.cavities)
+
+# --- Load Program Hashes ---
+@app_metrics.instrumented(st.cache_resource(max_entries=16))
+def load_program_hashes(filename, content_hash):
+    # Per-connector content hashes for the program diff; persisted in connectors/hashes/ by connector_diff
+    try:
+        return connector_diff.load_program_hashes({"filename": filename, "sha256": content_hash})
+    except Exception as e:
+        st.error(f"Could not compute connector hashes for {filename}: {e}")
+        return {}
+
+# --- Image Cache ---
+@app_metrics.instrumented(st.cache_resource)
+def load_image_cache():
+    # Connector photos are served from the local cache (thumbnails unless full size is asked for); misses are
+    # downloaded in the background, with a short timeout, so rendering never waits for a download
+    return image_cache.ImageCache(timeout=image_cache.ON_DEMAND_TIMEOUT)
+
+def show_cached_image(url, caption, full_size=False):
+    with app_metrics.stage("images"):
+        images = load_image_cache()
+        path = images.image(url, fetch=False) if full_size else images.thumbnail(url, fetch=False)
+        if path is None:
+            # Not cached yet: the browser loads the source image meanwhile, later reruns get the cached copy
+            images.fetch_in_background(url)
+            path = url
+        st.image(path, caption=caption, use_container_width=True)
+
+# --- Result Cache ---
+@app_metrics.instrumented(st.cache_resource)
+def load_result_cache():
+    # One per server process: every session's searches are served from and added to the same cache
+    return result_cache.ResultCache()
+
+# --- Load All Programs ---
+@app_metrics.instrumented(st.cache_resource(max_entries=2)) # Keyed by every program's content hash, so adding or changing a program rebuilds it
+def load_all_programs(program_sources):
+    # program_sources: ((filename, content_hash, model, sop, prog_id), ...) in display order.
+    # One combined, prepared table with model/sop/prog_id columns, so a cross-program search is one filter pass.
+    with app_metrics.stage("load program files"):
+        loaded = connector_store.load_programs_parallel([source[0] for source in program_sources])
+    programs = []
+    for filename, _, model, sop, prog_id in program_sources:
+        tables = loaded[filename]
+        if isinstance(tables, Exception):
+            st.error(f"Could not load {filename} ({model} {sop}, {prog_id}), it is left out of the search: {tables}")
+            continue
+        programs.append(({"model": model, "sop": sop, "prog_id": prog_id}, *tables))
+    with app_metrics.stage("prepare program"):
+        return connector_index.prepare_program(*connector_store.concat_program_tables(programs))
+
+# --- Part Number Index ---
+@app_metrics.instrumented(st.cache_resource(max_entries=1))
+def load_part_number_index(program_sources):
+    # Q-gram index over the combined all-programs table, for typo-tolerant part number lookups
+    return part_number_search.build_part_number_index(load_all_programs(program_sources))
+
+# --- Pinout Similarity Index ---
+@app_metrics.instrumented(st.cache_resource(max_entries=1))
+def load_similarity_index(program_sources):
+    # MinHash/LSH index over the pinouts of all programs, for "find connectors like this one"
+    return connector_similarity.build_similarity_index(load_all_programs(program_sources))
+
+# --- SQLite search backend ---
+@app_metrics.instrumented(st.cache_resource(max_entries=1))
+def load_search_database(program_sources):
+    # program_sources as for load_all_programs; only programs whose hash changed are re-ingested
+    program_metadata = [{"filename": filename, "sha256": content_hash, "model": model, "sop": sop, "prog_id": prog_id}
+                        for filename, content_hash, model, sop, prog_id in program_sources]
+    for level, message in connector_sql.sync_database(program_metadata):
+        getattr(st, level)(message)
+    return connector_sql.DATABASE_PATH
+
+@app_metrics.instrumented(st.cache_resource(max_entries=32))
+def load_sql_program_facets(program_sources, programs):
+    # Slider ranges and color vocabularies straight from the database; programs: None (all) or ((model, prog_id),)
+    load_search_database(program_sources)
+    return connector_sql.ProgramFacets(None if programs is None else list(programs))
+
+sop_sort_key = connector_store.sop_sort_key
+
+ALL_PROGRAMS_OPTION = "All programs"
+SEARCH_VIEW = "Connector search"
+TRACE_VIEW = "Circuit trace"
+LOOKUP_VIEW = "Part number lookup"
+SIMILAR_VIEW = "Similar connectors"
+DIFF_VIEW = "Program diff"
+SIMILAR_FROM_CONNECTOR = "From a connector"
+SIMILAR_FROM_PINOUT = "Describe a pinout"
+ALL_CAVITIES_OPTION = "All cavities"
+CARDS_LAYOUT = "Cards"
+TABLE_LAYOUT = "Table"
+TABLE_ICON_ROWS = 1000 # Table rows that get an inline thumbnail; the rest link the source image
+SPARKLINE_BLOCKS = " ▁▂▃▄▅▆▇█" # Empty, then increasing counts
+SPARKLINE_WIDTH = 30 # Characters in a slider distribution; longer distributions are binned
+
+# --- Instrumentation (opt-in: ?debug=1, see app_metrics) ---
+rerun_metrics = app_metrics.start_rerun(app_metrics.is_enabled(st.query_params),
+                                        session=st.session_state.setdefault("metrics_session", uuid.uuid4().hex[:8]))
+
+def show_rerun_metrics(prepared_program=None, results=None):
+    # Debug expander with this rerun's stage timings, cache hits/misses and table sizes; also appended to the log.
+    # Call it last (before st.stop() in the views), so every stage of the rerun is in.
+    if rerun_metrics is None:
+        return
+    total_seconds = rerun_metrics.elapsed()
+    if prepared_program is not None and hasattr(prepared_program, "df"): # Not for the SQLite backend's facets
+        rerun_metrics.memory["connectors table"] = app_metrics.dataframe_bytes(prepared_program.df)
+        rerun_metrics.memory["cavities table"] = app_metrics.dataframe_bytes(prepared_program.cavities)
+        rerun_metrics.memory["wire color counts"] = int(prepared_program.wire_color_counts.nbytes)
+    if results is not None:
+        rerun_metrics.memory["results"] = app_metrics.dataframe_bytes(results)
+    record = rerun_metrics.record()
+    record["total_seconds"] = total_seconds # Measuring table sizes above is not part of the rerun
+    with st.sidebar.expander("Performance (debug)", expanded=True):
+        st.write(f"**Rerun:** {total_seconds * 1000:.1f} ms")
+        st.dataframe([{"stage": name, "ms": round(stage["seconds"] * 1000, 2), "calls": stage["calls"]}
+                      for name, stage in record["stages"].items()], hide_index=True)
+        st.caption("Loaders: calls and cache misses in this rerun, and since the server started")
+        st.dataframe([{"loader": name, "calls": loader["calls"], "misses": loader["misses"], "ms": round(loader["seconds"] * 1000, 2),
+                       "total hits": totals["calls"] - totals["misses"], "total misses": totals["misses"]}
+                      for name, loader in record["loaders"].items()
+                      for totals in [app_metrics.loader_totals.get(name, {"calls": 0, "misses": 0})]], hide_index=True)
+        if record["memory_bytes"]:
+            st.dataframe([{"table": name, "MB": round(size / 2**20, 2)} for name, size in record["memory_bytes"].items()],
+                         hide_index=True)
+        try:
+            app_metrics.write_log(record)
+            st.caption(f"Logged to {app_metrics.log_path()}")
+        except OSError as e:
+            st.caption(f"Could not write {app_metrics.log_path()}: {e}")
 
 all_connectors_metadata = load_connector_metadata()
 
@@ -59,23 +193,29 @@ if not all_connectors_metadata:
              "are valid JSON, and contain 'model', 'prog_id', 'sop', and 'connectors' keys.")
     st.stop()
 
+selected_view = st.sidebar.radio("View", [SEARCH_VIEW, TRACE_VIEW, LOOKUP_VIEW, SIMILAR_VIEW, DIFF_VIEW], horizontal=True)
+use_sql_backend = st.sidebar.toggle("SQLite search backend", key="use_sql_backend",
+                                    help=f"Query {connector_store.CONNECTORS_DIR}/connectors.sqlite (built on first use) "
+                                         "instead of loading program files into memory.")
+
 st.sidebar.header("Select Vehicle Program")
 
 models = sorted(list(set(meta["model"] for meta in all_connectors_metadata)))
-selected_model = st.sidebar.selectbox("1. Select Model", models, index=0 if models else -1) # Select first model by default if available
+# The last entry searches every program of every model at once
+selected_model = st.sidebar.selectbox("1. Select Model", models + [ALL_PROGRAMS_OPTION], index=0) # Select first model by default if available
+search_all_programs = selected_model == ALL_PROGRAMS_OPTION
 
 selected_sop_display = None
+selected_sop_display_string = None
 target_filename = None
-connectors_data = [] # Initialize as empty list; this will hold the list of connector dicts
+prepared = None # Will hold the connector_index.PreparedProgram for the selected file
 current_build_info = []
 
-if selected_model:
+if search_all_programs:
+    st.sidebar.caption(f"Searching all {len(all_connectors_metadata)} programs. Results are grouped by program.")
+    st.sidebar.markdown("---")
+elif selected_model:
     metadata_for_selected_model = [meta for meta in all_connectors_metadata if meta["model"] == selected_model]
-    
-    def sop_sort_key(sop_string):
-        if isinstance(sop_string, str) and sop_string.startswith("SOP") and sop_string[3:].isdigit():
-            return int(sop_string[3:])
-        return float('inf') # Place non-standard or non-string SOPs at the end
 
     # Create a list of unique SOP display names (including build info) for the selected model, sorted correctly
     sops_for_model_display_tuples = [] # Will store (display_string, original_sop, original_prog_id)
@@ -150,7 +290,9 @@ if selected_model and selected_sop_display_string: # This is now just "SOP1", "S
         st.stop()
 
     if matching_meta: 
-        target_filename = matching_meta["filename"]
+        # Prefer an up-to-date columnar conversion of the program file, then its dedup refs file, then the JSON
+        target_filename = connector_store.resolve_program_path(matching_meta)
+        target_content_hash = matching_meta["sha256"]
         # current_build_info is still loaded here from matching_meta["build_information"]
         # but it's not explicitly displayed again, as the static list above covers it.
         current_build_info = matching_meta["build_information"] 
@@ -159,12 +301,34 @@ if selected_model and selected_sop_display_string: # This is now just "SOP1", "S
         st.stop()
 
 # Load connector data from the determined file using the cached function
-if target_filename:
-    connectors_data = load_specific_connector_data(target_filename)
-    if not connectors_data: # If loading failed or returned empty, connectors_data might be an empty list
+sorted_all_metadata = sorted(all_connectors_metadata, key=lambda x: (x["model"], sop_sort_key(x["sop"]), x["prog_id"]))
+all_program_sources = tuple(
+    (connector_store.resolve_program_path(meta), meta["sha256"], meta["model"], meta["sop"], meta["prog_id"])
+    for meta in sorted_all_metadata
+)
+sql_search = False # True when the search below runs against the SQLite database
+sql_programs = None
+if use_sql_backend and (search_all_programs or target_filename):
+    sql_programs = None if search_all_programs else ((matching_meta["model"], matching_meta["prog_id"]),)
+    try:
+        prepared = load_sql_program_facets(all_program_sources, sql_programs)
+        sql_search = True
+    except sqlite3.Error as e:
+        st.sidebar.warning(f"SQLite search backend unavailable ({e}); using the in-memory search.")
+
+if rerun_metrics is not None:
+    rerun_metrics.context.update(view=selected_view, backend="sqlite" if sql_search else "memory",
+                                 program=ALL_PROGRAMS_OPTION if search_all_programs else target_filename)
+if sql_search:
+    pass # Facets and results come from the database; no program file is loaded into memory
+elif search_all_programs:
+    prepared = load_all_programs(all_program_sources)
+elif target_filename:
+    prepared = load_prepared_program(target_filename, target_content_hash)
+    if not len(prepared): # If loading failed or returned empty, the prepared program has no connectors
         # Error messages are handled within load_specific_connector_data,
         # but we might want to stop or show a specific message here if it's critical.
-        # For now, if connectors_data is empty, the downstream logic will handle it (e.g., show "No connector data loaded").
+        # For now, if it is empty, the downstream logic will handle it (e.g., show "No connector data loaded").
         pass
 else:
     # Handle cases where a file couldn't be determined (target_filename is None)
@@ -174,218 +338,396 @@ else:
         st.info("Please select a Program (SOP) to load connector data.")
     else:
         st.info("Please select a Model to begin.")
-    # connectors_data remains an empty list, df will be empty.
+    # prepared stays None, the search below runs on an empty program.
+
+# --- Circuit trace view ---
+if selected_view == TRACE_VIEW:
+    st.header("Circuit Trace")
+    if search_all_programs or not target_filename:
+        st.info("Select a single program (Model and SOP) to trace its circuits.")
+        show_rerun_metrics(prepared)
+        st.stop()
+    graph = load_harness_graph(target_filename, target_content_hash)
+    trace_connector = st.selectbox("Connector", sorted(graph.connector_node_ids), key="trace_connector")
+    trace_cavity = st.selectbox("Cavity", [ALL_CAVITIES_OPTION] + graph.cavities_of(trace_connector), key="trace_cavity")
+
+    if trace_cavity == ALL_CAVITIES_OPTION:
+        st.subheader(f"What connects to {trace_connector}")
+        st.dataframe(graph.neighbors(trace_connector), hide_index=True)
+        # Where each wired cavity ends up once inline connectors are followed through
+        circuit_ends = []
+        for cavity in graph.cavities_of(trace_connector):
+            endpoints = graph.endpoints(trace_connector, cavity)
+            endpoints = endpoints[endpoints["step"] > 0]
+            if not endpoints.empty:
+                circuit_ends.append({"cavity": cavity, "endpoints": ", ".join(
+                    f"{connector}/{end_cavity}" for connector, end_cavity in zip(endpoints["connector"], endpoints["cavity"]))})
+        st.subheader("Circuit endpoints per cavity")
+        st.dataframe(circuit_ends, hide_index=True)
+    else:
+        trace = graph.trace(trace_connector, trace_cavity)
+        endpoints = trace[trace["endpoint"]]
+        st.subheader(f"Circuit from {trace_connector} cavity {trace_cavity}")
+        st.write("**Endpoints:** " + ", ".join(
+            f"{connector} cavity {end_cavity}" for connector, end_cavity in zip(endpoints["connector"], endpoints["cavity"])))
+        st.dataframe(trace, hide_index=True)
+    show_rerun_metrics(prepared)
+    st.stop()
 
-# --- DataFrame Creation and Initial Processing ---
-# This section now uses the dynamically loaded `connectors_data` (which is a list of connector dictionaries)
-if not connectors_data: # Check if the list of connectors itself is empty or not populated
-    st.warning(f"No connector data loaded. Please make a selection or check data files.")
-    df = pd.DataFrame()
-else:
-    df = pd.DataFrame(connectors_data) # connectors_data is already the list of connector objects
-    # Ensure image_urls column exists and handles missing lists/NaN values
-    if 'image_urls' not in df.columns:
-        df['image_urls'] = [[] for _ in range(len(df))] 
+# --- Part number lookup view ---
+if selected_view == LOOKUP_VIEW:
+    st.header("Part Number Lookup")
+    st.caption("Typo-tolerant search for a Tesla part number (e.g. 1660490-00-C) or connector part number "
+               "(e.g. K30M00121) across all programs, closest matches first.")
+    lookup_query = st.text_input("Part number", key="lookup_query")
+    max_edits = st.slider("Maximum wrong/missing/extra characters", 0, 3, 2, key="lookup_max_edits")
+    if lookup_query.strip():
+        part_number_index = load_part_number_index(all_program_sources)
+        with app_metrics.stage("part number search"):
+            lookup_results = part_number_index.search(lookup_query, max_edits)
+        st.write(f"### {len(lookup_results)} connectors found")
+        st.dataframe(lookup_results[["distance", "matched_field", "matched_value", "model", "sop", "prog_id", "name",
+                                     "tesla_part_number_str", "connector", "connector_body_color", "total_cavities"]],
+                     hide_index=True)
+    show_rerun_metrics(prepared)
+    st.stop()
+
+# --- Similar connectors view ---
+if selected_view == SIMILAR_VIEW:
+    st.header("Similar Connectors")
+    st.caption("Connectors of all programs whose pinout (cavity, wire color, wire size, terminal size) "
+               "most resembles a given one, even if only part of it is known.")
+    similarity_index = load_similarity_index(all_program_sources)
+    all_programs_df = similarity_index.df
+    query_source = st.radio("Query", [SIMILAR_FROM_CONNECTOR, SIMILAR_FROM_PINOUT], horizontal=True, key="similar_source")
+    query_features = set()
+    exclude_row = None
+    if query_source == SIMILAR_FROM_CONNECTOR:
+        if search_all_programs or not target_filename:
+            st.info("Select a single program (Model and SOP) to pick a connector from.")
+            show_rerun_metrics(prepared)
+            st.stop()
+        program_rows = (all_programs_df["model"] == matching_meta["model"]).to_numpy() & \
+                       (all_programs_df["prog_id"] == matching_meta["prog_id"]).to_numpy()
+        program_names = all_programs_df["name"][program_rows]
+        similar_to = st.selectbox("Connector", sorted(program_names.dropna().unique()), key="similar_connector")
+        exclude_row = int(all_programs_df.index.get_indexer([program_names[program_names == similar_to].index[0]])[0])
+        query_features = similarity_index.connector_features(exclude_row)
+    else:
+        known_cavities = st.number_input("Total cavities (0 if unknown)", 0, 200, 0, key="similar_total_cavities")
+        known_pinout = st.data_editor(
+            [{"cavity": "", "wire_color": "", "wire_size": "", "terminal_size": ""} for _ in range(4)],
+            num_rows="dynamic", key="similar_pinout",
+        )
+        query_features = connector_similarity.pinout_features(
+            [(row.get("cavity"), row.get("wire_color"), row.get("wire_size"), row.get("terminal_size")) for row in known_pinout],
+            known_cavities,
+        )
+    top_k = st.slider("Number of results", 5, 100, connector_similarity.TOP_K, key="similar_top_k")
+    if query_features:
+        with app_metrics.stage("similarity search"):
+            similar = similarity_index.search(query_features, top_k, exclude=exclude_row)
+        st.write(f"### {len(similar)} similar connectors ({similar.attrs['num_candidates']} candidates compared "
+                 f"out of {len(all_programs_df)})")
+        st.dataframe(similar[["similarity", "query_features_matched", "model", "sop", "prog_id", "name", "connector",
+                              "tesla_part_number_str", "connector_body_color", "total_cavities"]], hide_index=True)
     else:
-        df['image_urls'] = df['image_urls'].apply(lambda x: x if isinstance(x, list) else [])
+        st.info("Enter at least one known value.")
+    show_rerun_metrics(prepared)
+    st.stop()
 
-# --- Precompute necessary columns ---
-if not df.empty:
-    df['pinout_table'] = df['pinout_table'].apply(lambda x: x if isinstance(x, list) else [])
+# --- Program diff view ---
+if selected_view == DIFF_VIEW:
+    st.header("Program Diff")
+    st.caption("Connectors added, removed and changed from one program to another, compared by per-connector "
+               "content hashes. Run `python connector_diff.py <old> <new>` for the same report on the command line.")
+    program_labels = [connector_diff.program_label(meta) for meta in sorted_all_metadata]
+    # Default: the selected program against the previous SOP of the same model
+    new_index = sorted_all_metadata.index(matching_meta) if target_filename else len(sorted_all_metadata) - 1
+    old_index = new_index - 1 if new_index > 0 and sorted_all_metadata[new_index - 1]["model"] == sorted_all_metadata[new_index]["model"] else new_index
+    diff_columns = st.columns(2)
+    old_label = diff_columns[0].selectbox("Old program", program_labels, index=old_index, key="diff_old")
+    new_label = diff_columns[1].selectbox("New program", program_labels, index=new_index, key="diff_new")
+    old_meta = sorted_all_metadata[program_labels.index(old_label)]
+    new_meta = sorted_all_metadata[program_labels.index(new_label)]
+    old_hashes = load_program_hashes(old_meta["filename"], old_meta["sha256"])
+    new_hashes = load_program_hashes(new_meta["filename"], new_meta["sha256"])
+    with app_metrics.stage("program diff"):
+        diff = connector_diff.diff_programs(old_hashes, new_hashes)
+
+    metric_columns = st.columns(4)
+    metric_columns[0].metric("Added", len(diff["added"]))
+    metric_columns[1].metric("Removed", len(diff["removed"]))
+    metric_columns[2].metric("Changed", len(diff["changed"]))
+    metric_columns[3].metric("Unchanged", diff["unchanged"])
+
+    def connector_rows(hashes, names):
+        return [{"name": name, **{field: hashes[name]["fields"][field] for field in ("tesla_part_number", "connector", "color")},
+                 "cavities": len(hashes[name]["cavities"])} for name in names]
+
+    with st.expander(f"Added connectors ({len(diff['added'])})", expanded=False):
+        st.dataframe(connector_rows(new_hashes, diff["added"]), hide_index=True)
+    with st.expander(f"Removed connectors ({len(diff['removed'])})", expanded=False):
+        st.dataframe(connector_rows(old_hashes, diff["removed"]), hide_index=True)
+    st.subheader(f"Changed connectors ({len(diff['changed'])})")
+    st.dataframe([{
+        "name": change["name"],
+        "changed fields": ", ".join(f"{field}: {old} -> {new}" for field, (old, new) in change["fields"].items()),
+        "cavities added": ", ".join(change["cavities_added"]),
+        "cavities removed": ", ".join(change["cavities_removed"]),
+        "cavities changed": ", ".join(change["cavities_changed"]),
+    } for change in diff["changed"]], hide_index=True)
+
+    if diff["changed"]:
+        compared_name = st.selectbox("Compare pinout of", [change["name"] for change in diff["changed"]], key="diff_connector")
+        pinout_columns = st.columns(2)
+        for column, meta, label in ((pinout_columns[0], old_meta, old_label), (pinout_columns[1], new_meta, new_label)):
+            program = load_prepared_program(connector_store.resolve_program_path(meta), meta["sha256"])
+            connector_ids = (program.df["name"] == compared_name).to_numpy().nonzero()[0]
+            column.write(f"**{label}**")
+            column.dataframe(program.pinout(connector_ids[0]).drop(columns="connector_id")
+                             if len(connector_ids) else [], hide_index=True)
+    show_rerun_metrics(prepared)
+    st.stop()
 
-    # Optimized total_cavities calculation
-    df['total_cavities'] = df['pinout_table'].str.len()
-    df['num_connected_cavities'] = df['pinout_table'].apply(
-        lambda pinouts: len([p for p in pinouts if p.get('Terminal Manufacturer') != 'unused' and p.get('Terminal Manufacturer') is not None])
-    )
-    df['num_unconnected_cavities'] = df['pinout_table'].apply(
-        lambda pinouts: len([p for p in pinouts if p.get('Terminal Manufacturer') == 'unused'])
-    )
-    
-    df['manufacturer'] = df['connector'].astype(str).str.split().str[0].fillna('')
-    df['connector_part_number_full'] = df['connector'].fillna('')
-    df['tesla_part_number_str'] = df['tesla_part_number'].fillna('')
-    df['connector_body_color'] = df['color'].fillna('') # 'color' is the connector body color
-
-    # --- Prepare predefined lists for selectboxes ---
-    all_wire_colors = set()
-    for pinout_list in df['pinout_table']:
-        for pin in pinout_list:
-            wc = pin.get('Wire Color')
-            if wc and wc not in ['unused', '']:
-                all_wire_colors.add(wc)
-    
-    # Define color mapping (ensure it's defined before this or move definition up)
-    color_map = {
-        "BK": "Black", "BN": "Brown", "BU": "Blue", "GN": "Green", "GY": "Gray",
-        "OG": "Orange", "RD": "Red", "VT": "Violet (Purple)", "WH": "White", "YE": "Yellow"
-        # Add other wire-specific colors if necessary, or rely on "?"
-    }
-
-    PREDEFINED_WIRE_COLORS_DISPLAY = ["ANY"]
-    for color_abbr in sorted(list(all_wire_colors)):
-        full_name = color_map.get(color_abbr.upper()) # Get full name, or None if not found
-        if full_name:
-            PREDEFINED_WIRE_COLORS_DISPLAY.append(f"{color_abbr} - {full_name}")
-        else:
-            PREDEFINED_WIRE_COLORS_DISPLAY.append(f"{color_abbr}") # Append only abbreviation
-    PREDEFINED_WIRE_COLORS = PREDEFINED_WIRE_COLORS_DISPLAY # Use the display list
+# --- DataFrame and precomputed columns ---
+# All derived columns (cavity counts, manufacturer, upper-cased search columns) and the selectbox
+# vocabularies live on the cached prepared program (or connector_sql.ProgramFacets with the SQLite
+# backend), so nothing here is recomputed per rerun.
+if prepared is None:
+    prepared = connector_index.prepare_program(*connector_store.program_to_tables([]))
+if not len(prepared): # Check if the table of connectors itself is empty or not populated
+    st.warning(f"No connector data loaded. Please make a selection or check data files.")
 
-    all_connector_body_colors = sorted(list(set(c for c in df['connector_body_color'].unique() if c)))
-    
-    # Color map is already defined above for wire colors, ensure it's comprehensive enough
-    # or that the PREDEFINED_CONNECTOR_BODY_COLORS section reuses/extends it if needed.
-    # For this change, we assume the existing color_map is sufficient or already placed correctly.
-
-    # Create display strings for connector body colors
-    PREDEFINED_CONNECTOR_BODY_COLORS_DISPLAY = ["ANY"]
-    for color_abbr in all_connector_body_colors:
-        full_name = color_map.get(color_abbr.upper()) # Get full name, or None if not found
-        if full_name:
-            PREDEFINED_CONNECTOR_BODY_COLORS_DISPLAY.append(f"{color_abbr} - {full_name}")
-        else:
-            PREDEFINED_CONNECTOR_BODY_COLORS_DISPLAY.append(f"{color_abbr}") # Append only abbreviation
-    
-    # Keep the original list for filtering if needed, or adjust filter logic
-    # For now, the selectbox will use the display list. The filter logic will need adjustment.
-    PREDEFINED_CONNECTOR_BODY_COLORS = PREDEFINED_CONNECTOR_BODY_COLORS_DISPLAY # Use the display list for the selectbox
-
-else: # Handle empty DataFrame case for sliders and selectboxes
-    df['total_cavities'] = pd.Series(dtype='int')
-    df['num_connected_cavities'] = pd.Series(dtype='int')
-    df['num_unconnected_cavities'] = pd.Series(dtype='int')
-    df['manufacturer'] = pd.Series(dtype='str')
-    df['connector_part_number_full'] = pd.Series(dtype='str')
-    df['tesla_part_number_str'] = pd.Series(dtype='str')
-    df['connector_body_color'] = pd.Series(dtype='str')
-    df['image_urls'] = pd.Series(dtype=object) # Ensure schema for empty df
-    PREDEFINED_WIRE_COLORS = ["ANY"] # This will be ["ANY", "ABR - Full Name", ...]
-    PREDEFINED_CONNECTOR_BODY_COLORS = ["ANY"] # This will be a list of "ABR - Full Name" or just ["ANY"]
-
-# --- Helper function for counting specific wires ---
-def count_specific_wires(pinout_list, color_to_count):
-    if not pinout_list: return 0
-    count = 0
-    for p in pinout_list:
-        if p.get('Wire Color') == color_to_count:
-            count += 1
-    return count
-# --- End Helper function ---
+PREDEFINED_WIRE_COLORS = prepared.wire_color_options # ["ANY", "ABR - Full Name", ...]
+PREDEFINED_CONNECTOR_BODY_COLORS = prepared.body_color_options
 
 # --- Sidebar filters ---
+# Option labels and the captions under the cavity sliders carry live facet counts (connector_index.facet_counts):
+# each facet counts the connectors matching every *other* filter. The counts are only added by format_func;
+# the widgets take and return the plain options ("BK - Black"), so a selection survives changing counts.
+def with_facet_count(option, count):
+    # "BK - Black" -> "BK - Black (12)"
+    return f"{option} ({count})"
+
+def restore_facet_selection(key, options, multiple=False):
+    # Selection of a keyed selectbox/multiselect, dropping options that are gone (e.g. after switching programs)
+    if key not in st.session_state:
+        return [] if multiple else options[0]
+    if multiple:
+        selection = [option for option in st.session_state[key] if option in options]
+    else:
+        selection = st.session_state[key] if st.session_state[key] in options else options[0]
+    st.session_state[key] = selection
+    return selection
+
+def compute_facet_counts(filters):
+    with app_metrics.stage("facet counts"):
+        if sql_search:
+            return connector_sql.query_facet_counts(filters, sql_programs)
+        return connector_index.facet_counts(prepared, filters)
+
+def distribution_caption(counts, low, high, max_value):
+    # "`▁▃█▅▂` 120 of 480 in range": the connectors per value 0..max_value (binned to SPARKLINE_WIDTH), and
+    # those in the slider range. The SQLite backend's counts stop at the largest value that occurs.
+    counts = list(counts) + [0] * (max_value + 1 - len(counts))
+    step = max(1, -(-len(counts) // SPARKLINE_WIDTH))
+    bins = [sum(counts[i:i + step]) for i in range(0, len(counts), step)]
+    peak = max(bins, default=0)
+    levels = len(SPARKLINE_BLOCKS) - 1
+    sparkline = "".join(SPARKLINE_BLOCKS[-(-count * levels // peak) if peak else 0] for count in bins)
+    return f"`{sparkline}` {sum(counts[low:high + 1])} of {sum(counts)} in range"
+
 st.sidebar.header("Connector Search Filters")
 
 # Slider for Total Cavities
-max_total_cav = int(df.total_cavities.max()) if not df.total_cavities.empty else 0
+max_total_cav = prepared.max_total_cavities
 min_total_cav_filter, max_total_cav_filter = st.sidebar.slider(
     "Total number of cavities", 
     0, 
     max_total_cav, 
     (0, max_total_cav)
 )
+total_cav_distribution = st.sidebar.empty() # Filled once every filter is known
 
 # Slider for Connected Cavities
-max_conn_cav = int(df.num_connected_cavities.max()) if not df.num_connected_cavities.empty else 0
+max_conn_cav = prepared.max_connected_cavities
 min_conn_cav_filter, max_conn_cav_filter = st.sidebar.slider(
     "Number of connected cavities",
     0,
     max_conn_cav, # Use max_total_cav here as connected can be up to total
     (0, max_conn_cav) # Default to full range
 )
+conn_cav_distribution = st.sidebar.empty()
 
 # Slider for Unconnected Cavities
-max_unconn_cav = int(df.num_unconnected_cavities.max()) if not df.num_unconnected_cavities.empty else 0
+max_unconn_cav = prepared.max_unconnected_cavities
 min_unconn_cav_filter, max_unconn_cav_filter = st.sidebar.slider(
     "Number of unconnected cavities",
     0,
     max_unconn_cav, # Use max_total_cav here as unconnected can be up to total
     (0, max_unconn_cav) # Default to full range
 )
+unconn_cav_distribution = st.sidebar.empty()
+
+# Slider for the largest wire of a connector (e.g. >= 2.5 mm² for power), over the sizes that occur
+wire_size_stops = prepared.max_wire_sizes
+min_wire_size_filter, max_wire_size_filter = st.sidebar.select_slider(
+    "Largest wire size (mm²)",
+    wire_size_stops,
+    (wire_size_stops[0], wire_size_stops[-1]),
+    format_func=lambda size: f"{size:g}"
+)
 
 tesla_pn_filter = st.sidebar.text_input("Tesla Part Number (contains, case-insensitive)")
 combined_manuf_connector_pn_filter = st.sidebar.text_input("Manuf. / Connector P/N (contains, case-insensitive)")
 
-
-selected_body_color_filter_display = st.sidebar.selectbox("Connector Body Color", PREDEFINED_CONNECTOR_BODY_COLORS)
+# Drawn after the wire colors below, as its counts depend on them; its selection is already known
+body_color_slot = st.sidebar.container()
+selected_body_color_filter_display = restore_facet_selection("body_color_filter", PREDEFINED_CONNECTOR_BODY_COLORS)
 
 # "Wire in Specific Cavity" section removed
 
-st.sidebar.markdown("---")
-st.sidebar.subheader("Count of Specific Wire Color 1")
-count_wire_color_to_filter_1 = st.sidebar.selectbox(
-    "Wire Color (for count 1)", 
-    PREDEFINED_WIRE_COLORS, 
-    key="count_wire_color_1"
-)
-min_count_filter_1, max_count_filter_1 = st.sidebar.slider(
-    "Quantity range for wire color 1",
-    0,
-    max_total_cav, 
-    (0, max_total_cav),
-    key="count_wire_color_slider_1"
-)
+filters = {
+    "total_cavities": (min_total_cav_filter, max_total_cav_filter),
+    "num_connected_cavities": (min_conn_cav_filter, max_conn_cav_filter),
+    "num_unconnected_cavities": (min_unconn_cav_filter, max_unconn_cav_filter),
+    "max_wire_size": (min_wire_size_filter, max_wire_size_filter),
+    "tesla_part_number": tesla_pn_filter,
+    "manufacturer_or_connector": combined_manuf_connector_pn_filter,
+    # Extract the abbreviation from the display string "ABR - Full Name"
+    "body_color": connector_index.color_from_display_option(selected_body_color_filter_display),
+    "wire_color_counts": [],
+}
+# The wire color facet leaves out the color counts, so these counts hold for the multiselect below
+facet_counts = compute_facet_counts(filters) if len(prepared) else None
 
 st.sidebar.markdown("---")
-st.sidebar.subheader("Count of Specific Wire Color 2")
-count_wire_color_to_filter_2 = st.sidebar.selectbox(
-    "Wire Color (for count 2)", 
-    PREDEFINED_WIRE_COLORS, 
-    key="count_wire_color_2"
+st.sidebar.subheader("Count of Specific Wire Colors")
+# Any number of colors; each selected color gets its own quantity range
+restore_facet_selection("count_wire_colors", PREDEFINED_WIRE_COLORS[1:], multiple=True)
+selected_count_wire_colors_display = st.sidebar.multiselect(
+    "Wire Colors (to count)",
+    PREDEFINED_WIRE_COLORS[1:], # No "ANY" entry: an empty selection means no color-count filter
+    format_func=lambda option: with_facet_count(option, facet_counts["wire_color"].get(
+        connector_index.color_from_display_option(option), 0)) if facet_counts else option,
+    key="count_wire_colors",
+    help="Counts: connectors with at least one wire of the color, under the other filters."
 )
-min_count_filter_2, max_count_filter_2 = st.sidebar.slider(
-    "Quantity range for wire color 2",
-    0,
-    max_total_cav,
-    (0, max_total_cav),
-    key="count_wire_color_slider_2"
+count_wire_color_filters = []
+for wire_color_display in selected_count_wire_colors_display:
+    min_count_filter, max_count_filter = st.sidebar.slider(
+        f"Quantity range for wire color {wire_color_display}",
+        0,
+        max_total_cav,
+        (0, max_total_cav),
+        key=f"count_wire_color_slider_{wire_color_display}"
+    )
+    count_wire_color_filters.append((wire_color_display, min_count_filter, max_count_filter))
+
+wire_color_counts = []
+for wire_color_display, min_count, max_count in count_wire_color_filters:
+    wire_color_abbr = connector_index.color_from_display_option(wire_color_display)
+    if wire_color_abbr:
+        wire_color_counts.append((wire_color_abbr, min_count, max_count))
+if wire_color_counts:
+    filters["wire_color_counts"] = wire_color_counts
+    facet_counts = compute_facet_counts(filters) if len(prepared) else None
+
+def body_color_label(option):
+    body_color = connector_index.color_from_display_option(option)
+    return with_facet_count(option, facet_counts["body_color"].get(body_color, 0) if body_color
+                            else facet_counts["body_color_total"])
+
+selected_body_color_filter_display = body_color_slot.selectbox(
+    "Connector Body Color",
+    PREDEFINED_CONNECTOR_BODY_COLORS,
+    format_func=body_color_label if facet_counts else str,
+    key="body_color_filter",
+    help="Counts: connectors of each body color under the other filters."
 )
+filters["body_color"] = connector_index.color_from_display_option(selected_body_color_filter_display)
 
-# --- Apply filters ---
-if not df.empty:
-    mask = pd.Series([True] * len(df))
-
-    mask &= (df.total_cavities.between(min_total_cav_filter, max_total_cav_filter))
-    mask &= (df.num_connected_cavities.between(min_conn_cav_filter, max_conn_cav_filter))
-    mask &= (df.num_unconnected_cavities.between(min_unconn_cav_filter, max_unconn_cav_filter))
-
-    if tesla_pn_filter:
-        mask &= df.tesla_part_number_str.str.upper().str.contains(tesla_pn_filter.upper())
-
-    if combined_manuf_connector_pn_filter:
-        search_term_upper = combined_manuf_connector_pn_filter.upper()
-        mask &= (
-            df.manufacturer.str.upper().str.contains(search_term_upper) | 
-            df.connector_part_number_full.str.upper().str.contains(search_term_upper)
-        )
-
-    if selected_body_color_filter_display != "ANY":
-        # Extract the abbreviation from the display string "ABR - Full Name"
-        selected_body_color_abbr = selected_body_color_filter_display.split(" - ")[0]
-        mask &= (df.connector_body_color == selected_body_color_abbr)
-
-    # "Wire in Specific Cavity" filter logic removed
-
-    # Filter for Count of Specific Wire Color 1
-    if count_wire_color_to_filter_1 != "ANY":
-        selected_wire_color_abbr_1 = count_wire_color_to_filter_1.split(" - ")[0]
-        actual_counts_1 = df['pinout_table'].apply(lambda pts: count_specific_wires(pts, selected_wire_color_abbr_1))
-        mask &= (actual_counts_1 >= min_count_filter_1) & (actual_counts_1 <= max_count_filter_1)
+if facet_counts:
+    for distribution, name, low, high, max_value in (
+        (total_cav_distribution, "total_cavities", min_total_cav_filter, max_total_cav_filter, max_total_cav),
+        (conn_cav_distribution, "num_connected_cavities", min_conn_cav_filter, max_conn_cav_filter, max_conn_cav),
+        (unconn_cav_distribution, "num_unconnected_cavities", min_unconn_cav_filter, max_unconn_cav_filter, max_unconn_cav),
+    ):
+        distribution.caption(distribution_caption(facet_counts[name], low, high, max_value))
 
-    # Filter for Count of Specific Wire Color 2
-    if count_wire_color_to_filter_2 != "ANY":
-        selected_wire_color_abbr_2 = count_wire_color_to_filter_2.split(" - ")[0]
-        actual_counts_2 = df['pinout_table'].apply(lambda pts: count_specific_wires(pts, selected_wire_color_abbr_2))
-        mask &= (actual_counts_2 >= min_count_filter_2) & (actual_counts_2 <= max_count_filter_2)
-    
-    filtered_df = df[mask]
+# --- Apply filters ---
+result_source = None # "hit", "narrowed" or "miss" when the result cache answered the search
+if len(prepared):
+    if sql_search:
+        with app_metrics.stage("filter"):
+            filtered_df = connector_sql.query_connectors(filters, sql_programs)
+    else:
+        # Keyed by content hash(es), so sessions on the same program share results and a changed file misses
+        program_cache_key = all_program_sources if search_all_programs else target_content_hash
+        with app_metrics.stage("filter"):
+            result_rows, result_source = load_result_cache().rows(program_cache_key, prepared, filters)
+            filtered_df = prepared.df.iloc[result_rows]
+elif sql_search:
+    filtered_df = connector_sql.query_connectors({}, sql_programs) # Empty result with the usual columns
 else:
-    filtered_df = df
+    filtered_df = prepared.df
 
 # --- Show results ---
+app_metrics.start_stage("render results") # Images included; they are also timed on their own
 st.header("Connector Search Results")
 st.write(f"### {len(filtered_df)} connectors found")
+if search_all_programs and not filtered_df.empty:
+    # Rows are already in program order, so the cards below come grouped the same way
+    matches_per_program = filtered_df.groupby(list(connector_store.PROGRAM_KEY_COLUMNS), observed=True, sort=False).size()
+    st.dataframe(matches_per_program.reset_index(name="connectors"), hide_index=True)
+results_layout = st.radio("Show results as", [CARDS_LAYOUT, TABLE_LAYOUT], horizontal=True, key="results_layout",
+                          help="Table shows every match in one sortable table; select a row to see its pinout.")
+
+if not filtered_df.empty and results_layout == TABLE_LAYOUT:
+    # First image of each connector: the cached thumbnail inline where there is one, else the source image,
+    # which the grid only loads for rows scrolled into view
+    results_table = connector_index.results_table(filtered_df, icon_uri=load_image_cache().icon_data_uri,
+                                                  icon_rows=TABLE_ICON_ROWS, all_programs=search_all_programs)
+    table_event = st.dataframe(
+        results_table,
+        column_config={
+            "name": st.column_config.TextColumn("Name", pinned=True),
+            "image": st.column_config.ImageColumn("Image", width="small"),
+            "connector": "Connector",
+            "tesla_part_number_str": "Tesla Part #",
+            "manufacturer": "Manufacturer",
+            "connector_body_color": "Body Color",
+            "total_cavities": st.column_config.NumberColumn("Total Cavities", format="%d"),
+            "num_connected_cavities": st.column_config.NumberColumn("Connected", format="%d"),
+            "num_unconnected_cavities": st.column_config.NumberColumn("Unconnected", format="%d"),
+            "max_wire_size": st.column_config.NumberColumn("Largest Wire (mm²)", format="%.2f"),
+            "url": st.column_config.LinkColumn("Page", display_text="Open"),
+        },
+        hide_index=True, on_select="rerun", selection_mode="single-row", key="results_table",
+    )
+    selected_rows = table_event.selection.rows
+    if selected_rows:
+        # Selection positions refer to the rows as passed in, whatever the client-side sort order
+        row = filtered_df.iloc[selected_rows[0]]
+        program_label = f" ({row['model']} {row['sop']}, {row['prog_id']})" if search_all_programs else ""
+        st.subheader(f"Pinout of {row['name']}{program_label}")
+        if sql_search:
+            pinout = connector_sql.query_cavities(row["connector_id"])
+        else:
+            pinout = prepared.pinout(row["connector_id"])
+        st.dataframe(pinout.drop(columns="connector_id"), hide_index=True)
+        image_urls = row.get('image_urls', [])
+        if image_urls:
+            img_display_cols = st.columns(min(len(image_urls), 2))
+            for i, img_url in enumerate(image_urls):
+                with img_display_cols[i % len(img_display_cols)]:
+                    show_cached_image(img_url, f"Image {i+1}")
+            load_image_cache().save_index()
+    else:
+        st.caption("Select a row to see its pinout.")
 
-if not filtered_df.empty:
+elif not filtered_df.empty:
     ITEMS_PER_PAGE = 10  # Number of items to display per page
 
     # Initialize page number in session state if it doesn't exist
@@ -427,7 +769,11 @@ if not filtered_df.empty:
     end_idx = start_idx + ITEMS_PER_PAGE
     paginated_df_view = filtered_df.iloc[start_idx:end_idx]
 
+    current_program = None
     for index, row in paginated_df_view.iterrows():
+        if search_all_programs and (row["model"], row["sop"], row["prog_id"]) != current_program:
+            current_program = (row["model"], row["sop"], row["prog_id"])
+            st.markdown(f"## {row['model']} {row['sop']} ({row['prog_id']})")
         st.subheader(row.get('name', 'N/A'))
         
         # Display textual details in two columns for better layout
@@ -446,24 +792,43 @@ if not filtered_df.empty:
         image_urls = row.get('image_urls', []) 
         if image_urls: 
             st.write("**Images:**")
+            # Thumbnails by default; full-size images are only loaded for the connectors they are asked for
+            show_full_size = st.toggle("Full-size images", key=f"full_size_images_{index}")
             num_img_display_cols = min(len(image_urls), 2) # Use at most 2 columns
             if num_img_display_cols > 0: # Ensure we have columns to create
                 img_display_cols = st.columns(num_img_display_cols)
                 for i, img_url in enumerate(image_urls):
                     with img_display_cols[i % num_img_display_cols]:
-                        st.image(img_url, caption=f"Image {i+1}", use_container_width=True)
+                        show_cached_image(img_url, f"Image {i+1}", show_full_size)
             else: # Fallback if somehow num_img_display_cols is 0 but image_urls is not empty (should not happen with min(len,2))
                  for i, img_url in enumerate(image_urls):
-                    st.image(img_url, caption=f"Image {i+1}", use_container_width=True)
+                    show_cached_image(img_url, f"Image {i+1}", show_full_size)
 
 
         st.markdown("---")
     
+    load_image_cache().save_index() # Remember what this page downloaded
+
     # --- Render pagination controls at the bottom ---
     render_pagination_controls(st.session_state.page_number, total_pages, "bottom")
 
 else:
     st.write("No connectors match the current filters.")
+app_metrics.end_stage("render results")
 
 st.sidebar.markdown("---")
 st.sidebar.info("Tip: Clear filters (refresh) or adjust ranges if you don't see expected results.")
+with st.sidebar.expander("Result cache", expanded=False):
+    cache_stats = load_result_cache().summary()
+    st.caption("Search results shared by all sessions of this server. Repeated searches are served from the cache; "
+               "tightened ones narrow a cached broader result instead of scanning the whole program.")
+    if result_source:
+        st.write(f"**This search:** {result_source}")
+    st.write(f"**Hit rate:** {cache_stats['hit_rate']:.0%} ({cache_stats['hits']} hits, {cache_stats['narrowed']} narrowed, "
+             f"{cache_stats['misses']} misses)")
+    st.write(f"**Entries:** {cache_stats['entries']} ({cache_stats['nbytes'] / 1024:.0f} KB of "
+             f"{result_cache.MAX_CACHE_BYTES / 2**20:.0f} MB, {cache_stats['evictions']} evicted)")
+    st.write(f"**Rows skipped:** {cache_stats['rows_skipped']:,} of {cache_stats['rows_skipped'] + cache_stats['rows_scanned']:,}")
+if rerun_metrics is not None:
+    rerun_metrics.context["result_source"] = result_source
+show_rerun_metrics(prepared, filtered_df)
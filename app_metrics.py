@@ -0,0 +1,145 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Opt-in: add ?debug=1 to the app URL for one session, or set CONNECTOR_APP_METRICS=1 for every session
+QUERY_PARAM = "debug"
+ENABLE_ENV_VAR = "CONNECTOR_APP_METRICS"
+LOG_PATH_ENV_VAR = "CONNECTOR_APP_METRICS_LOG"
+LOG_PATH = "app_metrics.jsonl" # One JSON line per instrumented rerun
+
+_local = threading.local() # Streamlit runs every session's script in its own thread
+_log_lock = threading.Lock()
+_totals_lock = threading.Lock()
+loader_totals = {} # loader name -> {"calls", "misses"}, over every instrumented rerun of this server process
+
+
+def is_enabled(query_params):
+    return os.environ.get(ENABLE_ENV_VAR) == "1" or query_params.get(QUERY_PARAM) == "1"
+
+
+def log_path():
+    return os.environ.get(LOG_PATH_ENV_VAR) or LOG_PATH
+
+
+# --- Per-rerun metrics ---
+class RerunMetrics:
+    def __init__(self, **context):
+        self.start = time.perf_counter()
+        self.timestamp = time.time()
+        self.context = context # e.g. session, view, program; added to the log record
+        self.stages = {} # name -> [seconds, calls], in the order stages first ran
+        self.loaders = {} # name -> {"calls", "misses", "seconds"}
+        self.memory = {} # name -> bytes
+        self.open_stages = {} # name -> start, see start_stage
+
+    def add_stage(self, name, seconds):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += seconds
+        stage[1] += 1
+
+    def loader(self, name):
+        return self.loaders.setdefault(name, {"calls": 0, "misses": 0, "seconds": 0.0})
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def record(self):
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.timestamp)),
+            **self.context,
+            "total_seconds": self.elapsed(),
+            "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.stages.items()},
+            "loaders": self.loaders,
+            "memory_bytes": self.memory,
+        }
+
+
+def start_rerun(enabled, **context):
+    # Call once at the top of the script; returns the rerun's metrics, or None when instrumentation is off
+    _local.metrics = RerunMetrics(**context) if enabled else None
+    return _local.metrics
+
+
+def current():
+    return getattr(_local, "metrics", None)
+
+
+@contextlib.contextmanager
+def stage(name):
+    # Times the block as a stage of the current rerun; repeated stages (e.g. one per image) add up
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, time.perf_counter() - start)
+
+
+def start_stage(name):
+    # For a stage spanning a long stretch of the script, where a with block would re-indent all of it; see end_stage
+    metrics = current()
+    if metrics is not None:
+        metrics.open_stages[name] = time.perf_counter()
+
+
+def end_stage(name):
+    metrics = current()
+    if metrics is not None and name in metrics.open_stages:
+        metrics.add_stage(name, time.perf_counter() - metrics.open_stages.pop(name))
+
+
+def instrumented(cache_decorator):
+    # Applies st.cache_data / st.cache_resource (with its arguments already given, or bare) and counts, per
+    # rerun, the calls of the cached function and how many of them ran its body, i.e. missed the cache
+    def decorate(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            metrics = current()
+            if metrics is not None:
+                metrics.loader(name)["misses"] += 1
+                with _totals_lock:
+                    loader_totals.setdefault(name, {"calls": 0, "misses": 0})["misses"] += 1
+            return func(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            metrics = current()
+            if metrics is None:
+                return cached(*args, **kwargs)
+            loader = metrics.loader(name)
+            loader["calls"] += 1
+            with _totals_lock:
+                loader_totals.setdefault(name, {"calls": 0, "misses": 0})["calls"] += 1
+            start = time.perf_counter()
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                loader["seconds"] += time.perf_counter() - start
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+def dataframe_bytes(df):
+    # Deep size (object columns included) of a DataFrame, 0 for None
+    return 0 if df is None else int(df.memory_usage(deep=True, index=True).sum())
+
+
+def write_log(record, path=None):
+    path = path or log_path()
+    line = json.dumps(record, default=str) + "\n"
+    with _log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
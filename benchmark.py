@@ -0,0 +1,348 @@
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import connector_index
+import connector_pages
+import connector_store
+import scrape_tesla_connectors
+
+BENCHMARK_VERSION = 1 # Bump when stages or their inputs change, so old results aren't compared with new ones
+SCALES = (1, 10, 100) # 1 is the bundled program files, larger scales are synthetic datasets built from them
+REPEATS = 5 # Runs per stage; the median is reported
+STAGE_BUDGET = 10 # Seconds; a stage stops repeating once its runs add up to this (it always runs once)
+PARSE_PAGES = 200 # Connector pages parsed per dataset
+RANDOM_SEED = 1 # Fixed, so synthetic datasets and page samples are the same in every run
+MAX_PINOUT_WIDENING = 1.0 # Synthetic connector variants get up to this share of extra cavities (+50% on average)
+REGRESSION_THRESHOLD = 1.25 # --baseline flags stages whose median got slower than this ratio
+SYNTHETIC_MARKER = "synthetic.json"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stage(func, repeats=REPEATS, budget=STAGE_BUDGET):
+    # Timings of func() runs (at least one, at most `repeats`, fewer once they add up to `budget` seconds)
+    # and the result of the last run
+    timings = []
+    result = None
+    while len(timings) < repeats and (not timings or sum(timings) < budget):
+        gc.collect() # Don't bill garbage left by an earlier stage to this one
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+# --- Synthetic datasets ---
+# A dataset `scale` times the bundled one: every program is copied round(sqrt(scale)) times and every copy
+# holds scale / copies times its connectors. The first instance of each connector is the original, the
+# others are variants with changed part numbers and wider pinouts, so searches keep realistic selectivity
+# while there are more programs, more connectors and more cavities per connector than in the real data.
+def synthetic_factors(scale):
+    program_copies = max(1, int(round(scale ** 0.5)))
+    return program_copies, scale / program_copies
+
+
+def _vary(value, rng):
+    # Same length and format, a couple of digits changed, e.g. "1067060-00-B" -> "1067960-04-B"
+    if not isinstance(value, str):
+        return value
+    chars = list(value)
+    digits = [i for i, char in enumerate(chars) if char.isdigit()]
+    for i in rng.sample(digits, min(2, len(digits))):
+        chars[i] = str(rng.randrange(10))
+    return "".join(chars)
+
+
+def synthetic_connector(connector, variant, rng):
+    if variant == 0:
+        return connector
+    synthetic = dict(connector)
+    name = connector.get("name") or "X"
+    synthetic["name"] = f"{name}_S{variant}"
+    url = connector.get("url") or ""
+    synthetic["url"] = url.rstrip("/") + f"_s{variant}/"
+    synthetic["tesla_part_number"] = _vary(connector.get("tesla_part_number"), rng)
+    synthetic["connector"] = _vary(connector.get("connector"), rng)
+    pinout_table = connector.get("pinout_table")
+    if isinstance(pinout_table, list) and pinout_table:
+        extra_rows = [dict(rng.choice(pinout_table)) for _ in range(rng.randint(0, int(len(pinout_table) * MAX_PINOUT_WIDENING)))]
+        for number, row in enumerate(extra_rows, len(pinout_table) + 1):
+            row["Cavity"] = str(number)
+        synthetic["pinout_table"] = pinout_table + extra_rows
+    return synthetic
+
+
+def write_synthetic_programs(program_metadata, scale, out_dir, seed=RANDOM_SEED):
+    # Program files of the synthetic dataset in out_dir; reused when a previous run wrote the same dataset
+    marker_path = os.path.join(out_dir, SYNTHETIC_MARKER)
+    marker = {"version": BENCHMARK_VERSION, "scale": scale, "seed": seed,
+              "sources": sorted(meta["sha256"] for meta in program_metadata)}
+    try:
+        with open(marker_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["marker"] == marker:
+            return [os.path.join(out_dir, filename) for filename in stored["files"]]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    program_copies, connector_factor = synthetic_factors(scale)
+    rng = random.Random(seed)
+    files = []
+    for meta in program_metadata:
+        with open(meta["filename"], "r", encoding="utf-8") as f:
+            data = json.load(f)
+        connectors = data.get("connectors") or []
+        num_connectors = int(round(len(connectors) * connector_factor))
+        for program_copy in range(program_copies):
+            prog_id = f"{data['prog_id']}-s{program_copy}"
+            synthetic = dict(data, prog_id=prog_id, connectors=[
+                synthetic_connector(connectors[i % len(connectors)], i // len(connectors), rng) for i in range(num_connectors)
+            ])
+            filename = f"connectors_{data['model']}_{prog_id}.json"
+            with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+                json.dump(synthetic, f, ensure_ascii=False)
+            files.append(filename)
+    with open(marker_path, "w", encoding="utf-8") as f:
+        json.dump({"marker": marker, "files": files}, f)
+    return [os.path.join(out_dir, filename) for filename in files]
+
+
+# --- Parser fixtures ---
+def archived_pages(archive_dir, limit=None):
+    # [(url, html)] of connector pages saved by the scraper's --archive (program index pages included)
+    archive = scrape_tesla_connectors.PageArchive(archive_dir)
+    try:
+        urls = list(archive.records)[:limit]
+        return [(url, scrape_tesla_connectors.decode_page(*archive.read(url))) for url in urls]
+    finally:
+        archive.close()
+
+
+# --- Stages ---
+def benchmark_filters(prepared):
+    # One representative setting per sidebar filter, taken from the data so every dataset gets a
+    # selective but non-empty search, plus all of them at once
+    df = prepared.df
+    def most_common(values):
+        values = values[values != ""]
+        return values.value_counts().index[0] if len(values) else ""
+    total = df["total_cavities"]
+    wire_colors = prepared.cavities["wire_color"].astype(object)
+    common_wire_colors = wire_colors[wire_colors.isin(prepared.wire_colors)].value_counts().index[:2]
+    filters = {
+        "total_cavities": {"total_cavities": (int(total.quantile(0.25)), int(total.quantile(0.75)))},
+        "num_connected_cavities": {"num_connected_cavities": (1, int(df["num_connected_cavities"].quantile(0.75)))},
+        "num_unconnected_cavities": {"num_unconnected_cavities": (1, prepared.max_unconnected_cavities)},
+        "max_wire_size": {"max_wire_size": (float(df["max_wire_size"].quantile(0.5)), prepared.largest_wire_size)},
+        "tesla_part_number": {"tesla_part_number": most_common(df["tesla_part_number_upper"].str[:4])},
+        "manufacturer_or_connector": {"manufacturer_or_connector": most_common(df["manufacturer_upper"])},
+        "body_color": {"body_color": most_common(df["connector_body_color"])},
+        "wire_color_counts": {"wire_color_counts": [(color, 1, prepared.max_total_cavities) for color in common_wire_colors]},
+    }
+    filters["combined"] = {key: value for single in filters.values() for key, value in single.items()}
+    return filters
+
+
+def load_and_build(paths, parse_sample, rng):
+    # One pass over the program files, as the app's all-programs load does it. JSON parsing and table
+    # construction are timed separately per file, and each file's dicts are dropped before the next one,
+    # so large datasets only ever hold the tables. The first pass also draws the connector pages the parse
+    # stage renders (reservoir sample, so every connector is equally likely).
+    timings = {"json_load": 0.0, "dataframe_build": 0.0}
+    programs = []
+    seen = 0
+    for path in paths:
+        start = time.perf_counter()
+        data = connector_store.read_json_file(path) # The app's decoder (orjson when installed)
+        timings["json_load"] += time.perf_counter() - start
+        start = time.perf_counter()
+        connectors_df, cavities_df = connector_store.program_to_tables(data.get("connectors", []))
+        timings["dataframe_build"] += time.perf_counter() - start
+        programs.append(({key: data[key] for key in connector_store.PROGRAM_KEY_COLUMNS}, connectors_df, cavities_df))
+        if parse_sample is not None:
+            for connector in data.get("connectors") or []:
+                if len(parse_sample) < PARSE_PAGES:
+                    parse_sample.append(connector)
+                elif rng.randrange(seen + 1) < PARSE_PAGES:
+                    parse_sample[rng.randrange(PARSE_PAGES)] = connector
+                seen += 1
+        del data
+    start = time.perf_counter()
+    tables = connector_store.concat_program_tables(programs)
+    timings["dataframe_build"] += time.perf_counter() - start
+    return timings, tables
+
+
+def run_dataset(name, scale, paths, repeats=REPEATS, budget=STAGE_BUDGET, seed=RANDOM_SEED, log=print):
+    results = []
+    def record(stage, timings, items, unit):
+        result = {"dataset": name, "scale": scale, "stage": stage, "median": statistics.median(timings),
+                  "min": min(timings), "runs": len(timings), "items": int(items), "unit": unit}
+        results.append(result)
+        log(format_result(result))
+
+    # JSON load + DataFrame construction: whole passes, repeated like any other stage
+    pass_timings = []
+    parse_sample = []
+    rng = random.Random(seed)
+    tables = None
+    while len(pass_timings) < repeats and (not pass_timings or sum(sum(t.values()) for t in pass_timings) < budget):
+        tables = None # Release the previous pass's tables first
+        gc.collect()
+        timings, tables = load_and_build(paths, parse_sample if not pass_timings else None, rng)
+        pass_timings.append(timings)
+    connectors_df, cavities_df = tables
+    record("json_load", [t["json_load"] for t in pass_timings], len(paths), "files")
+    record("dataframe_build", [t["dataframe_build"] for t in pass_timings], len(connectors_df), "connectors")
+
+    timings, prepared = time_stage(lambda: connector_index.prepare_program(connectors_df, cavities_df), repeats, budget)
+    record("derive", timings, len(cavities_df), "cavities")
+    del tables, connectors_df, cavities_df
+
+    filter_settings = benchmark_filters(prepared)
+    for filter_name, filters in filter_settings.items():
+        # Filtering as the app does it: the mask, then the matching rows of the table
+        timings, matches = time_stage(
+            lambda: prepared.df.iloc[np.flatnonzero(connector_index.compute_filter_mask(prepared, filters))], repeats, budget)
+        record(f"filter:{filter_name}", timings, len(matches), "matches")
+
+    # The sidebar's live counts, computed on every rerun, under every filter at once
+    timings, counts = time_stage(lambda: connector_index.facet_counts(prepared, filter_settings["combined"]), repeats, budget)
+    record("facet_counts", timings, counts["matches"], "matches")
+
+    pages = [(connector.get("url") or "", connector_pages.render_connector_html(connector)) for connector in parse_sample]
+    timings, _ = time_stage(lambda: [scrape_tesla_connectors.parse_connector_html(url, page) for url, page in pages], repeats, budget)
+    record("parse", timings, len(pages), "pages")
+    return results
+
+
+def run_archive(archive_dir, repeats=REPEATS, budget=STAGE_BUDGET, log=print):
+    pages = archived_pages(archive_dir, PARSE_PAGES)
+    timings, _ = time_stage(lambda: [scrape_tesla_connectors.parse_connector_html(url, page) for url, page in pages], repeats, budget)
+    result = {"dataset": "archive", "scale": 1, "stage": "parse", "median": statistics.median(timings), "min": min(timings),
+              "runs": len(timings), "items": len(pages), "unit": "pages"}
+    log(format_result(result))
+    return [result]
+
+
+# --- Reporting ---
+def format_result(result, baseline=None, threshold=REGRESSION_THRESHOLD):
+    line = (f"{result['dataset']:<14} {result['stage']:<34} {result['median'] * 1000:>11.2f} ms "
+            f"(min {result['min'] * 1000:.2f}, {result['runs']} runs)  {result['items']} {result['unit']}")
+    if baseline is not None:
+        ratio = result["median"] / baseline["median"] if baseline["median"] else float("inf")
+        line += f"  {ratio:.2f}x baseline" + ("  REGRESSION" if ratio > threshold else "")
+    return line
+
+
+def load_baseline(path):
+    # The last run recorded in a results file written by --output
+    with open(path, "r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    run = runs[-1]
+    if run.get("benchmark_version") != BENCHMARK_VERSION:
+        raise ValueError(f"{path} was written by benchmark version {run.get('benchmark_version')}, not {BENCHMARK_VERSION}")
+    return run
+
+
+def compare_with_baseline(results, baseline_run, threshold=REGRESSION_THRESHOLD):
+    # Report lines for every stage the baseline also measured, and the number of regressions among them
+    baseline = {(result["dataset"], result["stage"]): result for result in baseline_run["results"]}
+    lines = [f"Compared with {baseline_run.get('commit') or 'unknown commit'} ({baseline_run.get('timestamp')}):"]
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result["dataset"], result["stage"]))
+        if previous is None:
+            continue
+        lines.append(format_result(result, previous, threshold))
+        if previous["median"] and result["median"] / previous["median"] > threshold:
+            regressions += 1
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the load, derive, filter and parse stages on the bundled programs "
+                                                 "and on synthetic datasets scaled up from them.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES),
+                        help="Dataset sizes to run, as multiples of the bundled data (1 = the bundled program files).")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Runs per stage; the median is reported.")
+    parser.add_argument("--budget", type=float, default=STAGE_BUDGET,
+                        help="Seconds after which a stage stops repeating (it always runs once).")
+    parser.add_argument("--synthetic-dir", metavar="DIR",
+                        help="Keep the synthetic program files here and reuse them in later runs "
+                             "(default: a temporary directory, deleted afterwards).")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="Also time the parser on pages saved by the scraper's --archive.")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Append this run's results as one JSON line, to track them across commits.")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="Compare with the last run in a results file; exits with status 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown ratio of a stage's median that counts as a regression.")
+    args = parser.parse_args()
+
+    baseline_run = load_baseline(args.baseline) if args.baseline else None
+    program_metadata, _ = connector_store.refresh_manifest(write=False)
+    if not program_metadata:
+        parser.error(f"No program files match {connector_store.PROGRAM_FILE_PATTERN}")
+    synthetic_root = args.synthetic_dir or tempfile.mkdtemp(prefix="connector-benchmark-")
+
+    results = []
+    try:
+        for scale in args.scales:
+            if scale == 1:
+                name, paths = "bundled", [meta["filename"] for meta in program_metadata]
+            else:
+                name = f"synthetic-x{scale}"
+                program_copies, connector_factor = synthetic_factors(scale)
+                print(f"Preparing {name}: {program_copies} copies of every program, {connector_factor:.2f}x its connectors")
+                paths = write_synthetic_programs(program_metadata, scale, os.path.join(synthetic_root, name))
+            results += run_dataset(name, scale, paths, args.repeats, args.budget)
+        if args.archive:
+            results += run_archive(args.archive, args.repeats, args.budget)
+    finally:
+        if not args.synthetic_dir:
+            shutil.rmtree(synthetic_root, ignore_errors=True)
+
+    run = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+        print(f"Appended results to {args.output}")
+    if baseline_run is not None:
+        lines, regressions = compare_with_baseline(results, baseline_run, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} stages slower than {args.threshold:.2f}x the baseline")
+            sys.exit(1)
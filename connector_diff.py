@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import posixpath
+
+import connector_store
+
+# Per-program connector/cavity hashes, persisted next to the program files and keyed by their SHA-256
+HASH_DIR = os.path.join(connector_store.CONNECTORS_DIR, "hashes")
+HASH_VERSION = 1 # Bump when the normalization changes; older hash files are recomputed
+
+# Connector fields compared between programs. url is left out (it contains the prog_id) and images are
+# compared by file name, since the same image lives under a different path in every program.
+HEADER_FIELDS = ("tesla_part_number", "connector", "color", "image_files")
+
+
+def _hash(values):
+    return hashlib.blake2b(json.dumps(values, ensure_ascii=False).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _clean(value):
+    return None if value is None or value != value else str(value) # NaN != NaN
+
+
+def program_hashes(connectors_df, cavities_df):
+    # {connector name: {"fields": {...}, "header": hash, "pinout": hash, "cavities": {cavity key: hash}}}
+    # Cavity keys are the cavity label, with "#2", "#3", ... appended to repeated labels.
+    cavity_columns = list(connector_store.CAVITY_COLUMNS.values())
+    cavities_by_connector = {}
+    cavity_rows = zip(cavities_df["connector_id"].to_numpy(), *(cavities_df[column].astype(object).to_numpy() for column in cavity_columns))
+    for connector_id, *row in cavity_rows:
+        cavities = cavities_by_connector.setdefault(connector_id, {})
+        key = _clean(row[0]) or ""
+        occurrence = 1
+        while (key if occurrence == 1 else f"{key}#{occurrence}") in cavities:
+            occurrence += 1
+        cavities[key if occurrence == 1 else f"{key}#{occurrence}"] = _hash([_clean(value) for value in row])
+
+    hashes = {}
+    for connector_id, name, tesla_pn, connector, color, image_urls in zip(
+            connectors_df["connector_id"].to_numpy(), connectors_df["name"], connectors_df["tesla_part_number"],
+            connectors_df["connector"], connectors_df["color"], connectors_df["image_urls"]):
+        fields = {
+            "tesla_part_number": _clean(tesla_pn),
+            "connector": _clean(connector),
+            "color": _clean(color),
+            "image_files": [posixpath.basename(url) for url in image_urls] if isinstance(image_urls, list) else [],
+        }
+        cavities = cavities_by_connector.get(connector_id, {})
+        hashes[_clean(name) or f"#{connector_id}"] = {
+            "fields": fields,
+            "header": _hash([fields[field] for field in HEADER_FIELDS]),
+            "pinout": _hash(sorted(cavities.items())),
+            "cavities": cavities,
+        }
+    return hashes
+
+
+def hash_path_for(program_path, hash_dir=HASH_DIR):
+    return os.path.join(hash_dir, os.path.splitext(os.path.basename(program_path))[0] + ".json")
+
+
+def load_program_hashes(meta, hash_dir=HASH_DIR):
+    # Hashes for one manifest entry: read from hash_dir when they were computed from the current file,
+    # otherwise computed from the program tables and saved for the next diff
+    path = hash_path_for(meta["filename"], hash_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("version") == HASH_VERSION and stored.get("source_sha256") == meta["sha256"]:
+            return stored["connectors"]
+    except (OSError, ValueError):
+        pass
+
+    hashes = program_hashes(*connector_store.load_program_tables(connector_store.resolve_program_path(meta)))
+    try:
+        os.makedirs(hash_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": HASH_VERSION, "source_sha256": meta["sha256"], "source_file": os.path.basename(meta["filename"]),
+                       "connectors": hashes}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass # Read-only deployments just recompute them
+    return hashes
+
+
+# --- Diff ---
+def diff_programs(old_hashes, new_hashes):
+    # Linear in the number of connectors and cavities: every comparison is a dict lookup of two hashes.
+    # Returns {"added": [names], "removed": [names], "changed": [change dicts], "unchanged": count}; a change is
+    # {"name", "fields": {field: (old, new)}, "cavities_added": [...], "cavities_removed": [...], "cavities_changed": [...]}.
+    added = [name for name in new_hashes if name not in old_hashes]
+    removed = [name for name in old_hashes if name not in new_hashes]
+    changed = []
+    unchanged = 0
+    for name, new in new_hashes.items():
+        old = old_hashes.get(name)
+        if old is None:
+            continue
+        if old["header"] == new["header"] and old["pinout"] == new["pinout"]:
+            unchanged += 1
+            continue
+        change = {"name": name, "fields": {}, "cavities_added": [], "cavities_removed": [], "cavities_changed": []}
+        if old["header"] != new["header"]:
+            change["fields"] = {field: (old["fields"][field], new["fields"][field]) for field in HEADER_FIELDS
+                                if old["fields"][field] != new["fields"][field]}
+        if old["pinout"] != new["pinout"]:
+            old_cavities, new_cavities = old["cavities"], new["cavities"]
+            for cavity, cavity_hash in new_cavities.items():
+                if cavity not in old_cavities:
+                    change["cavities_added"].append(cavity)
+                elif old_cavities[cavity] != cavity_hash:
+                    change["cavities_changed"].append(cavity)
+            change["cavities_removed"] = [cavity for cavity in old_cavities if cavity not in new_cavities]
+        changed.append(change)
+    return {"added": sorted(added), "removed": sorted(removed), "changed": sorted(changed, key=lambda c: c["name"]),
+            "unchanged": unchanged}
+
+
+def program_label(meta):
+    return f"{meta['model']} {meta['sop']} ({meta['prog_id']})"
+
+
+def format_report(diff, old_label, new_label):
+    lines = [
+        f"{old_label} -> {new_label}: {len(diff['added'])} added, {len(diff['removed'])} removed, "
+        f"{len(diff['changed'])} changed, {diff['unchanged']} unchanged connectors",
+    ]
+    if diff["added"]:
+        lines += ["", "Added:", "  " + ", ".join(diff["added"])]
+    if diff["removed"]:
+        lines += ["", "Removed:", "  " + ", ".join(diff["removed"])]
+    if diff["changed"]:
+        lines += ["", "Changed:"]
+        for change in diff["changed"]:
+            lines.append(f"  {change['name']}")
+            for field, (old, new) in change["fields"].items():
+                lines.append(f"    {field}: {old} -> {new}")
+            for kind in ("added", "removed", "changed"):
+                cavities = change[f"cavities_{kind}"]
+                if cavities:
+                    lines.append(f"    cavities {kind}: {', '.join(cavities)}")
+    return lines
+
+
+def find_program(program_metadata, spec):
+    # spec: a prog_id ("prog-196") or "Model SOP" ("ModelY SOP4", "ModelY:SOP4")
+    parts = spec.replace(":", " ").split()
+    for meta in program_metadata:
+        if [meta["prog_id"]] == parts or [meta["model"], meta["sop"]] == parts:
+            return meta
+    return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report connectors added, removed and changed between two programs.")
+    parser.add_argument("old", help='Older program: prog_id (e.g. prog-196) or "Model SOP" (e.g. ModelY:SOP4)')
+    parser.add_argument("new", help="Newer program, same format")
+    parser.add_argument("--json", action="store_true", help="Print the diff as JSON instead of a text report.")
+    args = parser.parse_args()
+
+    program_metadata, _ = connector_store.refresh_manifest()
+    programs = []
+    for spec in (args.old, args.new):
+        meta = find_program(program_metadata, spec)
+        if meta is None:
+            parser.error(f"Unknown program {spec!r}; known: {', '.join(program_label(m) for m in program_metadata)}")
+        programs.append(meta)
+
+    diff = diff_programs(load_program_hashes(programs[0]), load_program_hashes(programs[1]))
+    if args.json:
+        print(json.dumps(diff, indent=2, ensure_ascii=False))
+    else:
+        print("\n".join(format_report(diff, program_label(programs[0]), program_label(programs[1]))))
@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+
+import connector_store
+
+# Abbreviations used for wire and connector body colors on service.tesla.com
+COLOR_NAMES = {
+    "BK": "Black", "BN": "Brown", "BU": "Blue", "GN": "Green", "GY": "Gray",
+    "OG": "Orange", "RD": "Red", "VT": "Violet (Purple)", "WH": "White", "YE": "Yellow"
+    # Add other wire-specific colors if necessary, or rely on the bare abbreviation
+}
+
+ANY_OPTION = "ANY"
+UNUSED_VALUE = "unused" # What the scraper writes into every field of a cavity without a terminal or wire
+# Fields of an unused cavity row; they are kept as missing values plus one bit in PreparedProgram.unused_bitmap
+UNUSED_FIELDS = tuple(column for column in connector_store.CAVITY_COLUMNS.values() if column != "cavity")
+CATEGORICAL_MAX_RATIO = 0.5 # String columns with at most this many distinct values per row are dictionary-coded
+
+
+def color_display_options(color_abbrs):
+    # ["ANY", "BK - Black", "BK/WH", ...] for the sidebar selectboxes
+    options = [ANY_OPTION]
+    for color_abbr in color_abbrs:
+        full_name = COLOR_NAMES.get(color_abbr.upper()) # Get full name, or None if not found
+        options.append(f"{color_abbr} - {full_name}" if full_name else color_abbr)
+    return options
+
+
+def color_from_display_option(option):
+    # Inverse of color_display_options: "BK - Black" -> "BK", "ANY" -> None
+    if not option or option == ANY_OPTION:
+        return None
+    return option.split(" - ")[0]
+
+
+def compact_strings(values):
+    # Dictionary-coded (categorical) when the values repeat enough to pay off, else unchanged. Categorical
+    # columns store every distinct string once plus a small integer code per row, and the .str methods run
+    # once per distinct value.
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(values.dtype):
+        return values
+    if values.nunique(dropna=False) <= len(values) * CATEGORICAL_MAX_RATIO:
+        return values.astype("category")
+    return values
+
+
+def map_strings(values, func):
+    # func(Series of distinct values) -> Series of results, evaluated once per distinct value instead of once
+    # per row (missing values are passed as None); the result is compacted like compact_strings
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    mapped = func(pd.Series(list(uniques) + [None], dtype=object)) # Code -1 (missing) picks the trailing None
+    mapped_codes, mapped_uniques = pd.factorize(mapped, use_na_sentinel=True)
+    result = pd.Categorical.from_codes(mapped_codes[codes], pd.Index(mapped_uniques, dtype=object))
+    if len(mapped_uniques) > len(codes) * CATEGORICAL_MAX_RATIO:
+        result = np.asarray(result, dtype=object)
+    return pd.Series(result, index=pd.Series(values).index)
+
+
+# --- Prepared program ---
+# Everything the search UI needs that only depends on the program file, computed once per file
+# (the app caches it by content hash). It is shared between reruns and sessions, so treat it as read-only.
+# Kept compact so several programs (or the combined all-programs table) stay resident in a small container:
+#   - repetitive string columns (colors, manufacturers, part numbers, ...) are categorical, see compact_strings
+#   - an unused cavity is one bit in unused_bitmap; its nine "unused" fields are missing values in `cavities`,
+#     so "unused" is no category anywhere. cavities_with_unused() restores them for display.
+class PreparedProgram:
+    def __init__(self, connectors_df, cavities_df):
+        df = connectors_df.reset_index(drop=True)
+        # connector_id is the row position in df, so per-connector counts are plain bincounts
+        self.cavity_connector_ids = cavities_df["connector_id"].to_numpy()
+        # Connected / unconnected by the terminal manufacturer alone, as the app always counted them
+        terminal_manufacturer = cavities_df["terminal_manufacturer"]
+        is_unconnected_cavity = (terminal_manufacturer == UNUSED_VALUE).to_numpy()
+        is_connected_cavity = terminal_manufacturer.notna().to_numpy() & ~is_unconnected_cavity
+
+        # Storage only: a row with "unused" in every field becomes one bit
+        is_unused_cavity = np.ones(len(cavities_df), dtype=bool)
+        for column in UNUSED_FIELDS:
+            is_unused_cavity &= (cavities_df[column] == UNUSED_VALUE).to_numpy()
+        self.unused_bitmap = np.packbits(is_unused_cavity, bitorder="little")
+        cavities_df = cavities_df.copy()
+        for column in UNUSED_FIELDS:
+            values = pd.Categorical(cavities_df[column])
+            values[is_unused_cavity] = np.nan
+            cavities_df[column] = values.remove_unused_categories()
+        self.cavities = cavities_df
+
+        df["total_cavities"] = self._count_per_connector(None, len(df))
+        df["num_connected_cavities"] = self._count_per_connector(is_connected_cavity, len(df))
+        df["num_unconnected_cavities"] = self._count_per_connector(is_unconnected_cavity, len(df))
+        # Largest wire per connector in mm² (0 without any), from the wire sizes parsed at load time
+        wire_sizes = cavities_df["wire_size_mm2"].to_numpy(dtype=np.float32)
+        has_size = ~np.isnan(wire_sizes)
+        max_wire_size = np.zeros(len(df), dtype=np.float32)
+        np.maximum.at(max_wire_size, self.cavity_connector_ids[has_size], wire_sizes[has_size])
+        df["max_wire_size"] = max_wire_size
+
+        for column in ("name", "tesla_part_number", "connector", "color", "description"):
+            df[column] = compact_strings(df[column])
+        df["connector_part_number_full"] = map_strings(df["connector"], lambda values: values.fillna("").astype(str))
+        df["manufacturer"] = map_strings(df["connector_part_number_full"], lambda values: values.str.split().str[0].fillna(""))
+        df["tesla_part_number_str"] = map_strings(df["tesla_part_number"], lambda values: values.fillna("").astype(str))
+        df["connector_body_color"] = map_strings(df["color"], lambda values: values.fillna("").astype(str)) # 'color' is the connector body color
+
+        # Upper-cased copies so case-insensitive search doesn't re-upper whole columns on every rerun
+        df["tesla_part_number_upper"] = map_strings(df["tesla_part_number_str"], lambda values: values.str.upper())
+        df["manufacturer_upper"] = map_strings(df["manufacturer"], lambda values: values.str.upper())
+        df["connector_part_number_upper"] = map_strings(df["connector_part_number_full"], lambda values: values.str.upper())
+        self.df = df
+
+        # Facet vocabularies for the sidebar
+        self.wire_colors = sorted(set(wc for wc in cavities_df["wire_color"].dropna().unique() if wc != ""))
+        self.body_colors = sorted(set(c for c in df["connector_body_color"].unique() if c))
+        self.wire_color_options = color_display_options(self.wire_colors)
+        self.body_color_options = color_display_options(self.body_colors)
+        # Body color of every connector as a code into body_color_values, for the facet counts
+        self.body_color_codes, self.body_color_values = pd.factorize(df["connector_body_color"].astype(object))
+
+        # Connector x wire color count matrix, so color-count filters are plain column comparisons
+        wire_colors = pd.Categorical(cavities_df["wire_color"])
+        self.wire_color_index = {color: i for i, color in enumerate(wire_colors.categories)}
+        self.wire_color_counts = self._count_matrix(wire_colors.codes, len(wire_colors.categories), len(df))
+
+        self.max_total_cavities = int(df["total_cavities"].max()) if len(df) else 0
+        self.max_connected_cavities = int(df["num_connected_cavities"].max()) if len(df) else 0
+        self.max_unconnected_cavities = int(df["num_unconnected_cavities"].max()) if len(df) else 0
+        # Stops of the largest wire size slider: every value the column takes, and 0
+        self.max_wire_sizes = sorted(set(np.unique(max_wire_size).tolist()) | {0.0})
+        self.largest_wire_size = self.max_wire_sizes[-1]
+
+    def unused_cavities(self, rows=None):
+        # Boolean mask of unused cavities, for all rows of `cavities` or for the given row positions
+        if rows is None:
+            return np.unpackbits(self.unused_bitmap, count=len(self.cavity_connector_ids), bitorder="little").astype(bool)
+        rows = np.asarray(rows)
+        return ((self.unused_bitmap[rows >> 3] >> (rows & 7)) & 1).astype(bool)
+
+    def cavities_with_unused(self, rows=None, columns=None):
+        # Rows of the cavities table as they were loaded, with "unused" in every field of an unused cavity
+        rows = np.arange(len(self.cavities)) if rows is None else np.asarray(rows)
+        cavities = self.cavities.iloc[rows] if columns is None else self.cavities[list(columns)].iloc[rows]
+        is_unused = self.unused_cavities(rows)
+        if not is_unused.any():
+            return cavities
+        cavities = cavities.copy()
+        for column in UNUSED_FIELDS:
+            if column in cavities:
+                values = cavities[column].astype(object).to_numpy(copy=True)
+                values[is_unused] = UNUSED_VALUE
+                cavities[column] = pd.Categorical(values)
+        return cavities
+
+    def pinout(self, connector_id):
+        # Pinout table of one connector as scraped, for display (without the parsed numeric columns)
+        return self.cavities_with_unused(np.flatnonzero(self.cavity_connector_ids == connector_id),
+                                         ("connector_id",) + tuple(connector_store.CAVITY_COLUMNS.values()))
+
+    def __len__(self):
+        return len(self.df)
+
+    def _count_per_connector(self, cavity_mask, num_connectors):
+        connector_ids = self.cavity_connector_ids if cavity_mask is None else self.cavity_connector_ids[cavity_mask]
+        # Cavity counts per connector never come close to 2**31
+        return np.bincount(connector_ids, minlength=num_connectors).astype(np.int32)
+
+    def _count_matrix(self, codes, num_values, num_connectors):
+        # counts[connector_id, code] via one bincount over the flattened (connector, code) index
+        present = codes >= 0 # -1 marks missing values
+        flat_index = self.cavity_connector_ids[present].astype(np.int64) * num_values + codes[present]
+        counts = np.bincount(flat_index, minlength=num_connectors * num_values)
+        # Cavity counts per connector never come close to 65k
+        return counts.reshape(num_connectors, num_values).astype(np.uint16)
+
+    def count_specific_wires(self, color_to_count):
+        # Number of cavities per connector (aligned with df rows) carrying a wire of this color
+        column = self.wire_color_index.get(color_to_count)
+        if column is None:
+            return np.zeros(len(self.df), dtype=np.uint16)
+        return self.wire_color_counts[:, column]
+
+
+def prepare_program(connectors_df, cavities_df):
+    return PreparedProgram(connectors_df, cavities_df)
+
+
+# --- Filtering ---
+# Filters are a plain dict built from the sidebar widgets; missing keys / None values mean "no filter".
+#   total_cavities, num_connected_cavities, num_unconnected_cavities: (min, max) inclusive
+#   max_wire_size: (min, max) inclusive, the connector's largest wire in mm²
+#   tesla_part_number, manufacturer_or_connector: substring, case-insensitive, matched literally (as in connector_sql)
+#   body_color: color abbreviation
+#   wire_color_counts: list of (color abbreviation, min, max), any number of colors
+# With `rows` (row positions in prepared.df), only those rows are evaluated and the masks are aligned with them.
+RANGE_FILTER_COLUMNS = ("total_cavities", "num_connected_cavities", "num_unconnected_cavities", "max_wire_size")
+
+
+def filter_masks(prepared, filters, rows=None):
+    # {filter name: mask of the rows it keeps} for every filter that is set; the color counts are one mask
+    def column(name):
+        # Only the filtered columns are sliced when evaluating a subset of rows
+        return prepared.df[name] if rows is None else prepared.df[name].iloc[rows]
+
+    masks = {}
+    for name in RANGE_FILTER_COLUMNS:
+        bounds = filters.get(name)
+        if bounds is not None:
+            values = column(name).to_numpy()
+            masks[name] = (values >= bounds[0]) & (values <= bounds[1])
+
+    tesla_pn = filters.get("tesla_part_number")
+    if tesla_pn:
+        masks["tesla_part_number"] = column("tesla_part_number_upper").str.contains(tesla_pn.upper(), regex=False).to_numpy(dtype=bool)
+
+    manuf_or_connector = filters.get("manufacturer_or_connector")
+    if manuf_or_connector:
+        search_term_upper = manuf_or_connector.upper()
+        masks["manufacturer_or_connector"] = (
+            column("manufacturer_upper").str.contains(search_term_upper, regex=False).to_numpy(dtype=bool) |
+            column("connector_part_number_upper").str.contains(search_term_upper, regex=False).to_numpy(dtype=bool)
+        )
+
+    body_color = filters.get("body_color")
+    if body_color:
+        masks["body_color"] = (column("connector_body_color") == body_color).to_numpy()
+
+    for color, min_count, max_count in filters.get("wire_color_counts", []):
+        actual_counts = prepared.count_specific_wires(color)
+        if rows is not None:
+            actual_counts = actual_counts[rows]
+        color_mask = (actual_counts >= min_count) & (actual_counts <= max_count)
+        masks["wire_color_counts"] = masks["wire_color_counts"] & color_mask if "wire_color_counts" in masks else color_mask
+
+    return masks
+
+
+def compute_filter_mask(prepared, filters, rows=None):
+    mask = np.ones(len(prepared.df) if rows is None else len(rows), dtype=bool)
+    for filter_mask in filter_masks(prepared, filters, rows).values():
+        mask &= filter_mask
+    return mask
+
+
+# --- Facet counts ---
+# Live counts for the sidebar. A facet counts the connectors matching every *other* filter, so its numbers
+# say what picking another value of it would give: connectors per body color, and the distribution of each
+# cavity count behind its slider. Wire colors count, under the filters other than the wire color counts, the
+# connectors with at least one wire of each color.
+# Everything is a bincount or a column sum over boolean masks of the filters, each evaluated once.
+FACET_RANGE_COLUMNS = ( # (column, prepared program attribute with its maximum)
+    ("total_cavities", "max_total_cavities"),
+    ("num_connected_cavities", "max_connected_cavities"),
+    ("num_unconnected_cavities", "max_unconnected_cavities"),
+)
+
+
+def facet_counts(prepared, filters):
+    # {"matches": n, "body_color": {color: n}, "body_color_total": n, "wire_color": {color: n},
+    #  column: counts per value 0..max for each of FACET_RANGE_COLUMNS}
+    masks = filter_masks(prepared, filters)
+
+    def matching_all_but(excluded):
+        mask = np.ones(len(prepared.df), dtype=bool)
+        for name, filter_mask in masks.items():
+            if name != excluded:
+                mask &= filter_mask
+        return mask
+
+    results = matching_all_but(None)
+    counts = {"matches": int(results.sum())}
+    for name, max_attribute in FACET_RANGE_COLUMNS:
+        values = prepared.df[name].to_numpy()[matching_all_but(name)]
+        counts[name] = np.bincount(values, minlength=getattr(prepared, max_attribute) + 1)
+
+    body_color_mask = matching_all_but("body_color")
+    body_color_counts = np.bincount(prepared.body_color_codes[body_color_mask], minlength=len(prepared.body_color_values))
+    counts["body_color"] = dict(zip(prepared.body_color_values, body_color_counts.tolist()))
+    counts["body_color_total"] = int(body_color_mask.sum())
+
+    wire_color_mask = matching_all_but("wire_color_counts")
+    wire_color_counts = (prepared.wire_color_counts[wire_color_mask] > 0).sum(axis=0)
+    counts["wire_color"] = {color: int(wire_color_counts[i]) for color, i in prepared.wire_color_index.items()}
+    return counts
+
+
+# --- Results table ---
+RESULTS_TABLE_COLUMNS = (
+    "name", "image", "connector", "tesla_part_number_str", "manufacturer", "connector_body_color",
+    "total_cavities", "num_connected_cavities", "num_unconnected_cavities", "max_wire_size", "url",
+)
+
+
+def results_table(results_df, icon_uri=None, icon_rows=0, all_programs=False):
+    # One row per connector for the table layout, in the order of results_df and with RESULTS_TABLE_COLUMNS
+    # (after the program columns when searching all programs). "image" is the connector's first image:
+    # icon_uri(url) for the first icon_rows rows where it gives one, else the source image URL.
+    columns = (list(connector_store.PROGRAM_KEY_COLUMNS) if all_programs else []) + list(RESULTS_TABLE_COLUMNS)
+    table = results_df[[column for column in columns if column != "image"]].reset_index(drop=True)
+    first_images = [urls[0] if isinstance(urls, list) and urls else None for urls in results_df["image_urls"]]
+    table.insert(columns.index("image"), "image", [
+        ((icon_uri(url) if icon_uri else None) or url) if url and position < icon_rows else url
+        for position, url in enumerate(first_images)
+    ])
+    return table
@@ -0,0 +1,33 @@
+import html
+
+import connector_store
+
+# Connector records rendered back into site pages: the benchmark's parse stage times the scraper's parser on
+# them, and the scraper tests serve them from a local stub site (tests/stub_site.py)
+
+
+def render_connector_html(connector):
+    # A connector page with the service.tesla.com markup parse_connector_html reads
+    def text(value):
+        return html.escape(value) if isinstance(value, str) else ""
+    meta = "".join(
+        f'<div class="wrapper"><div class="label">{label}</div><div class="value">{text(connector.get(field))}</div></div>'
+        for label, field in (("Tesla Part Number", "tesla_part_number"), ("Connector", "connector"), ("Color", "color"))
+    )
+    image_urls = connector.get("image_urls") or []
+    images = "".join(f'<figure><img src="{text(url)}"></figure>' for url in image_urls)
+    if connector.get("description"):
+        images += f"<figure><figcaption>{text(connector['description'])}</figcaption></figure>"
+    table = ""
+    pinout_table = connector.get("pinout_table")
+    if isinstance(pinout_table, list):
+        headers = list(connector_store.CAVITY_COLUMNS)
+        rows = []
+        for pin in pinout_table:
+            if all(pin.get(header) == "unused" for header in headers[1:]):
+                rows.append(f'<tr><td>{text(pin.get(headers[0]))}</td><td colspan="{len(headers) - 1}">unused</td></tr>')
+            else:
+                rows.append("<tr>" + "".join(f"<td>{text(pin.get(header))}</td>" for header in headers) + "</tr>")
+        table = "<table><tr>" + "".join(f"<th>{header}</th>" for header in headers) + "</tr>" + "".join(rows) + "</table>"
+    return (f'<html><body><section class="tds-layout-item tds-layout-main"><h1>{text(connector.get("name"))}</h1>'
+            f'<div class="connector-meta">{meta}</div><div class="connector-images">{images}</div>{table}</section></body></html>')
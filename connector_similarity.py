@@ -0,0 +1,158 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+NUM_PERMUTATIONS = 126
+LSH_BANDS = 42 # 42 bands of 3 rows: pairs with Jaccard similarity above ~0.3 are likely to share a band
+MERSENNE_PRIME = (1 << 31) - 1
+RANDOM_SEED = 1 # Fixed, so signatures are reproducible between runs
+TOP_K = 20
+
+# Pinout attributes a signature is built from (cavities table columns)
+SIGNATURE_COLUMNS = ("cavity", "wire_color", "wire_size", "terminal_size")
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return str(value).strip().upper()
+
+
+def pinout_features(cavity_rows, total_cavities=None):
+    # cavity_rows: iterable of (cavity, wire_color, wire_size, terminal_size), blanks allowed for unknown values.
+    # Features are exact rows plus per-cavity and position-free partial facts, so a partially known pinout
+    # still overlaps with the full one. Position-free facts are numbered (BK#1, BK#2, ...) to keep counts.
+    features = set()
+    seen = {}
+    def add_counted(feature):
+        seen[feature] = seen.get(feature, 0) + 1
+        features.add(f"{feature}#{seen[feature]}")
+    for cavity, wire_color, wire_size, terminal_size in cavity_rows:
+        cavity, wire_color, wire_size, terminal_size = map(_clean, (cavity, wire_color, wire_size, terminal_size))
+        if cavity and wire_color and wire_size and terminal_size:
+            features.add(f"row:{cavity}|{wire_color}|{wire_size}|{terminal_size}")
+        if cavity:
+            for name, value in (("color", wire_color), ("size", wire_size), ("terminal", terminal_size)):
+                if value:
+                    features.add(f"cavity:{cavity}|{name}:{value}")
+        if wire_color and wire_size:
+            add_counted(f"wire:{wire_color}|{wire_size}")
+        if wire_color:
+            add_counted(f"color:{wire_color}")
+        if wire_size:
+            add_counted(f"size:{wire_size}")
+    if total_cavities:
+        features.add(f"cavities:{int(total_cavities)}")
+    return features
+
+
+def _feature_hashes(features):
+    # Stable across processes (unlike hash()), reduced into the field of the permutation hashes
+    return np.array([zlib.crc32(feature.encode("utf-8")) % MERSENNE_PRIME for feature in features], dtype=np.uint64)
+
+
+# --- MinHash / LSH index ---
+# Each connector's pinout becomes a feature set (pinout_features), summarized by a MinHash signature of
+# NUM_PERMUTATIONS minimums of random linear hashes. Matching signature positions estimate Jaccard similarity.
+# The signatures are cut into LSH_BANDS bands and every band is a hash table, so a query only meets
+# connectors that agree with it on at least one whole band. Those candidates are then ranked exactly on
+# their feature sets, so LSH only decides who gets compared, never the order.
+class PinoutSimilarityIndex:
+    def __init__(self, connectors_df, cavities_df, num_permutations=NUM_PERMUTATIONS, bands=LSH_BANDS):
+        self.df = connectors_df
+        self.bands = bands
+        self.rows_per_band = num_permutations // bands
+        rng = np.random.default_rng(RANDOM_SEED)
+        self.hash_a = rng.integers(1, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self.hash_b = rng.integers(0, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+
+        # Feature sets per connector, grouped by connector_id (the row position in connectors_df)
+        num_connectors = len(connectors_df)
+        cavity_rows = zip(*(cavities_df[column].astype(object).to_numpy() for column in SIGNATURE_COLUMNS))
+        rows_per_connector = [[] for _ in range(num_connectors)]
+        for connector_id, row in zip(cavities_df["connector_id"].to_numpy(), cavity_rows):
+            rows_per_connector[connector_id].append(row)
+        total_cavities = connectors_df["total_cavities"].to_numpy() if "total_cavities" in connectors_df else [None] * num_connectors
+        self.feature_sets = [pinout_features(rows, total) for rows, total in zip(rows_per_connector, total_cavities)]
+
+        # Signatures: hash every distinct feature once per permutation, then take per-connector minimums
+        feature_codes, distinct_features = pd.factorize(pd.Series([f for features in self.feature_sets for f in features], dtype=object))
+        counts = np.array([len(features) for features in self.feature_sets])
+
+        # Feature -> connector ids, for sparse queries that are too dissimilar from any full pinout for LSH
+        connector_of_feature = np.repeat(np.arange(num_connectors), counts)
+        order = np.argsort(feature_codes, kind="stable")
+        groups = np.split(connector_of_feature[order], np.cumsum(np.bincount(feature_codes, minlength=len(distinct_features)))[:-1])
+        self.feature_postings = dict(zip(distinct_features, groups))
+        has_features = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[has_features]
+        base_hashes = _feature_hashes(distinct_features)
+        self.signatures = np.full((num_connectors, num_permutations), MERSENNE_PRIME, dtype=np.uint64)
+        for i in range(num_permutations):
+            permuted = (self.hash_a[i] * base_hashes + self.hash_b[i]) % MERSENNE_PRIME
+            if len(feature_codes):
+                self.signatures[has_features, i] = np.minimum.reduceat(permuted[feature_codes], starts)
+
+        # One hash table per band: band key -> connector ids
+        self.band_tables = []
+        for band in range(bands):
+            keys = self._band_keys(self.signatures, band)
+            codes, uniques = pd.factorize(keys)
+            order = np.argsort(codes, kind="stable")
+            groups = np.split(order, np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1])
+            self.band_tables.append(dict(zip(uniques, groups)))
+
+    def _band_keys(self, signatures, band):
+        columns = signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band]
+        # Fold the band's rows into one 64-bit key; it wraps around, so a rare collision only adds a candidate
+        keys = np.zeros(len(signatures), dtype=np.uint64)
+        for column in columns.T:
+            keys = keys * np.uint64(MERSENNE_PRIME) + column
+        return keys
+
+    def signature(self, features):
+        signature = np.full(len(self.hash_a), MERSENNE_PRIME, dtype=np.uint64)
+        if features:
+            base_hashes = _feature_hashes(sorted(features))
+            signature = ((np.outer(base_hashes, self.hash_a) + self.hash_b) % MERSENNE_PRIME).min(axis=0)
+        return signature
+
+    def candidates(self, features, min_candidates=0):
+        signature = self.signature(features)[np.newaxis, :]
+        found = [self.band_tables[band].get(self._band_keys(signature, band)[0]) for band in range(self.bands)]
+        found = [ids for ids in found if ids is not None]
+        candidates = np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+        if len(candidates) < min_candidates:
+            # A query with only a few known values has a low Jaccard similarity to every full pinout, so LSH
+            # finds little; fall back to every connector sharing at least one feature with it
+            postings = [self.feature_postings[feature] for feature in features if feature in self.feature_postings]
+            if postings:
+                candidates = np.unique(np.concatenate([candidates] + postings))
+        return candidates
+
+    def search(self, features, top_k=TOP_K, exclude=None):
+        # Top-k connectors by Jaccard similarity of their feature sets to `features`, with the share of the
+        # query's features each one contains (useful when the query is only partly known).
+        # `exclude`: a connector row to leave out, e.g. the one the query was taken from.
+        candidate_ids = [i for i in self.candidates(features, min_candidates=top_k + 1) if i != exclude]
+        scored = []
+        for connector_id in candidate_ids:
+            shared = len(features & self.feature_sets[connector_id])
+            union = len(features | self.feature_sets[connector_id])
+            scored.append((shared / union if union else 0.0, shared / len(features) if features else 0.0, connector_id))
+        scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        scored = scored[:top_k]
+        results = self.df.iloc[[item[2] for item in scored]].copy()
+        results.insert(0, "similarity", [round(item[0], 3) for item in scored])
+        results.insert(1, "query_features_matched", [round(item[1], 3) for item in scored])
+        results.attrs["num_candidates"] = len(candidate_ids)
+        return results
+
+    def connector_features(self, connector_id):
+        return self.feature_sets[connector_id]
+
+
+def build_similarity_index(prepared):
+    # Signatures are built from the pinout as published, "unused" cavities included
+    return PinoutSimilarityIndex(prepared.df, prepared.cavities_with_unused(columns=("connector_id",) + SIGNATURE_COLUMNS))
@@ -0,0 +1,369 @@
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import connector_index
+import connector_store
+
+# Optional query backend: every program in one SQLite file, queried with SQL instead of pandas masks
+DATABASE_PATH = os.path.join(connector_store.CONNECTORS_DIR, "connectors.sqlite")
+SCHEMA_VERSION = 2 # Bump when the schema changes; older databases are rebuilt from scratch
+MIN_TRIGRAM_LENGTH = 3 # The trigram index can't answer shorter substrings; those fall back to LIKE
+
+SCHEMA = """
+CREATE TABLE programs (
+    program_id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    sop TEXT NOT NULL,
+    prog_id TEXT NOT NULL,
+    filename TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    sort_order INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE connectors (
+    connector_id INTEGER PRIMARY KEY,
+    program_id INTEGER NOT NULL REFERENCES programs(program_id),
+    position INTEGER NOT NULL, -- Row position in the program file
+    name TEXT,
+    url TEXT,
+    tesla_part_number TEXT NOT NULL,
+    manufacturer TEXT NOT NULL,
+    connector_part_number TEXT NOT NULL,
+    color TEXT NOT NULL,
+    image_urls TEXT NOT NULL, -- JSON list
+    total_cavities INTEGER NOT NULL,
+    num_connected_cavities INTEGER NOT NULL,
+    num_unconnected_cavities INTEGER NOT NULL,
+    max_wire_size REAL NOT NULL -- Largest wire in mm², 0 without any
+);
+CREATE TABLE cavities (
+    connector_id INTEGER NOT NULL REFERENCES connectors(connector_id),
+    cavity TEXT,
+    terminal_manufacturer TEXT,
+    terminal_part_number TEXT,
+    terminal_size TEXT,
+    wire_color TEXT,
+    wire_size TEXT,
+    wire_seal_manufacturer TEXT,
+    wire_seal_pn TEXT,
+    wire_dest_desg TEXT,
+    wire_dest_cavity TEXT
+);
+-- Cavities per connector and wire color, for the "count of specific wire colors" filters
+CREATE TABLE connector_wire_colors (
+    connector_id INTEGER NOT NULL REFERENCES connectors(connector_id),
+    wire_color TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (connector_id, wire_color)
+) WITHOUT ROWID;
+
+CREATE INDEX connectors_program ON connectors(program_id, position);
+CREATE INDEX connectors_total_cavities ON connectors(program_id, total_cavities);
+CREATE INDEX connectors_connected_cavities ON connectors(program_id, num_connected_cavities);
+CREATE INDEX connectors_unconnected_cavities ON connectors(program_id, num_unconnected_cavities);
+CREATE INDEX connectors_max_wire_size ON connectors(program_id, max_wire_size);
+CREATE INDEX connectors_color ON connectors(color);
+CREATE INDEX cavities_connector ON cavities(connector_id);
+CREATE INDEX cavities_wire_dest ON cavities(wire_dest_desg, wire_dest_cavity);
+CREATE INDEX connector_wire_colors_count ON connector_wire_colors(wire_color, count);
+
+-- Case-insensitive substring search on part numbers and names
+CREATE VIRTUAL TABLE connector_search USING fts5(
+    tesla_part_number, manufacturer, connector_part_number, name,
+    content='connectors', content_rowid='connector_id', tokenize='trigram'
+);
+"""
+
+# Result columns, named like the prepared program's columns so the app renders either backend the same way
+RESULT_COLUMNS = """
+    p.model, p.sop, p.prog_id, c.connector_id, c.name, c.url, c.connector_part_number AS connector,
+    c.tesla_part_number AS tesla_part_number_str, c.manufacturer, c.color AS connector_body_color, c.image_urls,
+    c.total_cavities, c.num_connected_cavities, c.num_unconnected_cavities, c.max_wire_size
+"""
+
+
+def connect(db_path=DATABASE_PATH):
+    # A new connection per query is cheap, and avoids sharing one between Streamlit's script threads
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def _create_schema(conn):
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _delete_program(conn, program_id):
+    connector_ids = "SELECT connector_id FROM connectors WHERE program_id = ?"
+    conn.execute(f"DELETE FROM cavities WHERE connector_id IN ({connector_ids})", (program_id,))
+    conn.execute(f"DELETE FROM connector_wire_colors WHERE connector_id IN ({connector_ids})", (program_id,))
+    conn.execute("DELETE FROM connectors WHERE program_id = ?", (program_id,))
+    conn.execute("DELETE FROM programs WHERE program_id = ?", (program_id,))
+
+
+def _insert_program(conn, meta, connectors_df, cavities_df):
+    # Derived columns come from the same PreparedProgram code as the pandas backend, so both agree on every count
+    prepared = connector_index.prepare_program(connectors_df, cavities_df)
+    df = prepared.df
+    program_id = conn.execute(
+        "INSERT INTO programs (model, sop, prog_id, filename, sha256) VALUES (?, ?, ?, ?, ?)",
+        (meta["model"], meta["sop"], meta["prog_id"], meta["filename"], meta["sha256"]),
+    ).lastrowid
+    first_id = (conn.execute("SELECT MAX(connector_id) FROM connectors").fetchone()[0] or 0) + 1
+
+    conn.executemany(
+        "INSERT INTO connectors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        zip(
+            range(first_id, first_id + len(df)), [program_id] * len(df), range(len(df)),
+            df["name"], df["url"], df["tesla_part_number_str"], df["manufacturer"], df["connector_part_number_full"],
+            df["connector_body_color"], [json.dumps(urls) for urls in df["image_urls"]],
+            df["total_cavities"].tolist(), df["num_connected_cavities"].tolist(), df["num_unconnected_cavities"].tolist(),
+            df["max_wire_size"].tolist(),
+        ),
+    )
+
+    cavity_columns = list(connector_store.CAVITY_COLUMNS.values())
+    cavity_values = [cavities_df[column].astype(object).where(cavities_df[column].notna(), None) for column in cavity_columns]
+    conn.executemany(
+        f"INSERT INTO cavities (connector_id, {', '.join(cavity_columns)}) VALUES (?{', ?' * len(cavity_columns)})",
+        zip((cavities_df["connector_id"] + first_id).tolist(), *cavity_values),
+    )
+
+    colors = list(prepared.wire_color_index)
+    connector_positions, color_columns = prepared.wire_color_counts.nonzero()
+    conn.executemany(
+        "INSERT INTO connector_wire_colors VALUES (?, ?, ?)",
+        zip((connector_positions + first_id).tolist(), [colors[i] for i in color_columns],
+            prepared.wire_color_counts[connector_positions, color_columns].tolist()),
+    )
+
+
+def sync_database(program_metadata, db_path=DATABASE_PATH):
+    # Brings the database in line with the manifest: programs whose hash changed are re-ingested, removed ones
+    # deleted, unchanged ones left alone. Returns messages as (level, text) tuples, like refresh_manifest.
+    messages = []
+    rebuild_path = None
+    conn = connect(db_path)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Built under a temp name and swapped in when complete: other sessions and processes may still
+            # have the old file open, and keep reading it until they reconnect
+            conn.close()
+            rebuild_path = f"{db_path}.{os.getpid()}.tmp"
+            if os.path.exists(rebuild_path):
+                os.remove(rebuild_path)
+            conn = connect(rebuild_path)
+            _create_schema(conn)
+
+        with conn:
+            stored = {filename: (program_id, sha256) for program_id, filename, sha256
+                      in conn.execute("SELECT program_id, filename, sha256 FROM programs")}
+            wanted = {meta["filename"]: meta for meta in program_metadata}
+            changed = False
+            for filename, (program_id, sha256) in stored.items():
+                if filename not in wanted or wanted[filename]["sha256"] != sha256:
+                    _delete_program(conn, program_id)
+                    changed = True
+            for filename, meta in wanted.items():
+                if filename in stored and stored[filename][1] == meta["sha256"]:
+                    continue
+                try:
+                    tables = connector_store.load_program_tables(connector_store.resolve_program_path(meta))
+                except Exception as e:
+                    messages.append(("warning", f"Could not add {filename} to the search database: {e}"))
+                    continue
+                _insert_program(conn, meta, *tables)
+                changed = True
+
+            if changed:
+                conn.execute("INSERT INTO connector_search(connector_search) VALUES ('rebuild')")
+                # Display order: model, then SOP number, then prog_id
+                ordered = sorted(conn.execute("SELECT program_id, model, sop, prog_id FROM programs").fetchall(),
+                                 key=lambda row: (row[1], connector_store.sop_sort_key(row[2]), row[3]))
+                conn.executemany("UPDATE programs SET sort_order = ? WHERE program_id = ?",
+                                 [(order, row[0]) for order, row in enumerate(ordered)])
+        if changed:
+            conn.execute("ANALYZE")
+    except BaseException:
+        conn.close()
+        if rebuild_path is not None and os.path.exists(rebuild_path):
+            os.remove(rebuild_path)
+        raise
+    conn.close()
+    if rebuild_path is not None:
+        os.replace(rebuild_path, db_path)
+    return messages
+
+
+# --- Queries ---
+def _program_clause(programs):
+    # programs: None for every program, or a list of (model, prog_id)
+    if programs is None:
+        return "1", []
+    placeholders = ", ".join("(?, ?)" for _ in programs)
+    return f"(p.model, p.prog_id) IN (VALUES {placeholders})", [value for program in programs for value in program]
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _substring_clause(columns, term):
+    # Trigram index for 3+ characters, a LIKE scan otherwise. Terms are matched literally, case-insensitively.
+    if len(term) >= MIN_TRIGRAM_LENGTH:
+        column_filter = "{" + " ".join(columns) + "}"
+        return ("c.connector_id IN (SELECT rowid FROM connector_search WHERE connector_search MATCH ?)",
+                [f"{column_filter} : {_fts_phrase(term)}"])
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    clause = " OR ".join(f"c.{column} LIKE ? ESCAPE '\\'" for column in columns)
+    return f"({clause})", [f"%{escaped}%"] * len(columns)
+
+
+def _filter_clauses(filters):
+    # [(filter name, condition on connectors c, params)] for every filter that is set, named as in
+    # connector_index.filter_masks so a facet can leave its own filter out
+    clauses = []
+    for column in ("total_cavities", "num_connected_cavities", "num_unconnected_cavities"):
+        bounds = filters.get(column)
+        if bounds is not None:
+            clauses.append((column, f"c.{column} BETWEEN ? AND ?", [int(bounds[0]), int(bounds[1])]))
+
+    bounds = filters.get("max_wire_size")
+    if bounds is not None:
+        clauses.append(("max_wire_size", "c.max_wire_size BETWEEN ? AND ?", [float(bounds[0]), float(bounds[1])]))
+
+    tesla_pn = filters.get("tesla_part_number")
+    if tesla_pn:
+        clauses.append(("tesla_part_number", *_substring_clause(["tesla_part_number"], tesla_pn)))
+
+    manuf_or_connector = filters.get("manufacturer_or_connector")
+    if manuf_or_connector:
+        clauses.append(("manufacturer_or_connector", *_substring_clause(["manufacturer", "connector_part_number"], manuf_or_connector)))
+
+    body_color = filters.get("body_color")
+    if body_color:
+        clauses.append(("body_color", "c.color = ?", [body_color]))
+
+    for color, min_count, max_count in filters.get("wire_color_counts", []):
+        if min_count > 0:
+            # Served by the (wire_color, count) index
+            clause = ("c.connector_id IN (SELECT connector_id FROM connector_wire_colors "
+                      "WHERE wire_color = ? AND count BETWEEN ? AND ?)")
+        else:
+            # Connectors without the color count as 0, so they can't come from the index alone
+            clause = ("COALESCE((SELECT count FROM connector_wire_colors w "
+                      "WHERE w.connector_id = c.connector_id AND w.wire_color = ?), 0) BETWEEN ? AND ?")
+        clauses.append(("wire_color_counts", clause, [color, int(min_count), int(max_count)]))
+    return clauses
+
+
+def _where_clause(filters, programs=None, excluded=None):
+    # WHERE condition and params of the filters (but the one named `excluded`) on the given programs
+    program_clause, params = _program_clause(programs)
+    conditions = [program_clause]
+    for name, clause, clause_params in _filter_clauses(filters):
+        if name != excluded:
+            conditions.append(clause)
+            params += clause_params
+    return " AND ".join(conditions), params
+
+
+def build_query(filters, programs=None):
+    # Same filters dict as connector_index.compute_filter_mask; returns (sql, params)
+    where, params = _where_clause(filters, programs)
+    sql = (f"SELECT {RESULT_COLUMNS} FROM connectors c JOIN programs p ON p.program_id = c.program_id "
+           f"WHERE {where} ORDER BY p.sort_order, c.position")
+    return sql, params
+
+
+def query_connectors(filters, programs=None, db_path=DATABASE_PATH):
+    sql, params = build_query(filters, programs)
+    conn = connect(db_path)
+    try:
+        results = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    results["image_urls"] = [json.loads(urls) for urls in results["image_urls"]]
+    return results
+
+
+def query_cavities(connector_id, db_path=DATABASE_PATH):
+    # Pinout of one connector of a query_connectors result, in the cavities table layout of a prepared program
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query("SELECT * FROM cavities WHERE connector_id = ? ORDER BY rowid", conn, params=(int(connector_id),))
+    finally:
+        conn.close()
+
+
+def query_facet_counts(filters, programs=None, db_path=DATABASE_PATH):
+    # Same counts as connector_index.facet_counts, from GROUP BY queries; the cavity count distributions
+    # end at the largest value that occurs
+    connectors = "FROM connectors c JOIN programs p ON p.program_id = c.program_id"
+    conn = connect(db_path)
+    try:
+        where, params = _where_clause(filters, programs)
+        counts = {"matches": conn.execute(f"SELECT COUNT(*) {connectors} WHERE {where}", params).fetchone()[0]}
+        for name, _ in connector_index.FACET_RANGE_COLUMNS:
+            where, params = _where_clause(filters, programs, excluded=name)
+            rows = conn.execute(f"SELECT c.{name}, COUNT(*) {connectors} WHERE {where} GROUP BY c.{name}", params).fetchall()
+            distribution = np.zeros(max((value for value, _ in rows), default=0) + 1, dtype=np.int64)
+            for value, count in rows:
+                distribution[value] = count
+            counts[name] = distribution
+
+        where, params = _where_clause(filters, programs, excluded="body_color")
+        counts["body_color"] = dict(conn.execute(f"SELECT c.color, COUNT(*) {connectors} WHERE {where} GROUP BY c.color", params).fetchall())
+        counts["body_color_total"] = sum(counts["body_color"].values())
+
+        where, params = _where_clause(filters, programs, excluded="wire_color_counts")
+        counts["wire_color"] = dict(conn.execute(
+            f"SELECT w.wire_color, COUNT(*) FROM connector_wire_colors w JOIN connectors c ON c.connector_id = w.connector_id "
+            f"JOIN programs p ON p.program_id = c.program_id WHERE {where} AND w.count > 0 GROUP BY w.wire_color", params).fetchall())
+    finally:
+        conn.close()
+    return counts
+
+
+class ProgramFacets:
+    # The sidebar vocabularies and slider ranges of a PreparedProgram, read from the database instead
+    def __init__(self, programs=None, db_path=DATABASE_PATH):
+        program_clause, params = _program_clause(programs)
+        program_join = f"FROM connectors c JOIN programs p ON p.program_id = c.program_id WHERE {program_clause}"
+        conn = connect(db_path)
+        try:
+            (self.num_connectors, self.max_total_cavities, self.max_connected_cavities,
+             self.max_unconnected_cavities) = conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(total_cavities), 0), COALESCE(MAX(num_connected_cavities), 0), "
+                f"COALESCE(MAX(num_unconnected_cavities), 0) {program_join}", params).fetchone()
+            self.max_wire_sizes = sorted({0.0} | {row[0] for row in conn.execute(
+                f"SELECT DISTINCT c.max_wire_size {program_join}", params)})
+            self.wire_colors = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT w.wire_color FROM connector_wire_colors w JOIN connectors c ON c.connector_id = w.connector_id "
+                f"JOIN programs p ON p.program_id = c.program_id WHERE {program_clause} "
+                "AND w.wire_color NOT IN ('unused', '') ORDER BY w.wire_color", params)]
+            self.body_colors = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT c.color {program_join} AND c.color != '' ORDER BY c.color", params)]
+        finally:
+            conn.close()
+        self.largest_wire_size = self.max_wire_sizes[-1]
+        self.wire_color_options = connector_index.color_display_options(self.wire_colors)
+        self.body_color_options = connector_index.color_display_options(self.body_colors)
+
+    def __len__(self):
+        return self.num_connectors
+
+
+if __name__ == "__main__":
+    program_metadata, manifest_messages = connector_store.refresh_manifest()
+    for level, text in manifest_messages + sync_database(program_metadata):
+        print(f"[{level}] {text}")
+    conn = connect()
+    num_programs, num_connectors = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM programs), (SELECT COUNT(*) FROM connectors)").fetchone()
+    conn.close()
+    print(f"{DATABASE_PATH}: {num_programs} programs, {num_connectors} connectors.")
@@ -0,0 +1,715 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError: # Columnar store is optional; JSON program files always work
+    pa = None
+
+try:
+    import orjson
+except ImportError: # Optional faster JSON decoder; the json module reads the same files
+    orjson = None
+
+CONNECTORS_DIR = "connectors"
+PROGRAM_FILE_PATTERN = os.path.join(CONNECTORS_DIR, "connectors_*.json")
+MANIFEST_PATH = os.path.join(CONNECTORS_DIR, "manifest.json")
+MANIFEST_VERSION = 2 # 2: entries record the malformed records of their file
+
+COLUMNAR_DIR = os.path.join(CONNECTORS_DIR, "columnar")
+DEDUP_DIR = os.path.join(CONNECTORS_DIR, "dedup")
+DEDUP_VERSION = 2 # 2: objects come from the typed decode, refs files carry the malformed records
+DEDUP_OBJECTS_FILE = "objects.json"
+DEDUP_REFS_SUFFIX = ".refs.json"
+
+# Top-level keys every program file must carry
+REQUIRED_PROGRAM_KEYS = ("model", "prog_id", "sop", "connectors")
+# Columns that identify the program of each connector in a combined multi-program table
+PROGRAM_KEY_COLUMNS = ("model", "sop", "prog_id")
+LOAD_WORKERS = 8  # Program files read concurrently by load_programs_parallel
+
+# Connector-level fields written by the scraper (pinout_table is split out into the cavities table)
+CONNECTOR_FIELDS = ("url", "name", "tesla_part_number", "connector", "color", "description")
+
+# Pinout table headers as scraped from service.tesla.com -> cavities table column names
+CAVITY_COLUMNS = {
+    "Cavity": "cavity",
+    "Terminal Manufacturer": "terminal_manufacturer",
+    "Terminal Part Number": "terminal_part_number",
+    "Terminal Size": "terminal_size",
+    "Wire Color": "wire_color",
+    "Wire Size": "wire_size",
+    "Wire Seal Manufacturer": "wire_seal_manufacturer",
+    "Wire Seal PN": "wire_seal_pn",
+    "Wire Dest. Desg.": "wire_dest_desg",
+    "Wire Dest. Cavity": "wire_dest_cavity",
+}
+# Numeric-looking cavity columns -> float32 column of their value, parsed once at load time (NaN where the
+# text isn't a plain decimal number, e.g. cavity "A1", wire size "D302" or "unused")
+NUMERIC_CAVITY_COLUMNS = {
+    "cavity": "cavity_number",
+    "wire_size": "wire_size_mm2",
+    "wire_dest_cavity": "wire_dest_cavity_number",
+}
+NUMBER_PATTERN = r"\d+(?:\.\d+)?"
+MAX_REPORTED_ISSUES = 10 # Malformed records listed per file in the manifest; all of them are counted
+
+
+# --- Program file helpers ---
+def sop_sort_key(sop_string):
+    if isinstance(sop_string, str) and sop_string.startswith("SOP") and sop_string[3:].isdigit():
+        return int(sop_string[3:])
+    return float('inf') # Place non-standard or non-string SOPs at the end
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_json_file(path):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read()) # orjson.JSONDecodeError is a json.JSONDecodeError
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_program_header(path):
+    # Full typed decode, so the manifest also records malformed records; only needed when the entry is stale
+    data = read_json_file(path)
+    connectors_df, _, issues = decode_program(data)
+    return {
+        "model": data["model"],
+        "prog_id": data["prog_id"],
+        "sop": data["sop"],
+        "build_information": data.get("build_information", []),
+        "num_connectors": len(connectors_df),
+        "num_issues": len(issues),
+        "issues": issues[:MAX_REPORTED_ISSUES],
+    }
+
+
+# --- Manifest ---
+# connectors/manifest.json maps each program file (by basename) to its size, mtime,
+# sha256 and header fields, so startup only has to stat the files instead of parsing them.
+def load_manifest(manifest_path=MANIFEST_PATH):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    if manifest.get("version") != MANIFEST_VERSION or not isinstance(manifest.get("files"), dict):
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    # Write to a temp file and swap it in so readers never see a half-written manifest
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def build_manifest_entry(path, previous=None):
+    stat = os.stat(path)
+    # Fast path: size and mtime unchanged, trust the recorded entry
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        return previous, False
+
+    sha256 = file_sha256(path)
+    if previous and previous.get("sha256") == sha256:
+        # Touched (e.g. fresh checkout) but identical content, only refresh the stat fields
+        entry = dict(previous, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        return entry, True
+
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    try:
+        entry.update(read_program_header(path))
+    except json.JSONDecodeError:
+        entry["error"] = "Error decoding JSON. Please ensure it's valid."
+    except (OSError, ValueError) as e:
+        entry["error"] = str(e)
+    return entry, True
+
+
+def refresh_manifest(file_pattern=PROGRAM_FILE_PATTERN, manifest_path=MANIFEST_PATH, write=True):
+    # Returns (program metadata list, messages); messages are (level, text) tuples for the caller to surface
+    manifest = load_manifest(manifest_path)
+    known = manifest["files"]
+    files = {}
+    messages = []
+    changed = False
+
+    for filename in sorted(glob.glob(file_pattern)):
+        basename = os.path.basename(filename)
+        if "old_" in basename.lower(): # Heuristic to skip files like 'old_connectors_prog-13.json'
+            messages.append(("info", f"Skipping file with 'old_' in name: {filename}"))
+            continue
+        try:
+            entry, updated = build_manifest_entry(filename, known.get(basename))
+        except OSError as e:
+            messages.append(("error", f"An unexpected error occurred while processing {filename}: {e}"))
+            continue
+        files[basename] = entry
+        changed |= updated
+
+    if set(files) != set(known):
+        changed = True
+    manifest["files"] = files
+
+    if changed and write:
+        try:
+            save_manifest(manifest, manifest_path)
+        except OSError as e:
+            # Read-only deployments still work, they just re-hash on every cold start
+            messages.append(("warning", f"Could not update manifest {manifest_path}: {e}"))
+
+    metadata = []
+    for basename, entry in files.items():
+        filename = os.path.join(os.path.dirname(file_pattern), basename)
+        if "error" in entry:
+            messages.append(("warning", f"Skipping {filename}: {entry['error']}"))
+            continue
+        if entry.get("num_issues"):
+            messages.append(("warning", f"{filename}: skipped {entry['num_issues']} malformed records, e.g. {entry['issues'][0]}"))
+        metadata.append({
+            "model": entry["model"],
+            "prog_id": entry["prog_id"],
+            "sop": entry["sop"],
+            "filename": filename,
+            "build_information": entry.get("build_information", []),
+            "sha256": entry["sha256"],
+        })
+    return metadata, messages
+
+
+def update_manifest_entry(path, manifest_path=MANIFEST_PATH):
+    # Called by the scraper right after it writes a program file
+    manifest = load_manifest(manifest_path)
+    basename = os.path.basename(path)
+    entry, _ = build_manifest_entry(path)
+    manifest["files"][basename] = entry
+    save_manifest(manifest, manifest_path)
+    return entry
+
+
+# --- Program tables ---
+# A program is held as two flat tables instead of nested dicts:
+#   connectors: one row per connector, `connector_id` is its position among the program's well-formed connectors
+#   cavities:   one row per pinout_table row, linked back by `connector_id`, plus the float32 columns of
+#               NUMERIC_CAVITY_COLUMNS
+# Program files are decoded against a declared schema: top-level REQUIRED_PROGRAM_KEYS (model, prog_id and
+# sop strings, connectors a list), connectors are objects whose CONNECTOR_FIELDS are strings, image_urls a
+# list of strings and pinout_table a list of {header: string} objects. A file that isn't a program is
+# rejected (ValueError). Inside one, a connector or pinout row that isn't an object is skipped, a number
+# where text is expected is kept as its text and any other wrong value is dropped; each is reported as an issue.
+def _text_or_none(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+def _connector_label(connector_id, connector):
+    return f"connector {connector_id} ({connector.get('name')})"
+
+
+def _text_values(values, name, report):
+    # values with every entry a string or None
+    malformed = [value for value in values if value is not None and not isinstance(value, str)]
+    if not malformed:
+        return values
+    report(f"{name}: {len(malformed)} values are not text (e.g. {malformed[0]!r}); numbers kept as text, others dropped")
+    return [value if value is None or isinstance(value, str) else _text_or_none(value) for value in values]
+
+
+def _text_categorical(values, name, report):
+    # Cavity values repeat heavily ("unused", "SUMITOMO", "BK", ...), so keep them dictionary-coded; the
+    # type check then only has to look at the distinct values
+    try:
+        codes, uniques = pd.factorize(np.fromiter(values, dtype=object, count=len(values)), sort=True)
+        is_text = all(isinstance(value, str) for value in uniques)
+    except TypeError: # Unhashable or unorderable values (a list, a number among strings)
+        is_text = False
+    if not is_text:
+        codes, uniques = pd.factorize(np.array(_text_values(values, name, report), dtype=object), sort=True)
+    return pd.Categorical.from_codes(codes, pd.Index(uniques, dtype=str if len(uniques) else object))
+
+
+def parse_numbers(values):
+    # float32 value of every plain decimal in a column of strings, NaN elsewhere; parsed once per distinct value
+    categorical = values if isinstance(values, pd.Categorical) else pd.Series(values).astype("category").array
+    categories = pd.Series(categorical.categories.astype(str), dtype=object)
+    numbers = pd.to_numeric(categories.where(categories.str.fullmatch(NUMBER_PATTERN)), errors="coerce")
+    return np.append(numbers.to_numpy(dtype=np.float32), np.float32(np.nan))[categorical.codes] # Code -1 (missing) -> NaN
+
+
+def add_numeric_cavity_columns(cavities_df):
+    # Adds the NUMERIC_CAVITY_COLUMNS a cavities table doesn't have yet (e.g. an older columnar conversion)
+    for column, numeric_column in NUMERIC_CAVITY_COLUMNS.items():
+        if numeric_column not in cavities_df:
+            cavities_df[numeric_column] = parse_numbers(cavities_df[column])
+    return cavities_df
+
+
+def _connectors_table(connectors, has_pinout_table, report=lambda message: None):
+    connector_rows = {field: _text_values([connector.get(field) for connector in connectors], field, report)
+                      for field in CONNECTOR_FIELDS}
+    connectors_df = pd.DataFrame(connector_rows, dtype=object)
+    connectors_df.insert(0, "connector_id", np.arange(len(connectors), dtype=np.int32))
+    image_urls = []
+    for connector_id, urls in enumerate(connector.get("image_urls") for connector in connectors):
+        if urls is not None and not (isinstance(urls, list) and all(isinstance(url, str) for url in urls)):
+            report(f"{_connector_label(connector_id, connectors[connector_id])}: image_urls is not a list of strings; other values dropped")
+            urls = [url for url in urls if isinstance(url, str)] if isinstance(urls, list) else None
+        image_urls.append(urls or [])
+    connectors_df["image_urls"] = image_urls
+    connectors_df["has_pinout_table"] = has_pinout_table
+    return connectors_df
+
+
+def program_to_tables(connectors, issues=None):
+    # Typed decode of a connector list (see the schema above); malformed records are appended to `issues`
+    report = issues.append if issues is not None else lambda message: None
+    records = []
+    for position, connector in enumerate(connectors):
+        if isinstance(connector, dict):
+            records.append(connector)
+        else:
+            report(f"connectors[{position}] is not an object; skipped")
+
+    has_pinout_table = []
+    pins = []
+    pins_per_connector = []
+    for connector_id, connector in enumerate(records):
+        pinout_table = connector.get("pinout_table")
+        if pinout_table is not None and not isinstance(pinout_table, list):
+            report(f"{_connector_label(connector_id, connector)}: pinout_table is not a list; ignored")
+            pinout_table = None
+        has_pinout_table.append(pinout_table is not None)
+        num_pins = len(pins)
+        for row, pin in enumerate(pinout_table or []):
+            if isinstance(pin, dict):
+                pins.append(pin)
+            else:
+                report(f"{_connector_label(connector_id, connector)}: pinout row {row} is not an object; skipped")
+        pins_per_connector.append(len(pins) - num_pins)
+
+    connectors_df = _connectors_table(records, has_pinout_table, report)
+
+    # One pass per column instead of one per row, so each column is built as a single list
+    cavity_columns = {"connector_id": np.repeat(np.arange(len(records), dtype=np.int32), pins_per_connector)}
+    for header, column in CAVITY_COLUMNS.items():
+        cavity_columns[column] = _text_categorical([pin.get(header) for pin in pins], column, report)
+    cavities_df = add_numeric_cavity_columns(pd.DataFrame(cavity_columns))
+    return connectors_df, cavities_df
+
+
+def decode_program(data):
+    # Parsed program file -> (connectors table, cavities table, issues); raises ValueError if it isn't a program
+    if not isinstance(data, dict):
+        raise ValueError("the JSON structure is not an object.")
+    missing = [key for key in REQUIRED_PROGRAM_KEYS if key not in data]
+    if missing:
+        raise ValueError(f"missing one or more required keys ({', '.join(repr(k) for k in REQUIRED_PROGRAM_KEYS)}) in JSON structure.")
+    for key in ("model", "prog_id", "sop"):
+        if not isinstance(data[key], str):
+            raise ValueError(f"{key!r} is not a string.")
+    connectors = [] if data["connectors"] is None else data["connectors"]
+    if not isinstance(connectors, list):
+        raise ValueError("'connectors' is not a list.")
+    issues = []
+    connectors_df, cavities_df = program_to_tables(connectors, issues)
+    return connectors_df, cavities_df, issues
+
+
+def load_json_program_tables(path):
+    connectors_df, cavities_df, _ = decode_program(read_json_file(path))
+    return connectors_df, cavities_df
+
+
+# --- Columnar (Arrow IPC) store ---
+# connectors/columnar/<program file stem>/{connectors,cavities}.arrow, uncompressed so they can be
+# memory-mapped, with every string column dictionary-encoded. The schema metadata records the
+# sha256 of the JSON file it was converted from, so a stale conversion is never used.
+def columnar_path_for(json_path, columnar_dir=COLUMNAR_DIR):
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    return os.path.join(columnar_dir, stem)
+
+
+def is_columnar_program(path):
+    return os.path.isfile(os.path.join(path, "connectors.arrow")) and os.path.isfile(os.path.join(path, "cavities.arrow"))
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the columnar connector store (pip install pyarrow).")
+
+
+def _dictionary_encode_strings(table):
+    columns = []
+    for column in table.columns:
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = column.dictionary_encode()
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names)
+
+
+def _write_arrow(table, path, metadata):
+    table = table.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def write_columnar_program(json_path, columnar_dir=COLUMNAR_DIR):
+    _require_pyarrow()
+    connectors_df, cavities_df = load_json_program_tables(json_path)
+    out_dir = columnar_path_for(json_path, columnar_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    metadata = {"source_sha256": file_sha256(json_path), "source_file": os.path.basename(json_path)}
+    connectors_table = _dictionary_encode_strings(pa.Table.from_pandas(connectors_df, preserve_index=False))
+    cavities_table = pa.Table.from_pandas(cavities_df, preserve_index=False) # categoricals map to dictionary arrays
+    _write_arrow(connectors_table, os.path.join(out_dir, "connectors.arrow"), metadata)
+    _write_arrow(cavities_table, os.path.join(out_dir, "cavities.arrow"), metadata)
+    return out_dir
+
+
+def _read_arrow(path):
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def columnar_source_sha256(path):
+    _require_pyarrow()
+    with pa.memory_map(os.path.join(path, "connectors.arrow"), "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return metadata.get(b"source_sha256", b"").decode()
+
+
+def load_columnar_program_tables(path):
+    _require_pyarrow()
+    connectors_table = _read_arrow(os.path.join(path, "connectors.arrow"))
+    cavities_table = _read_arrow(os.path.join(path, "cavities.arrow"))
+
+    # The connectors table is small, decode it to plain strings so it behaves like the JSON path
+    connectors_df = connectors_table.to_pandas()
+    for column in CONNECTOR_FIELDS:
+        connectors_df[column] = connectors_df[column].astype(object).where(connectors_df[column].notna(), None)
+    connectors_df["image_urls"] = [list(urls) if urls is not None else [] for urls in connectors_df["image_urls"]]
+    cavities_df = cavities_table.to_pandas() # dictionary columns come back as categoricals
+    return connectors_df, add_numeric_cavity_columns(cavities_df)
+
+
+# --- Deduplicated (content-addressed) store ---
+# Consecutive SOPs share most of their connectors, so connectors/dedup/ keeps every distinct pinout row,
+# pinout table and connector record once, keyed by a hash of its content (objects.json), and describes each
+# program as a thin list of references (<program file stem>.refs.json: url, connector hash, pinout hash per
+# connector). The url stays per program since it contains the prog_id. Like the columnar conversion, a refs
+# file records the sha256 of the JSON it came from and is only used while that still matches.
+# All programs decode the same objects.json once: cavity values are dictionary codes into one shared set
+# of categories and connector records are the same dicts, so loading every program costs about the size
+# of the distinct data plus one small integer per cavity row.
+def _content_hash(value):
+    return hashlib.blake2b(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def dedup_path_for(json_path, dedup_dir=DEDUP_DIR):
+    return os.path.join(dedup_dir, os.path.splitext(os.path.basename(json_path))[0] + DEDUP_REFS_SUFFIX)
+
+
+def is_dedup_program(path):
+    return path.endswith(DEDUP_REFS_SUFFIX) and os.path.isfile(path)
+
+
+def dedup_store_in_use(dedup_dir=DEDUP_DIR):
+    # A dedup store was built for this directory (python connector_store.py dedup); the scraper then leaves
+    # the columnar store alone, since a columnar conversion would take precedence over it
+    return os.path.isfile(os.path.join(dedup_dir, DEDUP_OBJECTS_FILE))
+
+
+def _write_json(data, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _dedup_program_objects(connectors_df, cavities_df):
+    # [(connector record, [pinout rows] or None)] of a decoded program, so the store holds what every other
+    # loader would have read from the file: typed values, malformed records already dropped
+    records = connectors_df[[field for field in CONNECTOR_FIELDS if field != "url"] + ["image_urls"]].to_dict("records")
+    cavity_values = [cavities_df[column].astype(object).where(cavities_df[column].notna(), None).tolist()
+                     for column in CAVITY_COLUMNS.values()]
+    rows = [dict(zip(CAVITY_COLUMNS, values)) for values in zip(*cavity_values)]
+    ends = np.cumsum(np.bincount(cavities_df["connector_id"], minlength=len(connectors_df))).tolist()
+    starts = [0] + ends[:-1]
+    return [(record, rows[start:end] if has_pinout_table else None)
+            for record, has_pinout_table, start, end in zip(records, connectors_df["has_pinout_table"], starts, ends)]
+
+
+def write_dedup_store(program_metadata, dedup_dir=DEDUP_DIR):
+    # Rebuilds objects.json from every program in program_metadata and (re)writes their refs files. Programs are
+    # decoded like any other load; their malformed records are kept in the refs file (see load_dedup_program_tables).
+    # Returns {"connectors": total, "connector_records": distinct, "pinouts": distinct, "cavity_rows": total, "rows": distinct,
+    #          "issues": {filename: malformed records}}; a file that isn't a program is left out, with its error as the issue.
+    row_columns = list(CAVITY_COLUMNS)
+    rows, pinouts, connector_records = {}, {}, {}
+    program_refs = []
+    program_issues = {}
+    num_connectors = num_cavity_rows = 0
+    for meta in program_metadata:
+        data = read_json_file(meta["filename"])
+        try:
+            connectors_df, cavities_df, issues = decode_program(data)
+        except ValueError as e:
+            program_issues[meta["filename"]] = [f"not a program file: {e}"]
+            continue
+        if issues:
+            program_issues[meta["filename"]] = issues
+        refs = []
+        for url, (record, pinout_table) in zip(connectors_df["url"], _dedup_program_objects(connectors_df, cavities_df)):
+            pinout_hash = None
+            if pinout_table is not None:
+                row_hashes = []
+                for pin in pinout_table:
+                    row_hash = _content_hash(pin)
+                    rows.setdefault(row_hash, pin)
+                    row_hashes.append(row_hash)
+                pinout_hash = _content_hash(row_hashes)
+                pinouts.setdefault(pinout_hash, row_hashes)
+                num_cavity_rows += len(row_hashes)
+            record_hash = _content_hash(record)
+            connector_records.setdefault(record_hash, record)
+            refs.append([url, record_hash, pinout_hash])
+        num_connectors += len(refs)
+        header = {key: value for key, value in data.items() if key != "connectors"}
+        program_refs.append((meta, header, refs, issues))
+
+    os.makedirs(dedup_dir, exist_ok=True)
+    _write_json({
+        "version": DEDUP_VERSION,
+        "row_columns": row_columns,
+        # Rows as value lists in row_columns order
+        "rows": {row_hash: [pin.get(header) for header in row_columns] for row_hash, pin in rows.items()},
+        "pinouts": pinouts,
+        "connectors": connector_records,
+    }, os.path.join(dedup_dir, DEDUP_OBJECTS_FILE))
+    # Refs last, so a refs file never points at objects that aren't written yet
+    for meta, header, refs, issues in program_refs:
+        _write_json(dict(header, version=DEDUP_VERSION, source_sha256=meta["sha256"],
+                         source_file=os.path.basename(meta["filename"]), issues=issues, connectors=refs),
+                    dedup_path_for(meta["filename"], dedup_dir))
+    return {"connectors": num_connectors, "connector_records": len(connector_records), "pinouts": len(pinouts),
+            "cavity_rows": num_cavity_rows, "rows": len(rows), "issues": program_issues}
+
+
+_dedup_objects_cache = {} # objects.json path -> (size, mtime_ns, decoded objects)
+_dedup_objects_lock = threading.Lock() # load_programs_parallel loads several refs files at once
+
+
+def _decode_dedup_objects(objects):
+    row_ids = {row_hash: row_id for row_id, row_hash in enumerate(objects["rows"])}
+    positions = [objects["row_columns"].index(header) for header in CAVITY_COLUMNS]
+    row_values = list(zip(*objects["rows"].values())) or [()] * len(objects["row_columns"])
+    cavity_columns = {}
+    for header, position in zip(CAVITY_COLUMNS.values(), positions):
+        # One categorical per cavity column over the distinct rows; programs take codes from it
+        cavity_columns[header] = pd.Categorical(pd.Series(row_values[position], dtype=object))
+    return {
+        "connectors": objects["connectors"],
+        # Parsed once over the distinct rows too
+        "numeric_columns": {numeric_column: parse_numbers(cavity_columns[column])
+                            for column, numeric_column in NUMERIC_CAVITY_COLUMNS.items()},
+        "pinouts": {pinout_hash: np.array([row_ids[row_hash] for row_hash in row_hashes], dtype=np.int32)
+                    for pinout_hash, row_hashes in objects["pinouts"].items()},
+        "cavity_columns": cavity_columns,
+    }
+
+
+def load_dedup_objects(objects_path):
+    stat = os.stat(objects_path)
+    with _dedup_objects_lock:
+        cached = _dedup_objects_cache.get(objects_path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        objects = read_json_file(objects_path)
+        if objects.get("version") != DEDUP_VERSION:
+            raise ValueError(f"{objects_path} has an unsupported version; rebuild it with 'python connector_store.py dedup'.")
+        decoded = _decode_dedup_objects(objects)
+        _dedup_objects_cache[objects_path] = (stat.st_size, stat.st_mtime_ns, decoded)
+        return decoded
+
+
+def dedup_source_sha256(path):
+    refs = read_json_file(path)
+    return refs.get("source_sha256", "") if refs.get("version") == DEDUP_VERSION else ""
+
+
+def load_dedup_program_tables(path, issues=None):
+    # Like program_to_tables, the malformed records of the program file (recorded when the store was written)
+    # are appended to `issues`
+    program_refs = read_json_file(path)
+    if issues is not None:
+        issues.extend(program_refs.get("issues", []))
+    refs = program_refs["connectors"]
+    objects = load_dedup_objects(os.path.join(os.path.dirname(path), DEDUP_OBJECTS_FILE))
+    connectors = [dict(objects["connectors"][record_hash], url=url) for url, record_hash, _ in refs]
+    connectors_df = _connectors_table(connectors, [pinout_hash is not None for _, _, pinout_hash in refs])
+
+    pinouts = [objects["pinouts"][pinout_hash] if pinout_hash is not None else np.empty(0, dtype=np.int32)
+               for _, _, pinout_hash in refs]
+    row_ids = np.concatenate(pinouts) if pinouts else np.empty(0, dtype=np.int32)
+    cavity_columns = {"connector_id": np.repeat(np.arange(len(refs), dtype=np.int32), [len(rows) for rows in pinouts])}
+    for column, categorical in objects["cavity_columns"].items():
+        # Same categories object for every program, only the codes are per program
+        cavity_columns[column] = pd.Categorical.from_codes(categorical.codes[row_ids], dtype=categorical.dtype)
+    for numeric_column, numbers in objects["numeric_columns"].items():
+        cavity_columns[numeric_column] = numbers[row_ids]
+    return connectors_df, pd.DataFrame(cavity_columns)
+
+
+def current_columnar_path(meta, columnar_dir=COLUMNAR_DIR):
+    # The columnar conversion of a manifest entry's file if it was made from the file's current content, else None
+    columnar_path = columnar_path_for(meta["filename"], columnar_dir)
+    if pa is not None and is_columnar_program(columnar_path):
+        try:
+            if columnar_source_sha256(columnar_path) == meta.get("sha256"):
+                return columnar_path
+        except (OSError, pa.ArrowInvalid):
+            pass
+    return None
+
+
+def resolve_program_path(meta, columnar_dir=COLUMNAR_DIR, dedup_dir=DEDUP_DIR):
+    # Prefer an up-to-date columnar conversion of the program file, then an up-to-date deduplicated one,
+    # fall back to the JSON itself. Which store a directory uses is chosen by the commands that were run:
+    # the scraper only writes columnar conversions while no dedup store exists (see dedup_store_in_use).
+    columnar_path = current_columnar_path(meta, columnar_dir)
+    if columnar_path is not None:
+        return columnar_path
+    dedup_path = dedup_path_for(meta["filename"], dedup_dir)
+    if is_dedup_program(dedup_path):
+        try:
+            if dedup_source_sha256(dedup_path) == meta.get("sha256"):
+                return dedup_path
+        except (OSError, ValueError):
+            pass
+    return meta["filename"]
+
+
+def load_program_tables(path):
+    # Accepts a program JSON file, a columnar program directory or a deduplicated program's refs file
+    if is_columnar_program(path):
+        return load_columnar_program_tables(path)
+    if is_dedup_program(path):
+        return load_dedup_program_tables(path)
+    return load_json_program_tables(path)
+
+
+def load_programs_parallel(paths, max_workers=LOAD_WORKERS):
+    # {path: (connectors table, cavities table)}, or the exception loading raised so one broken file
+    # doesn't hide the others. The Arrow reader releases the GIL, so columnar programs load in parallel.
+    def load(path):
+        try:
+            return load_program_tables(path)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(paths, executor.map(load, paths)))
+
+
+def concat_program_tables(programs):
+    # programs: [(meta, connectors table, cavities table)] -> one pair of tables for all of them.
+    # The connectors table gets categorical model/sop/prog_id columns, and connector_id is renumbered so
+    # it stays the row position in the combined table.
+    if not programs:
+        connectors_df, cavities_df = program_to_tables([])
+        for position, key in enumerate(PROGRAM_KEY_COLUMNS):
+            connectors_df.insert(position, key, pd.Categorical([]))
+        return connectors_df, cavities_df
+
+    connector_frames = []
+    cavity_connector_ids = []
+    offset = 0
+    for meta, connectors_df, cavities_df in programs:
+        connectors_df = connectors_df.assign(connector_id=connectors_df["connector_id"] + offset)
+        for position, key in enumerate(PROGRAM_KEY_COLUMNS):
+            connectors_df.insert(position, key, meta[key])
+        connector_frames.append(connectors_df)
+        cavity_connector_ids.append(cavities_df["connector_id"].to_numpy() + offset)
+        offset += len(connectors_df)
+
+    connectors_df = pd.concat(connector_frames, ignore_index=True)
+    for key in PROGRAM_KEY_COLUMNS:
+        # Categories in program order, so sorting or grouping by them keeps the programs in the given order
+        connectors_df[key] = pd.Categorical(connectors_df[key], categories=list(dict.fromkeys(connectors_df[key])))
+    connectors_df["connector_id"] = connectors_df["connector_id"].astype(np.int32)
+
+    cavity_columns = {"connector_id": np.concatenate(cavity_connector_ids).astype(np.int32)}
+    for column in CAVITY_COLUMNS.values():
+        # Merge the per-program dictionaries instead of decoding every value
+        categoricals = [pd.Categorical(cavities_df[column]) for _, _, cavities_df in programs]
+        try:
+            cavity_columns[column] = pd.api.types.union_categoricals(categoricals)
+        except TypeError: # Category dtypes differ (e.g. an all-empty column in one program)
+            cavity_columns[column] = pd.Categorical(pd.concat([pd.Series(c, dtype=object) for c in categoricals], ignore_index=True))
+    for numeric_column in NUMERIC_CAVITY_COLUMNS.values():
+        cavity_columns[numeric_column] = np.concatenate([cavities_df[numeric_column].to_numpy(dtype=np.float32)
+                                                         for _, _, cavities_df in programs])
+    return connectors_df, pd.DataFrame(cavity_columns)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the connector program manifest and columnar store.")
+    parser.add_argument("command", nargs="?", default="manifest", choices=["manifest", "columnar", "dedup", "validate"],
+                        help="'manifest' refreshes connectors/manifest.json, 'columnar' also converts every program to Arrow, "
+                             "'dedup' also writes the deduplicated store of all programs, "
+                             "'validate' also lists every malformed record of every program file")
+    args = parser.parse_args()
+
+    program_metadata, manifest_messages = refresh_manifest()
+    for level, text in manifest_messages:
+        print(f"[{level}] {text}")
+    print(f"Manifest {MANIFEST_PATH} covers {len(program_metadata)} program files.")
+
+    if args.command == "columnar":
+        for meta in program_metadata:
+            if current_columnar_path(meta) is not None: # A current dedup store doesn't count
+                print(f"Up to date: {meta['filename']}")
+                continue
+            out_dir = write_columnar_program(meta["filename"])
+            print(f"Converted {meta['filename']} -> {out_dir}")
+
+    if args.command == "validate":
+        for meta in program_metadata:
+            _, _, issues = decode_program(read_json_file(meta["filename"]))
+            print(f"{meta['filename']}: {len(issues)} malformed records")
+            for issue in issues:
+                print(f"  {issue}")
+
+    if args.command == "dedup":
+        stats = write_dedup_store(program_metadata)
+        for filename, issues in stats["issues"].items():
+            print(f"[warning] {filename}: {len(issues)} malformed records, e.g. {issues[0]}")
+        json_size = sum(os.path.getsize(meta["filename"]) for meta in program_metadata)
+        dedup_size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(DEDUP_DIR, "*.json")))
+        print(f"{stats['connectors']} connectors -> {stats['connector_records']} distinct records, "
+              f"{stats['pinouts']} distinct pinouts, {stats['cavity_rows']} cavity rows -> {stats['rows']} distinct rows")
+        print(f"Wrote {DEDUP_DIR}: {dedup_size / 1e6:.1f} MB (program files: {json_size / 1e6:.1f} MB)")
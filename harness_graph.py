@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+# Values of "Wire Dest. Desg." / "Wire Dest. Cavity" that mean the cavity has no wire
+UNCONNECTED_VALUES = ("", "unused")
+
+# Edge kinds
+WIRE = 0 # A wire between two cavities, from a pinout row (either end may list it)
+MATING = 1 # Cavity n of an inline connector half to cavity n of its other half
+EDGE_KIND_NAMES = {WIRE: "wire", MATING: "mating"}
+
+
+def mating_connector_name(name):
+    # Inline connectors are documented as two halves, e.g. X930M / X930F
+    if isinstance(name, str) and len(name) > 1 and name[-1] in "MF":
+        return name[:-1] + ("F" if name[-1] == "M" else "M")
+    return None
+
+
+def _node_keys(names, cavities):
+    return pd.Series(names, dtype=object).str.cat(pd.Series(cavities, dtype=object), sep="\t").to_numpy(dtype=object)
+
+
+# --- Harness graph ---
+# Nodes are (connector name, cavity) pairs, edges are wires and inline-connector matings, stored as CSR
+# arrays: the neighbours of node i are targets[indptr[i]:indptr[i + 1]] (with edge_kinds/edge_colors
+# alongside). Built once per program file, then every query only walks a handful of array slices.
+# Connector names are per program, so build one graph per program, never for the combined all-programs table.
+class HarnessGraph:
+    def __init__(self, connector_names, cavities_df):
+        connector_names = np.asarray(connector_names, dtype=object)
+        source_names = connector_names[cavities_df["connector_id"].to_numpy()]
+        source_cavities = cavities_df["cavity"].astype(object).to_numpy()
+        dest_names = cavities_df["wire_dest_desg"].astype(object).to_numpy()
+        dest_cavities = cavities_df["wire_dest_cavity"].astype(object).to_numpy()
+        wire_colors = cavities_df["wire_color"].astype(object).to_numpy()
+
+        has_cavity = pd.notna(source_cavities)
+        is_wired = (
+            has_cavity & pd.notna(dest_names) & pd.notna(dest_cavities) &
+            ~pd.Series(dest_names).isin(UNCONNECTED_VALUES).to_numpy() &
+            ~pd.Series(dest_cavities).isin(UNCONNECTED_VALUES).to_numpy()
+        )
+
+        # Cavity n of an inline half mates with cavity n of the other half, if that half is in the program.
+        # Only wired cavities, so unused pin pairs don't show up as connections.
+        program_names = set(connector_names)
+        mate_names = np.array([mating_connector_name(name) for name in source_names], dtype=object)
+        has_mate = is_wired & np.array([mate in program_names for mate in mate_names], dtype=bool)
+
+        # Node ids: every cavity of the program first (in file order), then wire destinations outside it
+        source_keys = _node_keys(source_names[has_cavity], source_cavities[has_cavity])
+        wire_from = _node_keys(source_names[is_wired], source_cavities[is_wired])
+        wire_to = _node_keys(dest_names[is_wired], dest_cavities[is_wired])
+        mate_from = _node_keys(source_names[has_mate], source_cavities[has_mate])
+        mate_to = _node_keys(mate_names[has_mate], source_cavities[has_mate])
+        codes, keys = pd.factorize(np.concatenate([source_keys, wire_from, wire_to, mate_from, mate_to]))
+        wire_from_ids, wire_to_ids, mate_from_ids, mate_to_ids = np.split(
+            codes[len(source_keys):], np.cumsum([len(wire_from), len(wire_to), len(mate_from)]))
+        num_nodes = len(keys)
+
+        node_parts = pd.Series(keys, dtype=object).str.split("\t", n=1)
+        self.node_connectors = node_parts.str[0].to_numpy(dtype=object)
+        self.node_cavities = node_parts.str[1].to_numpy(dtype=object)
+        self.node_index = {key: i for i, key in enumerate(keys)}
+        self.connector_node_ids = {
+            name: ids.to_numpy() for name, ids in pd.Series(np.arange(num_nodes)).groupby(self.node_connectors, sort=False)
+        }
+
+        # Both directions of every edge; duplicate pinout rows and wires listed at both ends collapse in np.unique
+        edge_sources = np.concatenate([wire_from_ids, wire_to_ids, mate_from_ids, mate_to_ids]).astype(np.int64)
+        edge_targets = np.concatenate([wire_to_ids, wire_from_ids, mate_to_ids, mate_from_ids]).astype(np.int64)
+        edge_kinds = np.concatenate([
+            np.full(2 * len(wire_from_ids), WIRE, dtype=np.int8), np.full(2 * len(mate_from_ids), MATING, dtype=np.int8)])
+        edge_colors = np.concatenate([wire_colors[is_wired], wire_colors[is_wired],
+                                      np.full(2 * len(mate_from_ids), None, dtype=object)])
+        edge_codes = (edge_sources * num_nodes + edge_targets) * 2 + edge_kinds
+        _, first = np.unique(edge_codes, return_index=True) # Sorted by source node, which is the CSR order
+        self.targets = edge_targets[first].astype(np.int32)
+        self.edge_kinds = edge_kinds[first]
+        self.edge_colors = edge_colors[first]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(edge_sources[first], minlength=num_nodes))])
+        self.is_inline_node = np.zeros(num_nodes, dtype=bool)
+        self.is_inline_node[self.targets[self.edge_kinds == MATING]] = True
+
+    def __len__(self):
+        return len(self.node_connectors)
+
+    def node(self, connector_name, cavity):
+        return self.node_index.get(f"{connector_name}\t{cavity}")
+
+    def cavities_of(self, connector_name):
+        return [self.node_cavities[i] for i in self.connector_node_ids.get(connector_name, [])]
+
+    def _edges(self, node_id):
+        start, end = self.indptr[node_id], self.indptr[node_id + 1]
+        return zip(self.targets[start:end], self.edge_kinds[start:end], self.edge_colors[start:end])
+
+    def neighbors(self, connector_name, cavity=None):
+        # "What connects to X": one row per wire/mating edge of the connector (or of one of its cavities)
+        if cavity is None:
+            node_ids = self.connector_node_ids.get(connector_name, [])
+        else:
+            node_id = self.node(connector_name, cavity)
+            node_ids = [] if node_id is None else [node_id]
+        rows = []
+        for node_id in node_ids:
+            for target, kind, color in self._edges(node_id):
+                rows.append({
+                    "cavity": self.node_cavities[node_id], "via": EDGE_KIND_NAMES[kind], "wire_color": color,
+                    "to_connector": self.node_connectors[target], "to_cavity": self.node_cavities[target],
+                })
+        return pd.DataFrame(rows, columns=["cavity", "via", "wire_color", "to_connector", "to_cavity"])
+
+    def trace(self, connector_name, cavity):
+        # Follows the circuit from one cavity: along its wires, through inline connectors (wire -> mating half ->
+        # wire ...) and stops at the first non-inline cavity on each branch, which is an endpoint.
+        # Returns the visited cavities in breadth-first order, each with the hop that reached it.
+        start = self.node(connector_name, cavity)
+        columns = ["step", "connector", "cavity", "via", "wire_color", "from_connector", "from_cavity", "endpoint"]
+        if start is None:
+            return pd.DataFrame([], columns=columns)
+        rows = [{"step": 0, "connector": connector_name, "cavity": cavity, "via": None, "wire_color": None,
+                 "from_connector": None, "from_cavity": None, "endpoint": not self.is_inline_node[start]}]
+        visited = {start}
+        frontier = [start]
+        step = 0
+        while frontier:
+            step += 1
+            next_frontier = []
+            for node_id in frontier:
+                for target, kind, color in self._edges(node_id):
+                    if target in visited:
+                        continue
+                    visited.add(target)
+                    # Keep going through inline connectors: after a wire, cross to the mating half; after mating, follow its wires
+                    continues = self.is_inline_node[target]
+                    rows.append({
+                        "step": step, "connector": self.node_connectors[target], "cavity": self.node_cavities[target],
+                        "via": EDGE_KIND_NAMES[kind], "wire_color": color,
+                        "from_connector": self.node_connectors[node_id], "from_cavity": self.node_cavities[node_id],
+                        "endpoint": not continues,
+                    })
+                    if continues:
+                        next_frontier.append(target)
+            frontier = next_frontier
+        trace = pd.DataFrame(rows, columns=columns)
+        if len(trace) == 1:
+            trace.loc[0, "endpoint"] = True # Nothing attached: the start cavity is the only end of its circuit
+        return trace
+
+    def endpoints(self, connector_name, cavity):
+        trace = self.trace(connector_name, cavity)
+        return trace[trace["endpoint"]]
+
+
+def build_harness_graph(connectors_df, cavities_df):
+    return HarnessGraph(connectors_df["name"].to_numpy(dtype=object), cavities_df)
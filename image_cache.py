@@ -0,0 +1,365 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError: # Pillow is in requirements.txt; without it the app shows the full-size images in place of thumbnails
+    Image = None
+
+import connector_store
+
+IMAGE_CACHE_DIR = ".image_cache"
+MAX_CACHE_BYTES = 512 * 1024 * 1024 # Full-size images + thumbnails; least recently used files go first
+EVICT_TO_FRACTION = 0.9 # Evict down to this share of the cap, so eviction doesn't run on every download
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+ICON_SIZE = (64, 64) # Inline images in table cells
+RESIZABLE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp") # Others (the .svg face views) scale in the browser
+PREFETCH_WORKERS = 8
+REQUEST_TIMEOUT = 30 # Seconds, for the scraper's prefetch
+ON_DEMAND_TIMEOUT = 5 # Seconds, for the app's background downloads
+BACKGROUND_WORKERS = 2 # Concurrent background downloads of images a page asked for
+FAILED_RETRY_SECONDS = 300 # Don't retry a failed on-demand download (e.g. offline) on every rerun
+MAX_ICONS = 4096 # Data URIs kept in memory (a few KB each); least recently used go first
+
+headers = {
+    "User-Agent": "curl/8.7.1", # Same as the scraper
+    "Accept": "*/*"
+}
+
+
+def image_extension(url):
+    extension = posixpath.splitext(urlsplit(url).path)[1].lower()
+    return extension if extension and len(extension) <= 5 else ".bin"
+
+
+def program_image_urls(program_files):
+    # Distinct image URLs of the given program JSON files, in file order
+    urls = {}
+    for path in program_files:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for connector in data.get("connectors") or []:
+            for url in connector.get("image_urls") or []:
+                urls[url] = None
+    return list(urls)
+
+
+# --- Image cache ---
+# index.json maps every image URL to the sha256 of its content. Files are stored by that hash,
+# full/<sha256><ext> and thumbs/<sha256><ext>, so an image published under several URLs (the same
+# face view in several programs) is stored and thumbnailed once. A file's mtime is its last use:
+# every hit touches it, and when the files exceed max_bytes the least recently used are deleted.
+# Index entries outlive their files; an evicted image is downloaded again when it is next asked for.
+# If the cache directory can't be created or written (read-only or full disk), nothing is cached and
+# callers fall back to the source URLs.
+class ImageCache:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=MAX_CACHE_BYTES, session=None, timeout=REQUEST_TIMEOUT,
+                 max_icons=MAX_ICONS):
+        self.cache_dir = cache_dir
+        self.full_dir = os.path.join(cache_dir, "full")
+        self.thumb_dir = os.path.join(cache_dir, "thumbs")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.error = None # Why the cache can't store anything, if it can't
+        try:
+            os.makedirs(self.full_dir, exist_ok=True)
+            os.makedirs(self.thumb_dir, exist_ok=True)
+        except OSError as e:
+            self.error = str(e)
+        self.max_bytes = max_bytes
+        self.max_icons = max_icons
+        self.session = session
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.index = {}
+        self.index_mtime_ns = None
+        self.index_changed = False
+        self.failed = {} # url -> time of the last failed download
+        self.total_bytes = 0
+        self.counts = {"downloaded": 0, "duplicates": 0, "failed": 0, "thumbnail_failed": 0, "evicted": 0,
+                       "index_save_failed": 0}
+        self.pending = set() # URLs queued for a background download
+        self.executor = None
+        self.icons = OrderedDict() # sha256 -> data URI, least recently used first; content-addressed, so never stale
+        self.refresh()
+
+    def refresh(self):
+        # Picks up what another process (the scraper's prefetch, another app server) added to index.json
+        try:
+            mtime_ns = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is not None and mtime_ns == self.index_mtime_ns:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            stored = {}
+        total_bytes = sum(size for _, size, _ in self._cached_files())
+        with self.lock:
+            self.index.update(stored)
+            self.index_mtime_ns = mtime_ns
+            self.total_bytes = total_bytes
+            self.failed = {url: failed_at for url, failed_at in self.failed.items() if url not in stored}
+
+    def _cached_files(self):
+        files = []
+        for directory in (self.full_dir, self.thumb_dir):
+            try:
+                entries = list(os.scandir(directory))
+            except OSError: # Cache directory missing (see self.error)
+                continue
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _get_session(self):
+        if self.session is None:
+            self.session = requests.Session()
+            self.session.headers.update(headers)
+        return self.session
+
+    def _full_path(self, entry):
+        return os.path.join(self.full_dir, entry["sha256"] + entry["ext"])
+
+    def _thumbnail_path(self, entry):
+        if Image is None or entry["ext"] not in RESIZABLE_EXTENSIONS:
+            return self._full_path(entry)
+        return os.path.join(self.thumb_dir, entry["sha256"] + (".png" if entry["ext"] == ".png" else ".jpg"))
+
+    def _write(self, path, content):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.total_bytes += len(content)
+
+    def _make_thumbnail(self, full_path, thumb_path):
+        with Image.open(full_path) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if thumb_path.endswith(".jpg") and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format="PNG" if thumb_path.endswith(".png") else "JPEG", quality=THUMBNAIL_QUALITY)
+        os.replace(tmp_path, thumb_path)
+        with self.lock:
+            self.total_bytes += os.path.getsize(thumb_path)
+
+    def put(self, url, content):
+        # Stores a downloaded image under its content hash and makes its thumbnail; returns its index entry
+        entry = {"sha256": hashlib.sha256(content).hexdigest(), "ext": image_extension(url)}
+        full_path = self._full_path(entry)
+        if os.path.exists(full_path):
+            self.count("duplicates")
+        else:
+            self._write(full_path, content)
+            self.count("downloaded")
+        thumb_path = self._thumbnail_path(entry)
+        if not os.path.exists(thumb_path):
+            try:
+                self._make_thumbnail(full_path, thumb_path)
+            except Exception: # Not a readable image; thumbnail() falls back to the full-size file
+                self.count("thumbnail_failed")
+        with self.lock:
+            self.index[url] = entry
+            self.index_changed = True
+        self.evict()
+        return entry
+
+    def fetch(self, url):
+        resp = self._get_session().get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        return self.put(url, resp.content)
+
+    def _lookup(self, url, fetch):
+        # Index entry with its full-size file present (downloading it if allowed), else None
+        entry = self.index.get(url)
+        if entry is not None and os.path.exists(self._full_path(entry)):
+            return entry
+        if not fetch or self.error is not None or time.monotonic() - self.failed.get(url, float("-inf")) < FAILED_RETRY_SECONDS:
+            return None
+        try:
+            return self.fetch(url)
+        except (requests.exceptions.RequestException, OSError):
+            with self.lock: # Background downloads fail concurrently with refresh() rebuilding the map
+                self.failed[url] = time.monotonic()
+                self.counts["failed"] += 1
+            return None
+
+    def fetch_in_background(self, url):
+        # Queues the download of an image that isn't cached, for a later lookup; returns at once
+        with self.lock:
+            if url in self.pending or self.error is not None:
+                return
+            self.pending.add(url)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS)
+        self.executor.submit(self._background_fetch, url)
+
+    def _background_fetch(self, url):
+        try:
+            self._lookup(url, fetch=True)
+        finally:
+            with self.lock:
+                self.pending.discard(url)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return path
+        except OSError: # Evicted meanwhile
+            return None
+
+    def thumbnail(self, url, fetch=True):
+        # Local path of the image's thumbnail, or None if it isn't cached and can't be downloaded
+        self.refresh()
+        entry = self.index.get(url)
+        if entry is not None and os.path.exists(self._thumbnail_path(entry)):
+            return self._touch(self._thumbnail_path(entry))
+        entry = self._lookup(url, fetch)
+        if entry is None:
+            return None
+        thumb_path = self._thumbnail_path(entry)
+        if not os.path.exists(thumb_path): # Thumbnail evicted, full-size image still there
+            try:
+                self._make_thumbnail(self._full_path(entry), thumb_path)
+            except Exception:
+                return self._touch(self._full_path(entry))
+        return self._touch(thumb_path)
+
+    def image(self, url, fetch=True):
+        # Local path of the full-size image, or None if it isn't cached and can't be downloaded
+        self.refresh()
+        entry = self._lookup(url, fetch)
+        return None if entry is None else self._touch(self._full_path(entry))
+
+    def icon_data_uri(self, url):
+        # Small data: URI of a cached image, for table cells; None if it isn't cached (never downloads)
+        path = self.thumbnail(url, fetch=False)
+        if path is None:
+            return None
+        sha256 = self.index[url]["sha256"]
+        with self.lock:
+            icon = self.icons.get(sha256)
+            if icon is not None:
+                self.icons.move_to_end(sha256)
+                return icon
+        if path.endswith(".svg"):
+            with open(path, "rb") as f:
+                content, mime_type = f.read(), "image/svg+xml"
+        elif Image is not None:
+            try:
+                with Image.open(path) as image:
+                    image.thumbnail(ICON_SIZE)
+                    buffer = io.BytesIO()
+                    image.convert("RGB").save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+            except Exception:
+                return None
+            content, mime_type = buffer.getvalue(), "image/jpeg"
+        else:
+            return None
+        icon = f"data:{mime_type};base64," + base64.b64encode(content).decode("ascii")
+        with self.lock:
+            self.icons[sha256] = icon
+            while len(self.icons) > self.max_icons:
+                self.icons.popitem(last=False)
+        return icon
+
+    def evict(self):
+        with self.lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            target = self.max_bytes * EVICT_TO_FRACTION
+            for _, size, path in sorted(self._cached_files()):
+                if self.total_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.total_bytes -= size
+                self.counts["evicted"] += 1
+
+    def save_index(self):
+        if not self.index_changed:
+            return
+        self.refresh() # Merge first, so entries another process saved meanwhile aren't dropped
+        with self.lock:
+            tmp_path = f"{self.index_path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.index, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path)
+                self.index_mtime_ns = os.stat(self.index_path).st_mtime_ns
+            except OSError:
+                # Read-only or full disk: the entries still serve this process, and the next save retries
+                self.counts["index_save_failed"] += 1
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+            self.index_changed = False
+
+    def prefetch(self, urls, workers=PREFETCH_WORKERS):
+        # Downloads every URL that isn't cached yet, `workers` at a time; returns the number of URLs fetched
+        if self.error is not None:
+            return 0
+        missing = [url for url in dict.fromkeys(urls) if self._lookup(url, fetch=False) is None]
+        def fetch(url):
+            try:
+                self.fetch(url)
+            except (requests.exceptions.RequestException, OSError) as e:
+                self.count("failed")
+                print(f"Failed to download image {url}: {e}")
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for _ in executor.map(fetch, missing):
+                    pass
+        finally:
+            self.save_index()
+        return len(missing)
+
+    def summary(self):
+        if self.error is not None:
+            return f"Image cache {self.cache_dir} unavailable, nothing was cached: {self.error}"
+        counts = self.counts
+        return (f"{counts['downloaded']} images downloaded, {counts['duplicates']} duplicates of cached content, "
+                f"{counts['failed']} failed, {counts['thumbnail_failed']} without a thumbnail, {counts['evicted']} files evicted; "
+                f"cache {self.total_bytes / 2**20:.1f} of {self.max_bytes / 2**20:.0f} MB in {self.cache_dir}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download the images of every program in the manifest into the local image cache.")
+    parser.add_argument("--cache-dir", default=IMAGE_CACHE_DIR, help="Image cache directory.")
+    parser.add_argument("--max-size", type=float, default=MAX_CACHE_BYTES / 2**20, help="Cache size cap in MB.")
+    parser.add_argument("--workers", type=int, default=PREFETCH_WORKERS, help="Concurrent downloads.")
+    args = parser.parse_args()
+
+    program_metadata, _ = connector_store.refresh_manifest()
+    image_urls = program_image_urls([meta["filename"] for meta in program_metadata])
+    cache = ImageCache(args.cache_dir, int(args.max_size * 2**20))
+    print(f"{len(image_urls)} distinct image URLs in {len(program_metadata)} programs; "
+          f"{cache.prefetch(image_urls, args.workers)} not cached yet.")
+    print(cache.summary())
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+QGRAM_SIZE = 2
+MAX_RESULTS = 50
+MAX_EDIT_FRACTION = 3 # At most one edit per this many query characters, so short queries don't match everything
+
+
+def normalize_part_number(value):
+    # Case and surrounding whitespace never matter when reading a part number off a connector
+    return value.strip().upper() if isinstance(value, str) else ""
+
+
+def qgrams(value, q=QGRAM_SIZE):
+    # Padded so the first and last characters get as many grams as the inner ones
+    padded = "^" * (q - 1) + value + "$" * (q - 1)
+    return {padded[i:i + q] for i in range(len(padded) - q + 1)}
+
+
+def edit_distance(a, b, max_distance=None):
+    # Levenshtein distance; with max_distance, gives up (returns max_distance + 1) once it is exceeded
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+# --- Q-gram index ---
+# Inverted index from q-grams to the distinct values containing them. A value within k edits of the query
+# shares at least (distinct grams of the query - k * q) grams with it, since one edit touches at most q grams,
+# so counting shared grams with one bincount narrows the table to a few candidates. Only those get the
+# (comparatively slow) exact edit distance.
+class QGramIndex:
+    def __init__(self, values, q=QGRAM_SIZE):
+        # values: normalized strings; several may be equal (their ids are all returned by lookups)
+        self.q = q
+        self.values, self.value_ids = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        self.lengths = np.array([len(value) for value in self.values], dtype=np.int32)
+        postings = {}
+        for value_id, value in enumerate(self.values):
+            for gram in qgrams(value, q):
+                postings.setdefault(gram, []).append(value_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        # Entry ids (positions in `values`) per distinct value
+        order = np.argsort(self.value_ids, kind="stable")
+        self.value_entries = np.split(order, np.cumsum(np.bincount(self.value_ids, minlength=len(self.values)))[:-1])
+
+    def search(self, query, max_distance):
+        # [(value, distance, entry ids)] for every indexed value within max_distance edits of query
+        query = normalize_part_number(query)
+        if not query or not len(self.values):
+            return []
+        query_grams = qgrams(query, self.q)
+        length_ok = np.abs(self.lengths - len(query)) <= max_distance
+        min_shared = len(query_grams) - max_distance * self.q
+        if min_shared > 0:
+            hits = [self.postings[gram] for gram in query_grams if gram in self.postings]
+            shared = np.bincount(np.concatenate(hits), minlength=len(self.values)) if hits else np.zeros(len(self.values), dtype=np.int64)
+            candidates = np.flatnonzero(length_ok & (shared >= min_shared))
+        else:
+            # Query too short for the gram filter to prune anything; the length filter still applies
+            candidates = np.flatnonzero(length_ok)
+        matches = []
+        for value_id in candidates:
+            distance = edit_distance(query, self.values[value_id], max_distance)
+            if distance <= max_distance:
+                matches.append((self.values[value_id], distance, self.value_entries[value_id]))
+        return matches
+
+
+# --- Part number index ---
+# Fuzzy lookup over a prepared program table (one program or the combined all-programs table) on the
+# Tesla part number and on the connector part number, both as the full "MANUFACTURER PN" string and
+# as its individual words, so "K30M00121" finds "KSE K30M00121".
+class PartNumberIndex:
+    def __init__(self, df):
+        self.df = df
+        # Each index holds (value, df row) entries; connectors without a part number get none
+        tesla_values = [normalize_part_number(value) for value in df["tesla_part_number_str"]]
+        self.tesla_rows = np.array([row for row, value in enumerate(tesla_values) if value], dtype=np.int64)
+        self.tesla_index = QGramIndex([value for value in tesla_values if value])
+        connector_values = []
+        connector_rows = []
+        for row, value in enumerate(df["connector_part_number_full"]):
+            value = normalize_part_number(value)
+            for word in set(value.split()) | {value}:
+                if word:
+                    connector_values.append(word)
+                    connector_rows.append(row)
+        self.connector_index = QGramIndex(connector_values)
+        self.connector_rows = np.array(connector_rows, dtype=np.int64)
+
+    def search(self, query, max_distance=2, limit=MAX_RESULTS):
+        # Ranked matches: closest first, Tesla part numbers before connector part numbers on ties,
+        # then table order (which is program order for the combined table). One row per connector.
+        max_distance = min(max_distance, len(normalize_part_number(query)) // MAX_EDIT_FRACTION)
+        matches = []
+        for value, distance, entries in self.tesla_index.search(query, max_distance):
+            matches.append((self.tesla_rows[entries], "Tesla part number", value, distance))
+        for value, distance, entries in self.connector_index.search(query, max_distance):
+            matches.append((self.connector_rows[entries], "Connector part number", value, distance))
+        if not matches:
+            return self.df.iloc[:0].assign(matched_field=[], matched_value=[], distance=[])
+
+        rows = np.concatenate([match[0] for match in matches])
+        found = pd.DataFrame({
+            "row": rows,
+            "matched_field": np.repeat([match[1] for match in matches], [len(match[0]) for match in matches]),
+            "matched_value": np.repeat([match[2] for match in matches], [len(match[0]) for match in matches]),
+            "distance": np.repeat([match[3] for match in matches], [len(match[0]) for match in matches]),
+        })
+        found = found.sort_values(["distance", "matched_field", "row"], ascending=[True, False, True], kind="stable")
+        found = found.drop_duplicates("row").head(limit)
+        results = self.df.iloc[found["row"].to_numpy()].copy()
+        for column in ("matched_field", "matched_value", "distance"):
+            results[column] = found[column].to_numpy()
+        return results
+
+
+def build_part_number_index(prepared):
+    return PartNumberIndex(prepared.df)
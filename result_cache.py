@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import connector_index
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024 # Row index arrays across all entries; least recently used go first
+MAX_SUPERSET_CANDIDATES = 64 # Most recently used entries of a program considered for narrowing
+RANGE_FILTERS = ( # (filter, prepared program attribute with its upper end, bound type)
+    ("total_cavities", "max_total_cavities", int),
+    ("num_connected_cavities", "max_connected_cavities", int),
+    ("num_unconnected_cavities", "max_unconnected_cavities", int),
+    ("max_wire_size", "largest_wire_size", float),
+)
+SUBSTRING_FILTERS = ("tesla_part_number", "manufacturer_or_connector")
+
+
+def normalize_filters(prepared, filters):
+    # Hashable key for a filter dict (see connector_index.compute_filter_mask), with filters that can't
+    # exclude anything dropped, so e.g. untouched sliders and "any color" give the same key as no filter.
+    # dict(key) is again a valid filter dict.
+    key = []
+    for name, max_attribute, bound_type in RANGE_FILTERS:
+        bounds = filters.get(name)
+        if bounds is not None and (bounds[0] > 0 or bounds[1] < getattr(prepared, max_attribute)):
+            key.append((name, (bound_type(bounds[0]), bound_type(bounds[1]))))
+    for name in SUBSTRING_FILTERS:
+        if filters.get(name):
+            key.append((name, filters[name].upper()))
+    if filters.get("body_color"):
+        key.append(("body_color", filters["body_color"]))
+    wire_color_counts = sorted(set(
+        (color, int(min_count), int(max_count)) for color, min_count, max_count in filters.get("wire_color_counts", [])
+        if min_count > 0 or max_count < prepared.max_total_cavities # No connector has more cavities of a color than in total
+    ))
+    if wire_color_counts:
+        key.append(("wire_color_counts", tuple(wire_color_counts)))
+    return tuple(key)
+
+
+def subsumes(broad, narrow):
+    # True if every row matching the `narrow` key also matches `broad`, so narrow can be evaluated on broad's rows
+    narrow = dict(narrow)
+    for name, value in broad:
+        if name not in narrow:
+            return False
+        if value == narrow[name]:
+            continue
+        if name in SUBSTRING_FILTERS:
+            # Terms match literally, so a term containing a broader one only matches a subset of its rows
+            if value not in narrow[name]:
+                return False
+        elif name == "wire_color_counts":
+            for color, min_count, max_count in value:
+                if not any(c == color and lo >= min_count and hi <= max_count for c, lo, hi in narrow[name]):
+                    return False
+        elif name == "body_color":
+            return False
+        elif not (narrow[name][0] >= value[0] and narrow[name][1] <= value[1]):
+            return False
+    return True
+
+
+# --- Result cache ---
+# Process-wide (the app keeps one in st.cache_resource, shared by every session): maps
+# (program content hash, normalized filter key) to the matching row positions of the prepared program.
+# An exact key is served as is. Otherwise the smallest cached result of a broader filter on the same
+# program (e.g. the same search before a slider was tightened or a character was typed) is narrowed,
+# which only evaluates the filters on its rows. Entries are int32 arrays, evicted least recently used
+# beyond max_bytes. Only the program's max_superset_candidates most recently used entries are checked for
+# a superset, so a lookup stays cheap however many entries the cap allows.
+class ResultCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_superset_candidates=MAX_SUPERSET_CANDIDATES):
+        self.max_bytes = max_bytes
+        self.max_superset_candidates = max_superset_candidates
+        self.entries = OrderedDict() # (program key, filter key) -> row positions, least recently used first
+        self.program_entries = {} # program key -> OrderedDict of its filter keys, least recently used first
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "narrowed": 0, "misses": 0, "evictions": 0, "rows_scanned": 0, "rows_skipped": 0}
+
+    def _touch(self, key):
+        self.entries.move_to_end(key)
+        self.program_entries[key[0]].move_to_end(key[1])
+
+    def _smallest_superset(self, program_key, filter_key):
+        best = None
+        for position, entry_filters in enumerate(reversed(self.program_entries.get(program_key, ()))):
+            if position == self.max_superset_candidates:
+                break
+            rows = self.entries[(program_key, entry_filters)]
+            if (best is None or len(rows) < len(best[1])) and subsumes(entry_filters, filter_key):
+                best = ((program_key, entry_filters), rows)
+        return best
+
+    def rows(self, program_key, prepared, filters):
+        # Row positions in prepared.df matching `filters`, and how they were found: "hit", "narrowed" or "miss"
+        filter_key = normalize_filters(prepared, filters)
+        key = (program_key, filter_key)
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is not None:
+                self._touch(key)
+                self.stats["hits"] += 1
+                self.stats["rows_skipped"] += len(prepared)
+                return rows, "hit"
+            superset = self._smallest_superset(program_key, filter_key)
+            if superset is not None:
+                self._touch(superset[0])
+
+        if superset is None:
+            rows = np.flatnonzero(connector_index.compute_filter_mask(prepared, dict(filter_key))).astype(np.int32)
+            source, scanned = "miss", len(prepared)
+        else:
+            candidates = superset[1]
+            rows = candidates[connector_index.compute_filter_mask(prepared, dict(filter_key), candidates)]
+            source, scanned = "narrowed", len(candidates)
+        rows.flags.writeable = False # Shared between sessions
+
+        with self.lock:
+            self.stats["misses" if source == "miss" else "narrowed"] += 1
+            self.stats["rows_scanned"] += scanned
+            self.stats["rows_skipped"] += len(prepared) - scanned
+            if key not in self.entries:
+                self.entries[key] = rows
+                self.program_entries.setdefault(program_key, OrderedDict())[filter_key] = None
+                self.nbytes += rows.nbytes
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                (evicted_program, evicted_filters), evicted = self.entries.popitem(last=False)
+                del self.program_entries[evicted_program][evicted_filters]
+                if not self.program_entries[evicted_program]:
+                    del self.program_entries[evicted_program]
+                self.nbytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+        return rows, source
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), nbytes=self.nbytes)
+        lookups = stats["hits"] + stats["narrowed"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["narrowed"]) / lookups if lookups else 0.0
+        return stats
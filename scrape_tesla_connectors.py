@@ -1,11 +1,44 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+import argparse
+import bisect
+import hashlib
 import json
+import mmap
+import os
+import queue
+import random
+import signal
+import sys
+import threading
 import time
-from urllib.parse import urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlsplit
+import connector_store
+import image_cache
 
 ROOT_URL = "https://service.tesla.com"
+# Connector index page of a program; every connector page is linked from its sidebar
+PROGRAM_INDEX_PATH = "/docs/{model}/ElectricalReference/{prog_id}/connector/g011/index.html"
+OUTPUT_DIR = "connectors"
+PAGE_CACHE_DIR = ".page_cache"  # Validators + parsed result per connector page, for incremental re-scrapes
+PARSER_VERSION = 1  # Bump on any change to parse_connector_html, so cached parses are not reused
+
+# Fetch engine settings (overridable from the command line)
+MAX_WORKERS = 16  # Upper bound on concurrent page fetches, shared by all programs (see ConcurrencyController)
+MAX_RATE = None  # Requests per second per host; None leaves it to the concurrency controller
+PARSE_WORKERS = os.cpu_count() or 1  # Parser processes; 0 parses inside the fetch threads
+REQUEST_TIMEOUT = 30  # Seconds per request
+MAX_RETRIES = 4  # Extra attempts for timeouts, connection errors, 429 and 5xx responses
+RETRY_BASE_DELAY = 0.5  # Seconds; backoff doubles per attempt, with full jitter
+RETRY_MAX_DELAY = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+METRICS_FILENAME = "scrape_metrics.json"  # Written to the output directory at the end of every run (see --metrics)
+# Histogram bucket upper bounds in seconds for the metrics file; a last bucket catches everything above
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
 
 # Set this to None to scrape all connectors, or to an integer for testing
 CONNECTOR_LIMIT = None  # Set to None for no limit
@@ -165,13 +198,53 @@ headers = {
     "Accept": "*/*"
 }
 
-def get_soup(url):
-    resp = requests.get(url, headers=headers)
+# --- HTTP session ---
+# One pooled session for the whole run so every page reuses a kept-alive connection
+# instead of paying a new TCP/TLS handshake.
+def make_session(pool_size=MAX_WORKERS):
+    session = requests.Session()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_default_session = None
+
+def get_session():
+    global _default_session
+    if _default_session is None:
+        _default_session = make_session()
+    return _default_session
+
+def fetch_page_response(url, session=None, cached=None):
+    # With a page cache entry, ask the server to answer 304 Not Modified if the page is unchanged
+    request_headers = {}
+    if cached:
+        if cached.get("etag"):
+            request_headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            request_headers["If-Modified-Since"] = cached["last_modified"]
+    resp = (session or get_session()).get(url, headers=request_headers, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    return BeautifulSoup(resp.text, "html.parser")
+    return resp
+
+def fetch_page_bytes(url, session=None):
+    # Raw body plus the encoding requests would have used for resp.text
+    resp = fetch_page_response(url, session)
+    return resp.content, resp.encoding
+
+def decode_page(content, encoding):
+    return str(content, encoding or "utf-8", errors="replace")
+
+def fetch_page(url, session=None):
+    return decode_page(*fetch_page_bytes(url, session))
 
-def get_connector_links(main_url):
-    soup = get_soup(main_url)
+def get_soup(url, session=None):
+    return BeautifulSoup(fetch_page(url, session), "html.parser")
+
+def get_connector_links(main_url, session=None):
+    soup = get_soup(main_url, session)
     # Find the sidebar navigation
     aside = soup.find("aside", class_="tds-layout-item tds-layout-aside")
     if not aside:
@@ -188,8 +261,21 @@ def get_connector_links(main_url):
         connector_links.append(full_url)
     return connector_links
 
-def parse_connector_page(url):
-    soup = get_soup(url)
+def parse_connector_page(url, session=None):
+    return parse_connector_html(url, fetch_page(url, session))
+
+def init_parse_worker():
+    # Ctrl-C reaches the whole process group; leave it to the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def parse_page_content(url, content, encoding):
+    # Parse-stage entry point, runs in a worker process; returns the connector and the parse time
+    parse_start = time.perf_counter()
+    data = parse_connector_html(url, decode_page(content, encoding))
+    return data, time.perf_counter() - parse_start
+
+def parse_connector_html(url, html):
+    soup = BeautifulSoup(html, "html.parser")
     data = {"url": url}
     # Extract connector name from the main content section
     main_section = soup.find("section", class_="tds-layout-item tds-layout-main")
@@ -259,87 +345,895 @@ def parse_connector_page(url):
     data["image_urls"] = img_urls
     return data
 
-def main():
-    for prog_info in PROG_DETAILS_LIST:
-        model_name = prog_info["model"]
-        current_prog_id = prog_info["prog_id"]
-        sop_info = prog_info["sop"]
-        build_info = prog_info["build_information"]
+def program_index_url(prog_info, root_url=ROOT_URL):
+    return root_url.rstrip("/") + PROGRAM_INDEX_PATH.format(model=prog_info["model"], prog_id=prog_info["prog_id"])
+
+def connector_name_for_log(url, data):
+    if data and data.get('name'):
+        return data['name']
+    path_parts = [part for part in url.split('/') if part]
+    if len(path_parts) >= 2 and path_parts[-1].lower() == "index.html":
+        return path_parts[-2]
+    if path_parts:
+        return path_parts[-1]
+    return "Unknown"
+
+def program_filename(prog_info, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, f"connectors_{prog_info['model']}_{prog_info['prog_id']}.json")
+
+def save_program(prog_info, scraped_connectors_data, output_dir=OUTPUT_DIR):
+    model_name = prog_info["model"]
+    current_prog_id = prog_info["prog_id"]
+
+    # Prepare the final JSON structure
+    output_data = {
+        "model": model_name,
+        "prog_id": current_prog_id,
+        "sop": prog_info["sop"],
+        "build_information": prog_info["build_information"],
+        "connectors": scraped_connectors_data
+    }
+
+    output_filename = program_filename(prog_info, output_dir)
+    output_text = json.dumps(output_data, indent=2, ensure_ascii=False)
+    try:
+        with open(output_filename, "r", encoding="utf-8") as f:
+            if f.read() == output_text:
+                print(f"No changes for {model_name} {current_prog_id}, keeping {output_filename}")
+                return output_filename
+    except FileNotFoundError:
+        pass
+    # Write next to the target and swap it in, so the app never reads a half-written program file
+    tmp_filename = output_filename + ".tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        f.write(output_text)
+    os.replace(tmp_filename, output_filename)
+    print(f"Saved data for {model_name} {current_prog_id} to {output_filename}")
+    # Keep the app's manifest in sync so it never has to parse this file at startup
+    manifest_entry = connector_store.update_manifest_entry(output_filename, os.path.join(output_dir, "manifest.json"))
+    if manifest_entry.get("num_issues"):
+        print(f"Warning: {manifest_entry['num_issues']} malformed records in {output_filename}, e.g. {manifest_entry['issues'][0]}")
+    if "error" in manifest_entry:
+        print(f"Warning: {output_filename} is not a valid program file: {manifest_entry['error']}")
+    dedup_dir = os.path.join(output_dir, "dedup")
+    if connector_store.dedup_store_in_use(dedup_dir):
+        # Programs are stored deduplicated here; a columnar copy would silently take precedence over the store
+        print(f"{dedup_dir} is in use; run 'python connector_store.py dedup' to add the new {output_filename} to it.")
+    elif connector_store.pa is not None:
+        columnar_dir = connector_store.write_columnar_program(output_filename, os.path.join(output_dir, "columnar"))
+        print(f"Wrote columnar tables for {model_name} {current_prog_id} to {columnar_dir}")
+    return output_filename
+
+# --- Rate control ---
+# The crawl runs as fast as the server tolerates: a ConcurrencyController adapts the number of
+# requests in flight (AIMD, like TCP congestion control), a per-host TokenBucket caps the request rate
+# and honors Retry-After, and failed requests are retried with jittered exponential backoff.
+# ThrottledSession wraps any session with all three, so crawl code just calls session.get().
+LATENCY_TOLERANCE = 2.0  # Back off when smoothed latency exceeds this multiple of the best seen so far
+LATENCY_SLACK = 0.1  # ... and is at least this many seconds above it (ignores jitter on fast local servers)
+
+def percentile(values, q):
+    # Nearest-rank percentile of an unsorted list, q in [0, 100]
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def histogram(values, bounds):
+    # Bucket counts (counts[i]: values <= bounds[i] and above the previous bound; the last bucket is the overflow)
+    # plus summary statistics, for the metrics file
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        counts[bisect.bisect_left(bounds, value)] += 1
+    return {
+        "bounds_seconds": list(bounds), "counts": counts, "count": len(values), "sum_seconds": sum(values),
+        "mean_seconds": sum(values) / len(values) if values else 0.0,
+        "p50_seconds": percentile(values, 50), "p90_seconds": percentile(values, 90), "p99_seconds": percentile(values, 99),
+        "max_seconds": max(values, default=0.0),
+    }
+
+def write_metrics(metrics, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metrics, f, indent=2)
+    os.replace(tmp_path, path)
+
+class ConcurrencyController:
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = min(min_limit, self.max_limit)
+        self.limit = float(min(4, self.max_limit))
+        self.slow_start = True # Grow by one per success (doubling per round trip) until the first backoff
+        self.in_flight = 0
+        self.smoothed_latency = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.decreases = 0
+        self.peak_limit = self.limit
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, congested=False):
+        # latency: seconds of a successful request; congested: it was throttled, errored or timed out
+        with self.condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self.smoothed_latency = latency if self.smoothed_latency is None else 0.8 * self.smoothed_latency + 0.2 * latency
+                self.best_latency = min(self.best_latency or self.smoothed_latency, self.smoothed_latency)
+                threshold = max(self.best_latency * LATENCY_TOLERANCE, self.best_latency + LATENCY_SLACK)
+                congested = congested or self.smoothed_latency > threshold
+            if congested:
+                self._decrease()
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + (1 if self.slow_start else 1 / self.limit))
+                self.peak_limit = max(self.peak_limit, self.limit)
+            self.condition.notify_all()
+
+    def _decrease(self):
+        # At most one multiplicative decrease per round trip, since one overload fails many requests at once
+        now = time.monotonic()
+        if now - self.last_decrease < (self.smoothed_latency or 1.0):
+            return
+        self.last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit / 2)
+        self.decreases += 1
+
+class TokenBucket:
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate # Tokens per second; None means unlimited (Retry-After pauses still apply)
+        self.capacity = burst or max(rate or 1, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if wait <= 0 and self.rate is None:
+                    return
+                if wait <= 0:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+def retry_after_seconds(resp):
+    # Retry-After in its delta-seconds form; HTTP-date values fall back to the regular backoff
+    try:
+        return max(0.0, float(resp.headers.get("Retry-After", "")))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+class ThrottledSession:
+    # Same get() interface as requests.Session; failures that exhaust the retries are returned/raised as usual
+    def __init__(self, session, max_workers=MAX_WORKERS, max_rate=MAX_RATE, max_retries=MAX_RETRIES):
+        self.session = session
+        self.controller = ConcurrencyController(max_workers)
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.buckets = {} # host -> TokenBucket
+        self.lock = threading.Lock()
+        self.latencies = [] # Seconds per successful request
+        self.counts = {"requests": 0, "retries": 0, "throttled": 0, "server_errors": 0, "network_errors": 0}
+
+    def bucket_for(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.max_rate)
+            return self.buckets[host]
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def get(self, url, **kwargs):
+        bucket = self.bucket_for(url)
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            self.controller.acquire()
+            self.count("requests")
+            start = time.perf_counter()
+            try:
+                resp = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                self.controller.release(congested=True)
+                self.count("network_errors")
+                if attempt == self.max_retries:
+                    raise
+            except BaseException:
+                self.controller.release() # Not retried, but its slot is freed
+                raise
+            else:
+                latency = time.perf_counter() - start
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    self.controller.release(latency)
+                    with self.lock:
+                        self.latencies.append(latency)
+                    return resp
+                self.controller.release(congested=True)
+                self.count("throttled" if resp.status_code == 429 else "server_errors")
+                if attempt == self.max_retries:
+                    return resp
+                retry_after = retry_after_seconds(resp)
+                if retry_after is not None:
+                    bucket.pause(retry_after) # Holds back every request to this host, not just this one
+            self.count("retries")
+            time.sleep(backoff_delay(attempt))
+
+    def summary(self):
+        counts = self.counts
+        controller = self.controller
+        return [
+            f"Requests: {counts['requests']} ({counts['retries']} retries after {counts['throttled']} throttled (429), "
+            f"{counts['server_errors']} server errors, {counts['network_errors']} timeouts/connection errors), "
+            f"latency p50 {percentile(self.latencies, 50) * 1000:.0f} ms, p95 {percentile(self.latencies, 95) * 1000:.0f} ms",
+            f"Concurrency: ended at {int(controller.limit)}, peaked at {int(controller.peak_limit)} of max {controller.max_limit}, "
+            f"{controller.decreases} backoffs" + (f", rate capped at {self.max_rate:g} requests/s per host" if self.max_rate else ""),
+        ]
+
+    def metrics(self):
+        with self.lock:
+            counts = dict(self.counts)
+            latencies = list(self.latencies)
+        return {
+            "counts": counts,
+            "latency": histogram(latencies, LATENCY_BUCKETS), # Successful requests, one attempt each
+            "concurrency": {"final": int(self.controller.limit), "peak": int(self.controller.peak_limit),
+                            "max": self.controller.max_limit, "backoffs": self.controller.decreases},
+            "max_rate": self.max_rate,
+        }
+
+# --- Streaming program writer ---
+# Every scraped connector is appended to connectors_<Model>_<prog>.json.part (JSON Lines, flushed
+# per record) the moment it arrives, so nothing piles up in memory and a crash loses nothing.
+# The .part file doubles as the checkpoint: a re-run only queues the URLs it doesn't contain yet.
+# finalize() writes the regular program file atomically, in sidebar order, and removes the .part
+# file, so only interrupted runs leave one behind. Pages that failed after every retry are left out
+# of the program file and listed in connectors_<Model>_<prog>.json.failed.
+class PartialProgramFile:
+    def __init__(self, prog_info, output_dir=OUTPUT_DIR):
+        self.prog_info = prog_info
+        self.output_dir = output_dir
+        self.path = program_filename(prog_info, output_dir) + ".part"
+        self._file = None
+
+    def read_records(self):
+        records = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # Torn last line from an interrupted run
+                    records[record["url"]] = record["connector"]
+        except FileNotFoundError:
+            pass
+        return records
+
+    def completed_urls(self):
+        return set(self.read_records())
+
+    def append(self, url, connector):
+        if self._file is None:
+            os.makedirs(self.output_dir or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if not self._ends_with_newline():
+                # A crash mid-write left a torn last line; start a new one so the next record isn't glued onto it
+                self._file.write("\n")
+        self._file.write(json.dumps({"url": url, "connector": connector}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def finalize(self, connector_links):
+        self.close()
+        records = self.read_records()
+        failed_urls = [url for url in connector_links if url not in records]
+        output_filename = program_filename(self.prog_info, self.output_dir)
+        failed_path = output_filename + ".failed"
+        if failed_urls:
+            # Retries ran out for these pages; record them next to the program file for the next run to look at
+            with open(failed_path, "w", encoding="utf-8") as f:
+                json.dump(failed_urls, f, indent=2)
+            print(f"{len(failed_urls)} pages failed for {self.prog_info['prog_id']}; listed in {failed_path}.")
+        elif os.path.exists(failed_path):
+            os.remove(failed_path)
+        if len(failed_urls) == len(connector_links):
+            # Nothing scraped: keep whatever program file there is rather than replacing it with an empty one
+            self.discard()
+            return None
+        # Keep the sidebar order of the program rather than completion order
+        scraped_connectors_data = [records[url] for url in connector_links if url in records]
+        output_filename = save_program(self.prog_info, scraped_connectors_data, self.output_dir)
+        self.discard()
+        return output_filename
+
+# --- Page cache ---
+# One small JSON file per connector URL holding the ETag / Last-Modified validators, the sha256 of
+# the body and the connector parsed from it. A re-scrape sends conditional GETs and reuses the
+# cached connector on 304, or when a full response has the same body hash, without parsing.
+# Entries record the PARSER_VERSION they were parsed with; entries of any other version are ignored, so
+# after a parser change every page is downloaded and parsed again once.
+class PageCache:
+    def __init__(self, cache_dir=PAGE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
 
-        print(f"\n--- Processing {model_name} {current_prog_id} ({sop_info}) ---")
-        base_url_for_prog = f"https://service.tesla.com/docs/{model_name}/ElectricalReference/{current_prog_id}/connector/g011/index.html"
+    def get(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("url") != url or entry.get("parser_version") != PARSER_VERSION or not entry.get("connector"):
+            return None
+        return entry
+
+    def put(self, url, validators, connector):
+        entry = dict(validators, url=url, parser_version=PARSER_VERSION, connector=connector)
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+def page_validators(resp):
+    return {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "body_sha256": hashlib.sha256(resp.content).hexdigest(),
+    }
+
+# --- Page archive ---
+# Offline snapshot of every fetched page, so the parser can be re-run (or benchmarked) without
+# touching service.tesla.com. Append-only: pages.dat holds one zlib-compressed body per record and
+# index.jsonl one line per record with its URL, offset, length, body sha256 and encoding.
+# The last record for a URL wins; a half-written tail after a crash is ignored.
+class PageArchive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.data_path = os.path.join(archive_dir, "pages.dat")
+        self.index_path = os.path.join(archive_dir, "index.jsonl")
+        self.records = {} # url -> index record
+        self._lock = threading.Lock()
+        self._data_file = None
+        self._index_file = None
+        self._map = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[record["url"]] = record
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, url, content, encoding):
+        body_sha256 = hashlib.sha256(content).hexdigest()
+        compressed = zlib.compress(content, 6)
+        with self._lock:
+            previous = self.records.get(url)
+            if previous and previous["sha256"] == body_sha256:
+                return # Same snapshot already archived
+            if self._data_file is None:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                self._data_file = open(self.data_path, "ab")
+                self._index_file = open(self.index_path, "a", encoding="utf-8")
+            offset = self._data_file.seek(0, os.SEEK_END)
+            self._data_file.write(compressed)
+            self._data_file.flush()
+            record = {"url": url, "offset": offset, "length": len(compressed), "sha256": body_sha256,
+                      "encoding": encoding, "archived_at": time.time()}
+            self._index_file.write(json.dumps(record) + "\n")
+            self._index_file.flush()
+            self.records[url] = record
+
+    def read(self, url):
+        record = self.records.get(url)
+        if record is None:
+            return None
+        with self._lock:
+            if self._map is None:
+                with open(self.data_path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        content = zlib.decompress(self._map[record["offset"]:record["offset"] + record["length"]])
+        return content, record["encoding"]
+
+    def close(self):
+        for handle in (self._data_file, self._index_file, self._map):
+            if handle is not None:
+                handle.close()
+        self._data_file = self._index_file = self._map = None
+
+class ArchivedResponse:
+    # Just enough of requests.Response for fetch_page_response and its callers
+    def __init__(self, url, status_code, content=b"", encoding=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = {}
+
+    @property
+    def text(self):
+        return decode_page(self.content, self.encoding)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Not in archive: {self.url}", response=self)
+
+class ArchiveSession:
+    # Drop-in for the requests session in --replay mode: serves pages from a PageArchive, no network
+    def __init__(self, archive):
+        self.archive = archive
+
+    def get(self, url, headers=None, timeout=None):
+        page = self.archive.read(url)
+        if page is None:
+            return ArchivedResponse(url, 404)
+        return ArchivedResponse(url, 200, *page)
 
-        print(f"Fetching connector links for {model_name} {current_prog_id} from {base_url_for_prog}...")
+class RecordingSession:
+    # Wraps the live session and archives every full (200) response it returns
+    def __init__(self, session, archive):
+        self.session = session
+        self.archive = archive
+
+    def get(self, url, **kwargs):
+        resp = self.session.get(url, **kwargs)
+        if resp.status_code == 200:
+            self.archive.append(url, resp.content, resp.encoding)
+        return resp
+
+# --- Crawl statistics ---
+class CrawlStats:
+    def __init__(self):
+        self.start_time = time.time()
+        self.pages_fetched = 0
+        self.bytes_fetched = 0
+        self.fetch_seconds = 0.0
+        self.pages_parsed = 0
+        self.parse_seconds = 0.0
+        self.failures = 0
+        self.cache_statuses = {"not_modified": 0, "unchanged": 0}
+        # Per-page samples and per-program counters, for the metrics file
+        self.fetch_latencies = [] # Seconds per page, retries and throttling waits included
+        self.parse_times = [] # Seconds per parsed page
+        self.programs = {} # prog_id -> counters, see start_program
+
+    def start_program(self, prog_info, total, already_scraped):
+        self.programs[prog_info["prog_id"]] = {
+            "model": prog_info["model"], "sop": prog_info["sop"], "connectors": total, "resumed": already_scraped,
+            "pages_fetched": 0, "bytes_fetched": 0, "pages_parsed": 0, "parse_seconds": 0.0, "cache_hits": 0, "failures": 0,
+            "started": time.time(), "finished": None,
+        }
+
+    def finish_program(self, prog_id):
+        if prog_id in self.programs:
+            self.programs[prog_id]["finished"] = time.time()
+
+    def record_page(self, page, ok, prog_id=None):
+        # page: the per-page dict the fetch stage reports (see crawl_programs)
+        program = self.programs.get(prog_id)
+        if page.get("fetch_seconds") is not None:
+            self.pages_fetched += 1
+            self.bytes_fetched += page.get("bytes", 0)
+            self.fetch_seconds += page["fetch_seconds"]
+            self.fetch_latencies.append(page["fetch_seconds"])
+            if program:
+                program["pages_fetched"] += 1
+                program["bytes_fetched"] += page.get("bytes", 0)
+        if page.get("parse_seconds") is not None:
+            self.pages_parsed += 1
+            self.parse_seconds += page["parse_seconds"]
+            self.parse_times.append(page["parse_seconds"])
+            if program:
+                program["pages_parsed"] += 1
+                program["parse_seconds"] += page["parse_seconds"]
+        if page.get("cache_status") in self.cache_statuses:
+            self.cache_statuses[page["cache_status"]] += 1
+            if program:
+                program["cache_hits"] += 1
+        if not ok:
+            self.failures += 1
+            if program:
+                program["failures"] += 1
+
+    def metrics(self, fetch_workers, parse_workers):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        programs = {}
+        for prog_id, program in self.programs.items():
+            program_elapsed = max((program["finished"] or time.time()) - program["started"], 1e-9)
+            pages = program["pages_fetched"]
+            programs[prog_id] = dict(
+                {key: value for key, value in program.items() if key not in ("started", "finished")},
+                completed=program["finished"] is not None,
+                elapsed_seconds=program_elapsed,
+                pages_per_second=pages / program_elapsed,
+                mean_parse_seconds=program["parse_seconds"] / max(program["pages_parsed"], 1),
+            )
+        return {
+            "elapsed_seconds": elapsed,
+            "fetch_workers": fetch_workers,
+            "parse_workers": parse_workers,
+            "pages_fetched": self.pages_fetched,
+            "bytes_fetched": self.bytes_fetched,
+            "pages_per_second": self.pages_fetched / elapsed,
+            "bytes_per_second": self.bytes_fetched / elapsed,
+            "pages_parsed": self.pages_parsed,
+            "failures": self.failures,
+            "cache_statuses": dict(self.cache_statuses),
+            "fetch_latency": histogram(self.fetch_latencies, LATENCY_BUCKETS),
+            "parse_time": histogram(self.parse_times, PARSE_TIME_BUCKETS),
+            "programs": programs, # Programs overlap, so pages/s is over each program's own span
+        }
+
+    def summary(self, fetch_workers, parse_workers):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        lines = [
+            f"Fetch stage: {self.pages_fetched} pages, {self.bytes_fetched / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({self.pages_fetched / elapsed:.1f} pages/s, {self.bytes_fetched / 1e6 / elapsed:.2f} MB/s, "
+            f"avg {self.fetch_seconds / max(self.pages_fetched, 1) * 1000:.0f} ms/request, {fetch_workers} workers)",
+            f"Parse stage: {self.pages_parsed} pages ({self.pages_parsed / elapsed:.1f} pages/s overall, "
+            f"avg {self.parse_seconds / max(self.pages_parsed, 1) * 1000:.1f} ms/page, "
+            f"{f'{parse_workers} parser processes' if parse_workers else 'parsed in the fetch threads'})",
+        ]
+        if any(self.cache_statuses.values()):
+            lines.append(f"Page cache: {self.cache_statuses['not_modified']} not modified (304), "
+                         f"{self.cache_statuses['unchanged']} unchanged bodies, parsing skipped for both")
+        if self.failures:
+            lines.append(f"Failed pages: {self.failures}")
+        return lines
+
+# --- Crawl engine ---
+# A two-stage pipeline fed by one global queue:
+#   1. A producer thread lists the connectors of every program into one bounded work queue.
+#   2. max_workers fetch threads drain it through the shared session and hand the raw page bytes
+#      to a process pool, so BeautifulSoup parsing (CPU-bound) scales across cores instead of
+#      serializing the fetch threads on the GIL. A semaphore bounds the pages waiting to be parsed.
+# Programs overlap, so nothing idles at the tail of one program. Parsed results come back to the
+# calling thread, which streams each connector into the program's PartialProgramFile and finalizes
+# the program as soon as its last connector is in. URLs already in a .part file from an interrupted
+# run are not fetched again (pass restart=True to discard them).
+# With a page_cache, unchanged pages (304 or same body hash) skip the parse stage entirely.
+# `session` defaults to a fresh pooled requests session behind a ThrottledSession; pass an ArchiveSession to replay a snapshot
+# or a RecordingSession to take one. A `metrics` dict gets the run's "crawl" (and "requests") metrics, even if it is interrupted.
+def crawl_programs(programs, max_workers=MAX_WORKERS, root_url=ROOT_URL, connector_limit=CONNECTOR_LIMIT,
+                   output_dir=OUTPUT_DIR, parse_workers=PARSE_WORKERS, page_cache=None, session=None, restart=False,
+                   metrics=None):
+    session = session or ThrottledSession(make_session(max_workers), max_workers)
+    work_queue = queue.Queue(maxsize=max_workers * 4)
+    results = queue.Queue()
+    stats = CrawlStats()
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers, initializer=init_parse_worker) if parse_workers else None
+    parse_slots = threading.BoundedSemaphore(max(parse_workers, 1) * 4)
+    stopping = threading.Event() # Set when the run is interrupted, so producer and fetchers wind down
+
+    def enqueue_programs():
+        for prog_info in programs:
+            if stopping.is_set():
+                break
+            model_name = prog_info["model"]
+            current_prog_id = prog_info["prog_id"]
+            base_url_for_prog = program_index_url(prog_info, root_url)
+            print(f"Fetching connector links for {model_name} {current_prog_id} ({prog_info['sop']}) from {base_url_for_prog}...")
+            connector_links = []
+            try:
+                connector_links = get_connector_links(base_url_for_prog, session)
+            except requests.exceptions.RequestException as e:
+                print(f"HTTP Error fetching links for {current_prog_id}: {e}. Skipping this PROG.")
+            except Exception as e:
+                print(f"Generic error fetching links for {current_prog_id}: {e}. Skipping this PROG.")
+
+            # A sidebar may link a connector twice; count and fetch it once, or the program never completes
+            connector_links = list(dict.fromkeys(connector_links))
+            if connector_links and connector_limit is not None:
+                print(f"Limiting to {connector_limit} connectors for {current_prog_id}.")
+                connector_links = connector_links[:connector_limit]
+            partial_file = PartialProgramFile(prog_info, output_dir)
+            if restart:
+                partial_file.discard()
+            already_scraped = partial_file.completed_urls() & set(connector_links)
+            # Announce the program before queueing its work so its results always arrive after it
+            results.put(("program", prog_info, connector_links, partial_file, len(already_scraped)))
+            for link_url in connector_links:
+                if link_url not in already_scraped and not stopping.is_set():
+                    work_queue.put((current_prog_id, link_url))
+        for _ in range(max_workers):
+            work_queue.put(None)
+
+    def report_page(item, data, page):
+        results.put(("connector", item, data, page))
+
+    def on_parsed(item, page, future):
+        parse_slots.release()
+        if stopping.is_set():
+            return
+        data = None
         try:
-            connector_links = get_connector_links(base_url_for_prog)
-        except requests.exceptions.RequestException as e:
-            print(f"HTTP Error fetching links for {current_prog_id}: {e}. Skipping this PROG.")
-            continue
+            data, page["parse_seconds"] = future.result()
+        except Exception as e: # Including a parse worker that died (BrokenProcessPool) or a cancelled parse
+            print(f"Failed to scrape {item[1]} for {item[0]}: {e}")
+        report_page(item, data, page)
+
+    def fetch_page_item(item):
+        # Fetches one page and reports it, or hands it to the parse pool, which reports it when parsed
+        current_prog_id, url_to_scrape = item
+        cached = page_cache.get(url_to_scrape) if page_cache else None
+        fetch_start = time.perf_counter()
+        try:
+            resp = fetch_page_response(url_to_scrape, session, cached)
         except Exception as e:
-            print(f"Generic error fetching links for {current_prog_id}: {e}. Skipping this PROG.")
-            continue
-        
-        if not connector_links:
-            print(f"No connector links found for {current_prog_id}. Skipping.")
-            continue
-
-        if CONNECTOR_LIMIT is not None:
-            print(f"Limiting to {CONNECTOR_LIMIT} connectors for {current_prog_id}.")
-            connector_links = connector_links[:CONNECTOR_LIMIT]
-        
-        print(f"Found {len(connector_links)} connectors for {current_prog_id}.")
-
-        scraped_connectors_data = [] # Initialize list for current_prog's connector data
-        max_workers = 8  # Adjust based on your CPU/network
-
-        def scrape(url_to_scrape):
+            print(f"Failed to scrape {url_to_scrape} for {current_prog_id}: {e}")
+            report_page(item, None, {})
+            return
+        page = {"bytes": len(resp.content), "fetch_seconds": time.perf_counter() - fetch_start}
+
+        if cached and resp.status_code == 304:
+            report_page(item, cached["connector"], dict(page, cache_status="not_modified"))
+            return
+        page["validators"] = page_validators(resp)
+        if cached and cached.get("body_sha256") == page["validators"]["body_sha256"]:
+            # Server doesn't do conditional GETs for this page, but the body is byte-identical
+            report_page(item, cached["connector"], dict(page, cache_status="unchanged"))
+            return
+
+        if parse_pool is None:
             try:
-                return parse_connector_page(url_to_scrape)
+                data, page["parse_seconds"] = parse_page_content(url_to_scrape, resp.content, resp.encoding)
             except Exception as e:
-                # Pass current_prog_id to the logging message
                 print(f"Failed to scrape {url_to_scrape} for {current_prog_id}: {e}")
-                return None
+                data = None
+            report_page(item, data, page)
+            return
+        parse_slots.acquire()
+        if stopping.is_set():
+            parse_slots.release()
+            return
+        try:
+            future = parse_pool.submit(parse_page_content, url_to_scrape, resp.content, resp.encoding)
+        except BaseException:
+            parse_slots.release()
+            raise
+        future.add_done_callback(lambda f, item=item, page=page: on_parsed(item, page, f))
+
+    def fetch_worker():
+        while True:
+            item = work_queue.get()
+            if item is None or stopping.is_set():
+                return
+            try:
+                fetch_page_item(item)
+            except Exception as e:
+                # Anything else (an unreadable cache entry, a broken parse pool) fails this page, not the
+                # worker: the page is still reported, so the main loop never waits on it
+                print(f"Failed to scrape {item[1]} for {item[0]}: {e}")
+                report_page(item, None, {})
+
+    threads = [threading.Thread(target=enqueue_programs, daemon=True)]
+    threads += [threading.Thread(target=fetch_worker, daemon=True) for _ in range(max_workers)]
+    for thread in threads:
+        thread.start()
 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            if not connector_links:
-                print(f"No links to scrape for {current_prog_id}.")
+    in_progress = {} # prog_id -> {"links", "partial_file", "total", "done"}
+    programs_left = len(programs)
+    saved_files = []
+
+    def finish_program(current_prog_id):
+        nonlocal programs_left
+        state = in_progress.pop(current_prog_id)
+        programs_left -= 1
+        stats.finish_program(current_prog_id)
+        output_filename = state["partial_file"].finalize(state["links"])
+        if output_filename:
+            saved_files.append(output_filename)
+
+    try:
+        while programs_left:
+            message = results.get()
+            if message[0] == "program":
+                _, prog_info, connector_links, partial_file, already_scraped = message
+                if not connector_links:
+                    print(f"No connector links found for {prog_info['prog_id']}. Skipping.")
+                    programs_left -= 1
+                    continue
+                print(f"Found {len(connector_links)} connectors for {prog_info['prog_id']}.")
+                if already_scraped:
+                    print(f"Resuming {prog_info['prog_id']}: {already_scraped} connectors already in {partial_file.path}.")
+                stats.start_program(prog_info, len(connector_links), already_scraped)
+                in_progress[prog_info["prog_id"]] = {"links": connector_links, "partial_file": partial_file,
+                                                     "total": len(connector_links), "done": already_scraped}
+                if already_scraped == len(connector_links):
+                    finish_program(prog_info["prog_id"])
                 continue
 
-            future_to_url = {executor.submit(scrape, link_url): link_url for link_url in connector_links}
-            for i, future in enumerate(as_completed(future_to_url), 1):
-                processed_url = future_to_url[future]
-                data = future.result()
-                if data:
-                    scraped_connectors_data.append(data)
-                
-                connector_name_for_log = "Unknown"
-                if data and data.get('name'):
-                    connector_name_for_log = data['name']
-                elif processed_url:
-                    path_parts = [part for part in processed_url.split('/') if part]
-                    if len(path_parts) >= 2 and path_parts[-1].lower() == "index.html":
-                        connector_name_for_log = path_parts[-2]
-                    elif path_parts:
-                         connector_name_for_log = path_parts[-1]
-                print(f"Scraped {i}/{len(connector_links)} for {current_prog_id}: {connector_name_for_log} ({processed_url})")
-        
-        if not scraped_connectors_data:
-            print(f"No data successfully scraped for {current_prog_id}. Skipping file save.")
-            continue
-
-        # Prepare the final JSON structure
-        output_data = {
-            "model": model_name,
-            "prog_id": current_prog_id,
-            "sop": sop_info,
-            "build_information": build_info,
-            "connectors": scraped_connectors_data
-        }
+            _, (current_prog_id, processed_url), data, page = message
+            stats.record_page(page, ok=bool(data), prog_id=current_prog_id)
+            if page_cache and data and page.get("validators"):
+                page_cache.put(processed_url, page["validators"], data)
+            state = in_progress[current_prog_id]
+            state["done"] += 1
+            if data:
+                state["partial_file"].append(processed_url, data)
+            print(f"Scraped {state['done']}/{state['total']} for {current_prog_id}: {connector_name_for_log(processed_url, data)} ({processed_url})")
+
+            if state["done"] == state["total"]:
+                finish_program(current_prog_id)
+    except BaseException:
+        # Interrupted (Ctrl-C) or crashed: everything scraped so far is already in the .part files
+        stopping.set()
+        if parse_pool is not None:
+            # Workers ignore Ctrl-C and only finish the page in hand; waiting for them avoids racing the pool's exit handler
+            parse_pool.shutdown(wait=True, cancel_futures=True)
+        print(f"\nStopped; {len(in_progress)} unfinished programs will resume from their .part files on the next run.")
+        raise
+    finally:
+        for state in in_progress.values():
+            state["partial_file"].close()
+        if metrics is not None:
+            metrics["crawl"] = stats.metrics(max_workers, parse_workers)
+            if isinstance(session, ThrottledSession):
+                metrics["requests"] = session.metrics()
+    if parse_pool is not None:
+        parse_pool.shutdown()
 
-        output_filename = f"connectors/connectors_{model_name}_{current_prog_id}.json"
-        with open(output_filename, "w", encoding="utf-8") as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
-        print(f"Saved data for {model_name} {current_prog_id} to {output_filename}")
+    for thread in threads:
+        thread.join()
+    print(f"\nScraped {len(programs)} programs:")
+    summary_lines = stats.summary(max_workers, parse_workers)
+    if isinstance(session, ThrottledSession):
+        summary_lines += session.summary()
+    for line in summary_lines:
+        print(f"  {line}")
+    return saved_files
+
+# --- Image prefetch ---
+# Optional last stage: downloads the images of the programs just saved into the app's image cache
+# (content-addressed, with thumbnails), through its own throttled session so they share the rate control
+# settings but never land in a page archive.
+def prefetch_images(program_files, max_workers=MAX_WORKERS, max_rate=MAX_RATE,
+                    cache_dir=image_cache.IMAGE_CACHE_DIR, max_bytes=image_cache.MAX_CACHE_BYTES, metrics=None):
+    session = ThrottledSession(make_session(max_workers), max_workers, max_rate)
+    cache = image_cache.ImageCache(cache_dir, max_bytes, session=session)
+    image_urls = image_cache.program_image_urls(program_files)
+    print(f"\nPrefetching images: {len(image_urls)} distinct URLs in {len(program_files)} programs...")
+    try:
+        cache.prefetch(image_urls, max_workers)
+    finally:
+        if metrics is not None:
+            metrics["images"] = {"urls": len(image_urls), "counts": dict(cache.counts), "cache_bytes": cache.total_bytes,
+                                 "requests": session.metrics()}
+    for line in [cache.summary()] + session.summary():
+        print(f"  {line}")
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Tesla connector data into connectors/connectors_<Model>_<prog>.json files.")
+    parser.add_argument("--prog", action="append", metavar="PROG_ID",
+                        help="Only scrape this prog_id (repeatable). Defaults to every program in PROG_DETAILS_LIST.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Maximum concurrent page fetches across all programs; the actual number adapts to the server.")
+    parser.add_argument("--max-rate", type=float, default=MAX_RATE,
+                        help="Cap on requests per second per host (default: no cap, only adaptive concurrency).")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="Parser processes (default: one per CPU core); 0 parses inside the fetch threads.")
+    parser.add_argument("--root-url", default=ROOT_URL,
+                        help="Site root to crawl, e.g. a local HTTP server serving fixture pages.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory for the program JSON files and manifest.")
+    parser.add_argument("--cache-dir", default=PAGE_CACHE_DIR,
+                        help="Page cache for incremental re-scrapes (conditional GETs, body hashes).")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the page cache and re-parse every page.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard partial results (.json.part files) of interrupted runs instead of resuming them.")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="Also write every fetched page into a compressed, append-only snapshot archive in DIR.")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="Run entirely from a snapshot archive written with --archive, without network access.")
+    parser.add_argument("--images", action="store_true",
+                        help="After scraping, download every image of the saved programs into the image cache and make thumbnails.")
+    parser.add_argument("--image-cache-dir", default=image_cache.IMAGE_CACHE_DIR, help="Image cache directory for --images.")
+    parser.add_argument("--image-cache-size", type=float, default=image_cache.MAX_CACHE_BYTES / 2**20,
+                        help="Image cache size cap in MB; least recently used images are evicted beyond it.")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help=f"Where to write the run's JSON metrics (default: {METRICS_FILENAME} in the output directory).")
+    args = parser.parse_args()
+
+    programs = PROG_DETAILS_LIST
+    if args.prog:
+        programs = [p for p in PROG_DETAILS_LISR_3 + PROG_DETAILS_LIST_Y if p["prog_id"] in args.prog]
+        unknown = set(args.prog) - set(p["prog_id"] for p in programs)
+        if unknown:
+            parser.error(f"Unknown prog_id(s): {', '.join(sorted(unknown))}")
+
+    if args.archive and args.replay:
+        parser.error("--archive and --replay cannot be combined")
+    if args.images and args.replay:
+        parser.error("--images downloads from the site and cannot be combined with --replay")
+
+    archive = None
+    session = None
+    page_cache = None if args.no_cache else PageCache(args.cache_dir)
+    if args.replay:
+        archive = PageArchive(args.replay)
+        if not len(archive):
+            parser.error(f"No archived pages found in {args.replay}")
+        print(f"Replaying {len(archive)} archived pages from {args.replay}.")
+        session = ArchiveSession(archive)
+        page_cache = None # Replay exists to re-run the parser, never short-circuit it
+    elif args.archive:
+        archive = PageArchive(args.archive)
+        session = ThrottledSession(RecordingSession(make_session(args.workers), archive), args.workers, args.max_rate)
+        if page_cache is not None:
+            print("Note: pages answered 304 from the page cache are not re-archived; use --no-cache for a complete snapshot.")
+    else:
+        session = ThrottledSession(make_session(args.workers), args.workers, args.max_rate)
+
+    metrics_path = args.metrics or os.path.join(args.output_dir, METRICS_FILENAME)
+    metrics = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "completed": False,
+               "mode": "replay" if args.replay else "archive" if args.archive else "live",
+               "programs": [p["prog_id"] for p in programs]}
+    try:
+        saved_files = crawl_programs(programs, max_workers=args.workers, root_url=args.root_url, output_dir=args.output_dir,
+                                     parse_workers=args.parse_workers, page_cache=page_cache, session=session, restart=args.restart,
+                                     metrics=metrics)
+        if args.images:
+            prefetch_images(saved_files, args.workers, args.max_rate, args.image_cache_dir, int(args.image_cache_size * 2**20),
+                            metrics=metrics)
+        metrics["completed"] = True
+    except KeyboardInterrupt:
+        sys.exit(130)
+    finally:
+        if archive is not None:
+            archive.close()
+        try:
+            write_metrics(metrics, metrics_path)
+            print(f"Metrics written to {metrics_path}")
+        except OSError as e:
+            print(f"Could not write metrics to {metrics_path}: {e}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import connector_store
+
+
+def make_connector(name, tesla_part_number="1035000-00-A", connector="TE 1-123", color="BK", wire_colors=("BK",)):
+    # A connector record as the scraper writes it, with one connected cavity per wire color
+    return {
+        "url": f"https://example.invalid/connector/{name.lower()}/",
+        "name": name,
+        "tesla_part_number": tesla_part_number,
+        "connector": connector,
+        "color": color,
+        "description": "",
+        "pinout_table": [
+            {"Cavity": str(position + 1), "Terminal Manufacturer": "TE", "Terminal Part Number": "1-100",
+             "Terminal Size": "0.64", "Wire Color": wire_color, "Wire Size": "0.35", "Wire Seal Manufacturer": "",
+             "Wire Seal PN": "", "Wire Dest. Desg.": "X1", "Wire Dest. Cavity": "1"}
+            for position, wire_color in enumerate(wire_colors)
+        ],
+        "image_urls": [],
+    }
+
+
+@pytest.fixture
+def write_program(tmp_path):
+    # Writes a program file and returns its manifest entry
+    def write(connectors, model="ModelT", prog_id="prog-1", sop="SOP1"):
+        path = tmp_path / f"connectors_{model}_{prog_id}.json"
+        path.write_text(json.dumps({"model": model, "prog_id": prog_id, "sop": sop, "connectors": connectors}))
+        entry, _ = connector_store.build_manifest_entry(str(path))
+        return dict(entry, filename=str(path))
+    return write
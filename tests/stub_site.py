@@ -0,0 +1,84 @@
+import html
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import connector_pages
+import scrape_tesla_connectors
+
+# A local stand-in for service.tesla.com: program index pages and connector pages rendered from connector
+# records, with injected latency and errors. Each page answers its first `failures_per_page` requests with
+# alternating 503 / 429 (Retry-After: 0), and the URLs in `always_failing` always answer 503. Page URLs
+# include the port, so a re-run that has to resume a previous one serves on the same `port`.
+class StubSite:
+    def __init__(self, programs, latency=0.0, failures_per_page=0, always_failing=(), port=0):
+        self.programs = programs # [(prog_info, [connector records without "url"])]
+        self.latency = latency
+        self.failures_per_page = failures_per_page
+        self.always_failing = set(always_failing)
+        self.requests = {} # path -> requests received
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.root_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.pages = {}
+        for prog_info, connectors in programs:
+            index_url = scrape_tesla_connectors.program_index_url(prog_info, self.root_url)
+            links = []
+            for connector in connectors:
+                url = f"{index_url.rsplit('/', 2)[0]}/{connector['name'].lower()}/"
+                connector["url"] = url
+                links.append(url)
+                self.pages[urlsplit(url).path] = connector_pages.render_connector_html(connector)
+            nav = "".join(f'<a class="tds-site-nav-item" href="{html.escape(link)}">x</a>' for link in links)
+            self.pages[urlsplit(index_url).path] = (f'<html><body><aside class="tds-layout-item tds-layout-aside">'
+                                                    f'<nav class="tds-sidenav">{nav}</nav></aside></body></html>')
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with site.lock:
+                    attempt = site.requests.get(self.path, 0)
+                    site.requests[self.path] = attempt + 1
+                    site.in_flight += 1
+                    site.peak_in_flight = max(site.peak_in_flight, site.in_flight)
+                try:
+                    time.sleep(site.latency)
+                    url = site.root_url + self.path
+                    if self.path not in site.pages:
+                        self.send_error(404)
+                    elif url in site.always_failing or attempt < site.failures_per_page:
+                        status = 429 if attempt % 2 else 503
+                        self.send_response(status)
+                        if status == 429:
+                            self.send_header("Retry-After", "0")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                    else:
+                        body = site.pages[self.path].encode("utf-8")
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/html; charset=utf-8")
+                        self.send_header("Content-Length", str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                finally:
+                    with site.lock:
+                        site.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
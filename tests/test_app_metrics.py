@@ -0,0 +1,59 @@
+import app_metrics
+
+
+def memoize(func):
+    # Stands in for st.cache_data: runs the body once per distinct arguments
+    results = {}
+    def cached(*args):
+        if args not in results:
+            results[args] = func(*args)
+        return results[args]
+    cached.clear = results.clear
+    return cached
+
+
+def test_instrumented_counts_calls_and_misses_per_rerun_and_in_total(monkeypatch):
+    monkeypatch.setattr(app_metrics, "loader_totals", {})
+    body_runs = []
+
+    @app_metrics.instrumented(memoize)
+    def load_program(name):
+        body_runs.append(name)
+        return name.upper()
+
+    metrics = app_metrics.start_rerun(True)
+    assert [load_program(name) for name in ("a", "b", "a", "a")] == ["A", "B", "A", "A"]
+    assert body_runs == ["a", "b"]
+    loader = metrics.record()["loaders"]["load_program"]
+    assert (loader["calls"], loader["misses"]) == (4, 2)
+
+    metrics = app_metrics.start_rerun(True)
+    load_program("a")
+    load_program("c")
+    loader = metrics.record()["loaders"]["load_program"]
+    assert (loader["calls"], loader["misses"]) == (2, 1)
+    assert app_metrics.loader_totals["load_program"] == {"calls": 6, "misses": 3} # 3 hits
+
+    # Off: the cache still answers, nothing is counted
+    assert app_metrics.start_rerun(False) is None
+    load_program("a")
+    load_program("d")
+    assert body_runs == ["a", "b", "c", "d"]
+    assert app_metrics.loader_totals["load_program"] == {"calls": 6, "misses": 3}
+
+    load_program.clear()
+    load_program("a")
+    assert body_runs[-1] == "a"
+
+
+def test_stages_add_up_per_rerun():
+    metrics = app_metrics.start_rerun(True)
+    for _ in range(3):
+        with app_metrics.stage("images"):
+            pass
+    app_metrics.start_stage("render results")
+    app_metrics.end_stage("render results")
+    stages = metrics.record()["stages"]
+    assert stages["images"]["calls"] == 3
+    assert stages["render results"]["calls"] == 1
+    assert list(stages) == ["images", "render results"]
@@ -0,0 +1,20 @@
+import benchmark
+from conftest import make_connector
+
+
+def test_run_dataset_times_every_stage_on_a_small_synthetic_dataset(tmp_path, write_program):
+    meta = write_program([make_connector(f"A{number:03}", color=color, wire_colors=wire_colors)
+                          for number, (color, wire_colors) in enumerate([("BK", ("BK", "RD")), ("WH", ("GN",)),
+                                                                         ("BK", ("BK", "BK", "unused"))] * 3)])
+    paths = benchmark.write_synthetic_programs([meta], 4, str(tmp_path / "synthetic"))
+    assert len(paths) == 2
+
+    lines = []
+    results = benchmark.run_dataset("synthetic", 4, paths, repeats=1, budget=0, log=lines.append)
+    stages = {result["stage"]: result for result in results}
+    assert {"json_load", "dataframe_build", "derive", "filter:combined", "facet_counts", "parse"} <= set(stages)
+    assert stages["json_load"]["items"] == 2
+    assert stages["dataframe_build"]["items"] == 36 # Two program copies, each with twice the 9 connectors
+    assert stages["parse"]["items"] > 0
+    assert all(result["runs"] == 1 and result["median"] >= 0 for result in results)
+    assert len(lines) == len(results)
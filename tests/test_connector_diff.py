@@ -0,0 +1,33 @@
+import os
+
+import connector_diff
+from conftest import make_connector
+
+
+def test_diff_reports_added_removed_and_changed_connectors(tmp_path, write_program):
+    old_connectors = [make_connector("A001"), make_connector("A002", wire_colors=("BK", "RD")), make_connector("A003")]
+    new_connectors = [
+        make_connector("A001"),
+        make_connector("A002", color="GY", wire_colors=("BK", "WH", "GN")), # Cavity 2 rewired, cavity 3 added
+        make_connector("A004"),
+    ]
+    # The same images under each program's own path are not a change
+    old_connectors[0]["image_urls"] = ["https://example.invalid/prog-1/images/a001.png"]
+    new_connectors[0]["image_urls"] = ["https://example.invalid/prog-2/images/a001.png"]
+    old_meta = write_program(old_connectors, prog_id="prog-1", sop="SOP1")
+    new_meta = write_program(new_connectors, prog_id="prog-2", sop="SOP2")
+
+    hash_dir = str(tmp_path / "hashes")
+    def diff():
+        return connector_diff.diff_programs(connector_diff.load_program_hashes(old_meta, hash_dir),
+                                            connector_diff.load_program_hashes(new_meta, hash_dir))
+    assert diff() == {
+        "added": ["A004"],
+        "removed": ["A003"],
+        "changed": [{"name": "A002", "fields": {"color": ("BK", "GY")}, "cavities_added": ["3"],
+                     "cavities_removed": [], "cavities_changed": ["2"]}],
+        "unchanged": 1,
+    }
+    # The second diff reads the hashes stored by the first
+    assert os.path.exists(connector_diff.hash_path_for(new_meta["filename"], hash_dir))
+    assert diff()["changed"][0]["cavities_changed"] == ["2"]
@@ -0,0 +1,117 @@
+import pandas as pd
+import pytest
+
+import connector_index
+import connector_store
+from conftest import make_connector
+
+
+def unused_row(cavity, **overrides):
+    row = {header: "unused" for header in connector_store.CAVITY_COLUMNS}
+    row["Cavity"] = cavity
+    row.update(overrides)
+    return row
+
+
+def test_cavities_are_counted_by_terminal_manufacturer():
+    connector = make_connector("A001", wire_colors=("BK", "RD"))
+    connector["pinout_table"] += [
+        unused_row("3"),
+        unused_row("4", **{"Wire Color": "BK"}), # Partially unused: no terminal, but a wire color
+        unused_row("5", **{"Terminal Manufacturer": "TE"}), # A terminal, nothing else
+        {"Cavity": "6"}, # No terminal manufacturer at all
+    ]
+    prepared = connector_index.prepare_program(*connector_store.program_to_tables([connector]))
+    counts = prepared.df.iloc[0]
+    pinout = connector["pinout_table"]
+    # As the app counted them from the pinout table
+    assert counts["total_cavities"] == len(pinout) == 6
+    assert counts["num_connected_cavities"] == sum(
+        1 for pin in pinout if pin.get("Terminal Manufacturer") not in ("unused", None)) == 3
+    assert counts["num_unconnected_cavities"] == sum(
+        1 for pin in pinout if pin.get("Terminal Manufacturer") == "unused") == 2
+
+    # Only the fully unused row is stored as a bit; every row reads back as loaded
+    assert prepared.unused_cavities().tolist() == [False, False, True, False, False, False]
+    restored = prepared.cavities_with_unused()
+    assert restored["wire_color"].tolist()[2:4] == ["unused", "BK"]
+    assert restored["terminal_manufacturer"].tolist()[2:5] == ["unused", "unused", "TE"]
+
+
+def test_all_programs_table_renumbers_connectors_and_merges_cavity_columns():
+    first = [make_connector("A001", wire_colors=("BK", "RD")), make_connector("A002", wire_colors=("GN",))]
+    second = [make_connector("B001", wire_colors=("BK",)), dict(make_connector("B002"), pinout_table=[])]
+    for pin in second[0]["pinout_table"]:
+        pin["Wire Seal PN"] = None # All empty in this program: its category dtype differs from the first one's
+    programs = [({"model": "ModelT", "sop": f"SOP{number}", "prog_id": f"prog-{number}"},
+                 *connector_store.program_to_tables(connectors))
+                for number, connectors in ((1, first), (2, second))]
+    connectors_df, cavities_df = connector_store.concat_program_tables(programs)
+
+    assert connectors_df["name"].tolist() == ["A001", "A002", "B001", "B002"]
+    assert connectors_df["connector_id"].tolist() == [0, 1, 2, 3]
+    assert cavities_df["connector_id"].tolist() == [0, 0, 1, 2]
+    for key in ("model", "sop", "prog_id"):
+        assert isinstance(connectors_df[key].dtype, pd.CategoricalDtype)
+    assert connectors_df["prog_id"].cat.categories.tolist() == ["prog-1", "prog-2"]
+    assert cavities_df["wire_color"].tolist() == ["BK", "RD", "GN", "BK"]
+    assert cavities_df["wire_seal_pn"].astype(object).tolist()[:3] == ["", "", ""]
+    assert pd.isna(cavities_df["wire_seal_pn"].iloc[3])
+
+    prepared = connector_index.prepare_program(connectors_df, cavities_df)
+    assert prepared.df["total_cavities"].tolist() == [2, 1, 1, 0]
+    def matching(filters):
+        return prepared.df["name"][connector_index.compute_filter_mask(prepared, filters)].tolist()
+    assert matching({"wire_color_counts": [("BK", 1, 1)]}) == ["A001", "B001"]
+    assert matching({"wire_color_counts": [("GN", 1, 1)]}) == ["A002"]
+    assert matching({"total_cavities": (0, 0)}) == ["B002"]
+    assert prepared.pinout(1)["wire_color"].tolist() == ["GN"]
+    assert prepared.pinout(2)["wire_color"].tolist() == ["BK"]
+    assert prepared.pinout(3).empty
+
+
+def test_max_wire_size_is_the_largest_parsed_wire_size():
+    thick = make_connector("A001", wire_colors=("BK", "RD"))
+    thick["pinout_table"][1]["Wire Size"] = "2.5"
+    unsized = make_connector("A003")
+    unsized["pinout_table"][0]["Wire Size"] = "unused"
+    prepared = connector_index.prepare_program(*connector_store.program_to_tables(
+        [thick, make_connector("A002"), unsized, dict(make_connector("A004"), pinout_table=[])]))
+
+    assert prepared.df["max_wire_size"].tolist() == pytest.approx([2.5, 0.35, 0.0, 0.0])
+    assert prepared.max_wire_sizes == pytest.approx([0.0, 0.35, 2.5])
+    assert prepared.largest_wire_size == 2.5
+    def matching(bounds):
+        return prepared.df["name"][connector_index.compute_filter_mask(prepared, {"max_wire_size": bounds})].tolist()
+    assert matching((0.35, 2.5)) == ["A001", "A002"]
+    assert matching((1.0, 2.5)) == ["A001"]
+    assert matching((0.0, 0.0)) == ["A003", "A004"]
+
+
+def test_results_table_keeps_result_order_and_inlines_icons_for_the_first_rows():
+    connectors = [dict(make_connector(name), image_urls=urls) for name, urls in (
+        ("A001", ["https://example.invalid/a1.png", "https://example.invalid/a1b.png"]),
+        ("A002", []),
+        ("A003", ["https://example.invalid/a3.png"]),
+        ("A004", ["https://example.invalid/a4.png"]),
+    )]
+    programs = [({"model": "ModelT", "sop": "SOP1", "prog_id": "prog-1"}, *connector_store.program_to_tables(connectors))]
+    prepared = connector_index.prepare_program(*connector_store.concat_program_tables(programs))
+    results = prepared.df.iloc[[3, 0, 1, 2]] # As filtered and sorted, with a non-default index
+
+    def icon_uri(url):
+        return None if url.endswith("a4.png") else f"data:{url}" # a4 has no cached thumbnail yet
+
+    table = connector_index.results_table(results, icon_uri=icon_uri, icon_rows=3)
+    assert table.columns.tolist() == list(connector_index.RESULTS_TABLE_COLUMNS)
+    assert table.index.tolist() == [0, 1, 2, 3]
+    assert table["name"].tolist() == ["A004", "A001", "A002", "A003"]
+    images = table["image"].tolist()
+    assert images[:2] == ["https://example.invalid/a4.png", "data:https://example.invalid/a1.png"]
+    assert pd.isna(images[2]) # No image at all
+    assert images[3] == "https://example.invalid/a3.png" # Past icon_rows: linked, not inlined
+    assert table["total_cavities"].tolist() == [1, 1, 1, 1]
+
+    table = connector_index.results_table(results, all_programs=True)
+    assert table.columns.tolist() == list(connector_store.PROGRAM_KEY_COLUMNS) + list(connector_index.RESULTS_TABLE_COLUMNS)
+    assert table["image"].tolist()[:2] == ["https://example.invalid/a4.png", "https://example.invalid/a1.png"]
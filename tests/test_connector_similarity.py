@@ -0,0 +1,43 @@
+import connector_index
+import connector_similarity
+import connector_store
+from conftest import make_connector
+
+
+def unrelated_connector(name):
+    connector = make_connector(name, wire_colors=("YE", "VT"))
+    for cavity, pin in zip("AB", connector["pinout_table"]):
+        pin.update({"Cavity": cavity, "Wire Size": "2.5", "Terminal Size": "2.8"})
+    return connector
+
+
+def build_index():
+    connectors = [
+        make_connector("A001", wire_colors=("BK", "RD", "BU", "GN")),
+        make_connector("A002", wire_colors=("BK", "RD", "BU", "WH")), # One wire differs
+        unrelated_connector("A003"),
+        make_connector("A004", wire_colors=("BK", "RD", "BU", "GN")), # Same pinout as A001
+        make_connector("A005", wire_colors=("GN", "BU", "RD", "BK")), # Same wires, other cavities
+    ]
+    prepared = connector_index.prepare_program(*connector_store.program_to_tables(connectors))
+    return connector_similarity.build_similarity_index(prepared)
+
+
+def test_identical_pinout_ranks_first():
+    index = build_index()
+    # Identical feature sets get identical signatures, so they share every LSH band
+    assert (index.signatures[0] == index.signatures[3]).all()
+    candidates = index.candidates(index.connector_features(0)).tolist()
+    assert 3 in candidates and 2 not in candidates
+
+    results = index.search(index.connector_features(0), exclude=0)
+    assert results["name"].tolist()[0] == "A004"
+    assert results["similarity"].tolist()[0] == 1.0
+    assert results["name"].tolist() == ["A004", "A002", "A005"]
+    assert results["similarity"].is_monotonic_decreasing
+
+
+def test_unrelated_connector_is_not_returned():
+    index = build_index()
+    assert "A003" not in index.search(index.connector_features(0), exclude=0)["name"].tolist()
+    assert index.search(index.connector_features(2), exclude=2).empty
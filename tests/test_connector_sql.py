@@ -0,0 +1,164 @@
+import os
+import random
+
+import pytest
+
+import connector_index
+import connector_sql
+import connector_store
+from conftest import make_connector
+
+CONNECTORS = [
+    make_connector("A001", tesla_part_number="1035+00-A", connector="A.B 7283-1234", wire_colors=("BK", "RD")),
+    make_connector("A002", tesla_part_number="1035000-00-A", connector="AXB 7283-1234", color="GY",
+                   wire_colors=("BK", "unused", "unused")),
+    make_connector("A003", tesla_part_number="2000(1)-00-A", connector="TE [1]-100%", wire_colors=("RD", "RD", "WH")),
+    make_connector("A004", tesla_part_number="2000_10-00-B", connector="TE 1-100", color="GY"),
+    make_connector("A005", tesla_part_number="30\\40-00-A", connector="YAZAKI 7283_5", color="WH",
+                   wire_colors=("BK", "WH", "unused")),
+]
+
+
+@pytest.fixture
+def program(tmp_path, write_program):
+    meta = write_program(CONNECTORS)
+    db_path = str(tmp_path / "connectors.sqlite")
+    assert connector_sql.sync_database([meta], db_path) == []
+    prepared = connector_index.prepare_program(*connector_store.load_program_tables(meta["filename"]))
+    return prepared, db_path
+
+
+@pytest.mark.parametrize("name, term", [
+    ("tesla_part_number", "1035+"),
+    ("tesla_part_number", "(1)"),
+    ("tesla_part_number", "("),
+    ("tesla_part_number", "0_1"),
+    ("tesla_part_number", "\\4"),
+    ("tesla_part_number", "0.0"),
+    ("manufacturer_or_connector", "A.B"),
+    ("manufacturer_or_connector", "[1]"),
+    ("manufacturer_or_connector", "%"),
+    ("manufacturer_or_connector", "*"),
+    ("manufacturer_or_connector", "^TE"),
+])
+def test_substring_filters_match_literally_in_both_backends(program, name, term):
+    prepared, db_path = program
+    filters = {name: term}
+    expected = [connector["name"] for connector in CONNECTORS
+                if any(term.upper() in (connector[field] or "").upper()
+                       for field in ({"tesla_part_number": ["tesla_part_number"]}.get(name, ["connector"])))]
+
+    in_memory = prepared.df["name"][connector_index.compute_filter_mask(prepared, filters)].tolist()
+    in_sql = connector_sql.query_connectors(filters, db_path=db_path)["name"].tolist()
+    assert in_memory == expected
+    assert in_sql == expected
+    assert connector_index.facet_counts(prepared, filters)["matches"] == len(expected)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"body_color": "GY"},
+    {"total_cavities": (2, 3)},
+    {"num_unconnected_cavities": (1, 2), "body_color": "WH"},
+    {"wire_color_counts": [("RD", 1, 5)]},
+    {"wire_color_counts": [("BK", 1, 1), ("RD", 0, 0)], "num_connected_cavities": (0, 2)},
+    {"tesla_part_number": "1035", "max_wire_size": (0.3, 0.4)},
+    {"manufacturer_or_connector": "TE", "body_color": "BK", "total_cavities": (3, 3)},
+])
+def test_facet_counts_agree_and_leave_out_their_own_filter(program, filters):
+    prepared, db_path = program
+    in_memory = connector_index.facet_counts(prepared, filters)
+    in_sql = connector_sql.query_facet_counts(filters, db_path=db_path)
+
+    def matching_all_but(excluded):
+        return prepared.df[connector_index.compute_filter_mask(
+            prepared, {name: value for name, value in filters.items() if name != excluded})]
+    def nonzero(counts):
+        return {value: count for value, count in counts.items() if count}
+
+    assert in_memory["matches"] == in_sql["matches"] == len(matching_all_but(None))
+    for name, _ in connector_index.FACET_RANGE_COLUMNS:
+        expected = matching_all_but(name)[name].value_counts().to_dict()
+        assert nonzero(dict(enumerate(in_memory[name].tolist()))) == nonzero(dict(enumerate(in_sql[name].tolist()))) == expected
+    expected = matching_all_but("body_color")["connector_body_color"].value_counts().to_dict()
+    assert nonzero(in_memory["body_color"]) == nonzero(in_sql["body_color"]) == expected
+    assert in_memory["body_color_total"] == in_sql["body_color_total"] == len(matching_all_but("body_color"))
+    rows = matching_all_but("wire_color_counts").index
+    expected = {color: int((prepared.count_specific_wires(color)[rows] > 0).sum()) for color in prepared.wire_color_index}
+    assert nonzero(in_memory["wire_color"]) == nonzero(in_sql["wire_color"]) == nonzero(expected)
+
+
+def random_facet_filters(rng, prepared):
+    filters = {}
+    for name, maximum in (("total_cavities", prepared.max_total_cavities),
+                          ("num_connected_cavities", prepared.max_connected_cavities),
+                          ("num_unconnected_cavities", prepared.max_unconnected_cavities)):
+        if rng.random() < 0.3:
+            filters[name] = tuple(sorted((rng.randint(0, maximum), rng.randint(0, maximum))))
+    if rng.random() < 0.3:
+        filters["max_wire_size"] = tuple(sorted(rng.sample(prepared.max_wire_sizes, 2)))
+    if rng.random() < 0.3:
+        filters["body_color"] = rng.choice(prepared.body_colors)
+    if rng.random() < 0.2:
+        filters["tesla_part_number"] = rng.choice(["1035", "-01", "2000"])
+    if rng.random() < 0.2:
+        filters["manufacturer_or_connector"] = rng.choice(["te", "YAZAKI", "1-"])
+    if rng.random() < 0.4:
+        filters["wire_color_counts"] = [(color, *sorted((rng.randint(0, 4), rng.randint(0, 4))))
+                                        for color in rng.sample(prepared.wire_colors, rng.randint(1, 2))]
+    return filters
+
+
+def test_in_memory_facet_counts_match_sql_on_random_filters(tmp_path, write_program):
+    rng = random.Random(25)
+    connectors = []
+    for number in range(40):
+        connector = make_connector(
+            f"A{number:03}", tesla_part_number=rng.choice(["1035000-00-A", "1035001-01-A", "2000000-00-A"]),
+            connector=rng.choice(["TE CONNECTIVITY 1-100", "YAZAKI 7283-1234", "MOLEX 5-1"]),
+            color=rng.choice(["BK", "WH", "GY"]),
+            wire_colors=[rng.choice(["BK", "RD", "GN", "unused"]) for _ in range(rng.randint(0, 5))])
+        for pin in connector["pinout_table"]:
+            pin["Wire Size"] = rng.choice(["0.35", "0.5", "1.5"]) if pin["Wire Color"] != "unused" else "unused"
+        connectors.append(connector)
+    meta = write_program(connectors)
+    db_path = str(tmp_path / "connectors.sqlite")
+    assert connector_sql.sync_database([meta], db_path) == []
+    prepared = connector_index.prepare_program(*connector_store.load_program_tables(meta["filename"]))
+
+    def nonzero(counts):
+        return {value: count for value, count in counts.items() if count}
+
+    for _ in range(200):
+        filters = random_facet_filters(rng, prepared)
+        in_memory = connector_index.facet_counts(prepared, filters)
+        in_sql = connector_sql.query_facet_counts(filters, db_path=db_path)
+        assert in_memory["matches"] == in_sql["matches"], filters
+        for name, _ in connector_index.FACET_RANGE_COLUMNS:
+            assert nonzero(dict(enumerate(in_memory[name].tolist()))) == nonzero(dict(enumerate(in_sql[name].tolist()))), filters
+        assert nonzero(in_memory["body_color"]) == nonzero(in_sql["body_color"]), filters
+        assert in_memory["body_color_total"] == in_sql["body_color_total"], filters
+        assert nonzero(in_memory["wire_color"]) == nonzero(in_sql["wire_color"]), filters
+
+
+def test_schema_change_rebuilds_beside_the_database_other_sessions_read(tmp_path, write_program, monkeypatch):
+    meta = write_program(CONNECTORS)
+    db_path = str(tmp_path / "connectors.sqlite")
+    old = connector_sql.connect(db_path)
+    old.executescript("CREATE TABLE programs (filename TEXT); INSERT INTO programs VALUES ('old'); PRAGMA user_version = 0;")
+    old.close()
+
+    # Another session connecting while the new database is being built still gets the old one
+    seen_during_rebuild = []
+    insert_program = connector_sql._insert_program
+    def observed_insert_program(*args):
+        reader = connector_sql.connect(db_path)
+        seen_during_rebuild.extend(reader.execute("SELECT filename FROM programs").fetchall())
+        reader.close()
+        insert_program(*args)
+    monkeypatch.setattr(connector_sql, "_insert_program", observed_insert_program)
+
+    assert connector_sql.sync_database([meta], db_path) == []
+    assert seen_during_rebuild == [("old",)]
+    assert connector_sql.query_connectors({}, db_path=db_path)["name"].tolist() == [c["name"] for c in CONNECTORS]
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([os.path.basename(meta["filename"]), "connectors.sqlite"])
@@ -0,0 +1,142 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import connector_store
+from conftest import make_connector
+
+STORE_CLI = os.path.abspath(connector_store.__file__)
+
+
+def run_store_command(command, cwd):
+    result = subprocess.run([sys.executable, STORE_CLI, command], cwd=cwd, capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def test_manifest_is_built_on_first_run_then_only_stats_the_files(tmp_path, write_program, monkeypatch):
+    meta = write_program([make_connector("A001"), make_connector("A002")])
+    file_pattern = str(tmp_path / "connectors_*.json")
+    manifest_path = str(tmp_path / "manifest.json")
+    metadata, messages = connector_store.refresh_manifest(file_pattern, manifest_path)
+    assert messages == []
+    assert [(entry["prog_id"], entry["filename"], entry["sha256"]) for entry in metadata] == [
+        ("prog-1", meta["filename"], connector_store.file_sha256(meta["filename"]))]
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = f.read()
+
+    def not_called(*args):
+        raise AssertionError("unchanged file was read")
+    monkeypatch.setattr(connector_store, "file_sha256", not_called)
+    monkeypatch.setattr(connector_store, "read_program_header", not_called)
+    assert connector_store.refresh_manifest(file_pattern, manifest_path) == (metadata, [])
+    with open(manifest_path, encoding="utf-8") as f:
+        assert f.read() == manifest
+
+
+def test_columnar_command_converts_programs_that_have_a_current_dedup_store(tmp_path):
+    connectors_dir = tmp_path / connector_store.CONNECTORS_DIR
+    connectors_dir.mkdir()
+    (connectors_dir / "connectors_ModelT_prog-1.json").write_text(json.dumps({
+        "model": "ModelT", "prog_id": "prog-1", "sop": "SOP1", "connectors": [make_connector("A001")]}))
+
+    run_store_command("dedup", tmp_path)
+    output = run_store_command("columnar", tmp_path)
+    assert "Converted connectors/connectors_ModelT_prog-1.json" in output
+    assert connector_store.is_columnar_program(str(tmp_path / connector_store.COLUMNAR_DIR / "connectors_ModelT_prog-1"))
+
+    output = run_store_command("columnar", tmp_path)
+    assert "Up to date: connectors/connectors_ModelT_prog-1.json" in output
+
+
+def test_current_columnar_path_follows_the_file_content(tmp_path, write_program):
+    meta = write_program([make_connector("A001")])
+    columnar_dir = str(tmp_path / "columnar")
+    assert connector_store.current_columnar_path(meta, columnar_dir) is None
+
+    out_dir = connector_store.write_columnar_program(meta["filename"], columnar_dir)
+    assert connector_store.current_columnar_path(meta, columnar_dir) == out_dir
+    assert connector_store.current_columnar_path(dict(meta, sha256="0" * 64), columnar_dir) is None
+
+
+def test_parse_numbers_keeps_plain_decimals_only():
+    numbers = connector_store.parse_numbers(["0.5", "A1", "D302", "unused", None, "2", "0.5"])
+    assert numbers.dtype == np.float32
+    assert numbers[[0, 5, 6]].tolist() == [0.5, 2.0, 0.5]
+    assert np.isnan(numbers[[1, 2, 3, 4]]).all()
+
+
+@pytest.mark.parametrize("data, message", [
+    ([], "not an object"),
+    ({"model": "ModelT", "prog_id": "prog-1", "connectors": []}, "missing one or more required keys"),
+    ({"model": 3, "prog_id": "prog-1", "sop": "SOP1", "connectors": []}, "'model' is not a string"),
+    ({"model": "ModelT", "prog_id": "prog-1", "sop": "SOP1", "connectors": {}}, "'connectors' is not a list"),
+])
+def test_decode_program_rejects_files_that_are_not_programs(data, message):
+    with pytest.raises(ValueError, match=message):
+        connector_store.decode_program(data)
+
+
+def test_decode_program_adds_numeric_cavity_columns():
+    connector = make_connector("A001", wire_colors=("BK", "RD"))
+    connector["pinout_table"][1].update({"Cavity": "A1", "Wire Size": "unused", "Wire Dest. Cavity": "D302"})
+    _, cavities_df, issues = connector_store.decode_program(
+        {"model": "ModelT", "prog_id": "prog-1", "sop": "SOP1", "connectors": [connector]})
+    assert issues == []
+    assert cavities_df["cavity_number"].tolist()[0] == 1.0
+    assert cavities_df["wire_size_mm2"].tolist()[0] == pytest.approx(0.35)
+    assert cavities_df[["cavity_number", "wire_size_mm2", "wire_dest_cavity_number"]].iloc[1].isna().all()
+
+
+def test_dedup_store_round_trips_programs_and_shares_their_objects(tmp_path, write_program):
+    shared = make_connector("A001", wire_colors=("BK", "RD"))
+    old_meta = write_program([shared, make_connector("A002", color="WH")], prog_id="prog-1", sop="SOP1")
+    new_meta = write_program([dict(shared, url=shared["url"] + "new/"), make_connector("A003", wire_colors=("BK", "GN"))],
+                             prog_id="prog-2", sop="SOP2")
+    dedup_dir = str(tmp_path / "dedup")
+    stats = connector_store.write_dedup_store([old_meta, new_meta], dedup_dir)
+    # A001 is stored once; every connector's cavity 1 is the same BK row
+    assert (stats["connectors"], stats["connector_records"]) == (4, 3)
+    assert (stats["cavity_rows"], stats["rows"]) == (7, 3)
+
+    loaded = {}
+    for meta in (old_meta, new_meta):
+        dedup_path = connector_store.dedup_path_for(meta["filename"], dedup_dir)
+        assert connector_store.resolve_program_path(meta, str(tmp_path / "columnar"), dedup_dir) == dedup_path
+        connectors_df, cavities_df = loaded[meta["prog_id"]] = connector_store.load_program_tables(dedup_path)
+        json_connectors, json_cavities = connector_store.load_json_program_tables(meta["filename"])
+        assert connectors_df.astype(object).equals(json_connectors.astype(object)) # Per-program urls included
+        assert cavities_df[list(json_cavities.columns)].astype(object).equals(json_cavities.astype(object))
+
+    # Both programs decode the same objects: cavity columns share one set of categories
+    old_cavities, new_cavities = loaded["prog-1"][1], loaded["prog-2"][1]
+    assert old_cavities["wire_color"].cat.categories is new_cavities["wire_color"].cat.categories
+
+    # A changed program file no longer resolves to its refs file
+    assert connector_store.resolve_program_path(dict(old_meta, sha256="0" * 64), str(tmp_path / "columnar"), dedup_dir) == \
+        old_meta["filename"]
+
+
+def test_dedup_store_keeps_the_typed_decode_and_its_issues(tmp_path, write_program):
+    malformed = make_connector("A002")
+    malformed["tesla_part_number"] = 123
+    malformed["pinout_table"].append("not a pin")
+    malformed["pinout_table"][0]["Wire Size"] = 0.5
+    meta = write_program([make_connector("A001"), malformed, "not a connector"])
+    connectors_df, cavities_df, expected_issues = connector_store.decode_program(connector_store.read_json_file(meta["filename"]))
+    assert expected_issues
+
+    dedup_dir = str(tmp_path / "dedup")
+    stats = connector_store.write_dedup_store([meta], dedup_dir)
+    assert stats["issues"] == {meta["filename"]: expected_issues}
+
+    issues = []
+    dedup_connectors, dedup_cavities = connector_store.load_dedup_program_tables(
+        connector_store.dedup_path_for(meta["filename"], dedup_dir), issues)
+    assert issues == expected_issues
+    # Same values; the categories of the dedup tables are shared across programs
+    assert dedup_connectors.astype(object).equals(connectors_df.astype(object))
+    assert dedup_cavities[list(cavities_df.columns)].astype(object).equals(cavities_df.astype(object))
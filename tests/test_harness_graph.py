@@ -0,0 +1,66 @@
+import pandas as pd
+
+import connector_store
+import harness_graph
+from conftest import make_connector
+
+
+def pin(cavity, wire_color, dest, dest_cavity):
+    return {"Cavity": cavity, "Terminal Manufacturer": "TE", "Terminal Part Number": "1-100", "Terminal Size": "0.64",
+            "Wire Color": wire_color, "Wire Size": "0.35", "Wire Seal Manufacturer": "", "Wire Seal PN": "",
+            "Wire Dest. Desg.": dest, "Wire Dest. Cavity": dest_cavity}
+
+
+def build_graph(*connectors):
+    connectors_df, cavities_df = connector_store.program_to_tables(list(connectors))
+    return harness_graph.build_harness_graph(connectors_df, cavities_df)
+
+
+def trace_rows(trace):
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in trace[["step", "connector", "cavity", "via", "wire_color", "endpoint"]].itertuples(index=False)]
+
+
+def test_trace_follows_a_wire_between_two_connectors():
+    x100 = make_connector("X100")
+    x100["pinout_table"] = [pin("1", "BK", "X200", "2"), pin("2", "unused", "unused", "unused")]
+    x200 = make_connector("X200")
+    x200["pinout_table"] = [pin("1", "RD", "X300", "4"), pin("2", "BK", "X100", "1")] # Lists the same wire back
+    graph = build_graph(x100, x200)
+
+    assert trace_rows(graph.trace("X100", "1")) == [
+        (0, "X100", "1", None, None, True),
+        (1, "X200", "2", "wire", "BK", True),
+    ]
+    assert graph.endpoints("X200", "2")[["connector", "cavity"]].values.tolist() == [["X200", "2"], ["X100", "1"]]
+    # A destination outside the program is still an endpoint
+    assert trace_rows(graph.trace("X200", "1"))[1] == (1, "X300", "4", "wire", "RD", True)
+
+
+def test_trace_crosses_inline_connector_halves():
+    x100 = make_connector("X100")
+    x100["pinout_table"] = [pin("1", "BK", "X930M", "3")]
+    x930m = make_connector("X930M")
+    x930m["pinout_table"] = [pin("3", "BK", "X100", "1")]
+    x930f = make_connector("X930F")
+    x930f["pinout_table"] = [pin("3", "BK/WH", "X200", "7")]
+    graph = build_graph(x100, x930m, x930f)
+
+    assert trace_rows(graph.trace("X100", "1")) == [
+        (0, "X100", "1", None, None, True),
+        (1, "X930M", "3", "wire", "BK", False),
+        (2, "X930F", "3", "mating", None, False),
+        (3, "X200", "7", "wire", "BK/WH", True),
+    ]
+
+
+def test_trace_without_a_match():
+    x100 = make_connector("X100")
+    x100["pinout_table"] = [pin("1", "BK", "X200", "2"), pin("2", "unused", "unused", "unused")]
+    graph = build_graph(x100)
+
+    assert graph.trace("X100", "9").empty
+    assert graph.trace("X999", "1").empty
+    assert graph.neighbors("X999").empty
+    # An unwired cavity is the only end of its circuit
+    assert trace_rows(graph.trace("X100", "2")) == [(0, "X100", "2", None, None, True)]
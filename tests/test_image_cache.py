@@ -0,0 +1,123 @@
+import io
+import time
+
+import pytest
+
+import image_cache
+
+URL = "https://example.invalid/images/connector.png"
+
+
+class StubResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class StubSession:
+    def __init__(self, content):
+        self.content = content
+        self.requested = []
+
+    def get(self, url, timeout):
+        self.requested.append(url)
+        return StubResponse(self.content)
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    image_cache.Image.new("RGB", (400, 300), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_unwritable_cache_dir_falls_back_to_source_urls(tmp_path):
+    (tmp_path / "not_a_dir").write_text("")
+    session = StubSession(b"")
+    cache = image_cache.ImageCache(str(tmp_path / "not_a_dir" / "cache"), session=session)
+    assert cache.error
+    assert cache.thumbnail(URL) is None
+    assert cache.image(URL) is None
+    cache.fetch_in_background(URL)
+    assert cache.prefetch([URL]) == 0
+    assert session.requested == []
+    cache.index_changed = True
+    cache.save_index()
+    assert cache.counts["index_save_failed"] == 1
+    assert "unavailable" in cache.summary()
+
+
+def test_failed_index_save_keeps_the_entries_and_retries(tmp_path):
+    cache = image_cache.ImageCache(str(tmp_path / "cache"), session=StubSession(b"<svg/>"))
+    cache.fetch(URL.replace(".png", ".svg"))
+    (tmp_path / "cache" / "index.json").mkdir() # os.replace onto it fails, like a full disk
+    cache.save_index()
+    assert cache.counts["index_save_failed"] == 1
+    assert cache.index_changed
+    assert cache.thumbnail(URL.replace(".png", ".svg"), fetch=False) is not None
+    assert not [path for path in (tmp_path / "cache").iterdir() if path.name.endswith(".tmp")]
+
+
+@pytest.mark.skipif(image_cache.Image is None, reason="thumbnails need Pillow")
+def test_unreadable_image_is_counted_not_printed(tmp_path, capsys):
+    cache = image_cache.ImageCache(str(tmp_path / "cache"), session=StubSession(b"not an image"))
+    cache.fetch(URL)
+    assert cache.counts["thumbnail_failed"] == 1
+    assert capsys.readouterr().out == ""
+    assert cache.thumbnail(URL, fetch=False) == cache.image(URL, fetch=False) # Full-size file in its place
+
+
+@pytest.mark.skipif(image_cache.Image is None, reason="thumbnails need Pillow")
+def test_background_fetch_caches_the_image_for_later_lookups(tmp_path):
+    session = StubSession(png_bytes())
+    cache = image_cache.ImageCache(str(tmp_path / "cache"), session=session)
+    assert cache.thumbnail(URL, fetch=False) is None
+    cache.fetch_in_background(URL)
+    deadline = time.monotonic() + 10
+    while cache.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert session.requested == [URL]
+    thumbnail = cache.thumbnail(URL, fetch=False)
+    assert thumbnail is not None and thumbnail.startswith(cache.thumb_dir)
+
+
+class FailingSession:
+    def get(self, url, timeout):
+        raise image_cache.requests.exceptions.ConnectionError("offline")
+
+
+def test_failed_downloads_are_all_remembered_while_the_index_refreshes(tmp_path):
+    cache = image_cache.ImageCache(str(tmp_path / "cache"), session=FailingSession())
+    urls = [f"https://example.invalid/images/{number}.png" for number in range(200)]
+    for url in urls:
+        cache.fetch_in_background(url)
+    # Another process keeps saving the index meanwhile; each refresh rebuilds the failed map
+    number = 0
+    while cache.pending:
+        number += 1
+        with open(cache.index_path, "w", encoding="utf-8") as f:
+            f.write('{"https://example.invalid/other/%d.png": {"sha256": "0", "ext": ".png"}}' % number)
+        cache.refresh()
+    assert cache.counts["failed"] == len(urls)
+    assert set(cache.failed) == set(urls)
+    assert cache.thumbnail(urls[0]) is None # Not retried before FAILED_RETRY_SECONDS
+
+
+@pytest.mark.skipif(image_cache.Image is None, reason="icons need Pillow")
+def test_icons_in_memory_are_capped_least_recently_used_first(tmp_path):
+    cache = image_cache.ImageCache(str(tmp_path / "cache"), max_icons=2)
+    urls = [f"https://example.invalid/images/{color}.png" for color in ("red", "green", "blue")]
+    for url, color in zip(urls, ("red", "green", "blue")):
+        buffer = io.BytesIO()
+        image_cache.Image.new("RGB", (100, 100), color).save(buffer, format="PNG")
+        cache.put(url, buffer.getvalue())
+
+    first = cache.icon_data_uri(urls[0])
+    assert first.startswith("data:image/jpeg;base64,")
+    cache.icon_data_uri(urls[1])
+    assert cache.icon_data_uri(urls[0]) == first # Now the most recently used
+    cache.icon_data_uri(urls[2])
+    assert len(cache.icons) == 2
+    assert cache.index[urls[1]]["sha256"] not in cache.icons
+    assert cache.index[urls[0]]["sha256"] in cache.icons
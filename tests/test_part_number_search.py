@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import connector_index
+import connector_store
+import part_number_search
+from conftest import make_connector
+
+
+def levenshtein(a, b):
+    # Plain full-matrix edit distance, independent of the module's banded version
+    distances = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            distances[i][j] = min(distances[i - 1][j] + 1, distances[i][j - 1] + 1,
+                                  distances[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+    return distances[-1][-1]
+
+
+@pytest.fixture
+def index():
+    return part_number_search.build_part_number_index(connector_index.prepare_program(*connector_store.program_to_tables([
+        make_connector("A001", tesla_part_number="1035000-00-A", connector="TE 1-1718346-1"),
+        make_connector("A002", tesla_part_number="1035001-00-A", connector="KSE K30M00121"),
+        make_connector("A003", tesla_part_number="1035000-00-B", connector="YAZAKI 7283-1234"),
+        make_connector("A004", tesla_part_number="2000000-00-A", connector="TE 1-1718346-1"),
+    ])))
+
+
+def test_one_edit_typo_finds_the_exact_part_first(index):
+    results = index.search("1035O00-00-A") # Letter O for the zero
+    assert results["name"].tolist()[:1] == ["A001"]
+    assert results[["matched_value", "distance"]].values.tolist()[0] == ["1035000-00-A", 1]
+
+    results = index.search("k30m0121") # Dropped digit, lower case, connector part number word
+    assert results[["name", "matched_field", "matched_value", "distance"]].values.tolist() == [
+        ["A002", "Connector part number", "K30M00121", 1]]
+
+
+def test_ranking_is_stable(index):
+    results = index.search("1035000-00-A")
+    # Closest first; ties keep table order
+    assert results[["name", "distance"]].values.tolist() == [["A001", 0], ["A002", 1], ["A003", 1]]
+    assert results["name"].tolist() == index.search("1035000-00-A")["name"].tolist()
+    # Several connectors sharing a part number come back in table order
+    assert index.search("1-1718346-1")["name"].tolist() == ["A001", "A004"]
+
+
+def test_qgram_search_matches_a_brute_force_scan():
+    generator = random.Random(7)
+    values = ["".join(generator.choice("0123AB-") for _ in range(generator.randint(1, 9))) for _ in range(400)]
+    qgram_index = part_number_search.QGramIndex(values)
+    distinct = sorted(set(values))
+    for query in values[:40] + ["", "0", "AB-12", "3333333333"]:
+        for max_distance in range(4):
+            expected = sorted((value, levenshtein(query, value)) for value in distinct
+                              if query and levenshtein(query, value) <= max_distance)
+            found = qgram_index.search(query, max_distance)
+            assert sorted((value, distance) for value, distance, _ in found) == expected
+            for value, _, entries in found:
+                assert {values[entry] for entry in entries} == {value}
@@ -0,0 +1,134 @@
+import random
+
+import numpy as np
+import pytest
+
+import connector_index
+import connector_store
+import result_cache
+from conftest import make_connector
+
+
+@pytest.fixture
+def prepared():
+    return connector_index.prepare_program(*connector_store.program_to_tables([
+        make_connector("A001", tesla_part_number="1035000-00-A", connector="TE CONNECTIVITY 1-100"),
+        make_connector("A002", tesla_part_number="1035001-00-A", connector="TE CONN 1-200"),
+        make_connector("A003", tesla_part_number="1035-01", connector="TECONN 1-300"),
+        make_connector("A004", tesla_part_number="2000000-00-A", connector="YAZAKI 7283-1234"),
+    ]))
+
+
+def expected_rows(prepared, filters):
+    return np.flatnonzero(connector_index.compute_filter_mask(prepared, filters)).tolist()
+
+
+@pytest.mark.parametrize("name, broad, narrow", [
+    ("tesla_part_number", "1035-0", "1035-00"),
+    ("tesla_part_number", "1035", "1035-01"),
+    ("manufacturer_or_connector", "TE", "TE CONN"),
+    ("manufacturer_or_connector", "te c", "TE CONN 1-2"),
+])
+def test_tightened_substring_is_narrowed_from_cached_result(prepared, name, broad, narrow):
+    cache = result_cache.ResultCache()
+    rows, source = cache.rows("program", prepared, {name: broad})
+    assert source == "miss"
+    assert rows.tolist() == expected_rows(prepared, {name: broad})
+
+    rows, source = cache.rows("program", prepared, {name: narrow})
+    assert source == "narrowed"
+    assert rows.tolist() == expected_rows(prepared, {name: narrow})
+
+
+def test_unrelated_substring_is_not_narrowed(prepared):
+    cache = result_cache.ResultCache()
+    cache.rows("program", prepared, {"tesla_part_number": "1035-0"})
+    rows, source = cache.rows("program", prepared, {"tesla_part_number": "2000"})
+    assert source == "miss"
+    assert rows.tolist() == expected_rows(prepared, {"tesla_part_number": "2000"})
+
+
+def test_wire_size_bounds_are_normalized_as_floats(prepared):
+    largest = prepared.largest_wire_size # 0.35 mm² in every connector of the fixture
+    assert result_cache.normalize_filters(prepared, {"max_wire_size": (0, largest)}) == () # Untouched slider
+    broad = result_cache.normalize_filters(prepared, {"max_wire_size": (np.float32(0.1), np.float32(largest))})
+    assert [type(bound) for bound in dict(broad)["max_wire_size"]] == [float, float]
+    narrow = result_cache.normalize_filters(prepared, {"max_wire_size": (0.2, largest)})
+    assert result_cache.subsumes(broad, narrow)
+    assert not result_cache.subsumes(narrow, broad)
+
+
+@pytest.mark.parametrize("broad, narrow, expected", [
+    ((("total_cavities", (2, 10)),), (("total_cavities", (3, 8)),), True),
+    ((("total_cavities", (2, 10)),), (("total_cavities", (1, 8)),), False),
+    ((("total_cavities", (2, 10)),), (("num_connected_cavities", (3, 8)),), False), # Broad filter missing from narrow
+    ((), (("total_cavities", (3, 8)),), True),
+    ((("wire_color_counts", (("BK", 1, 4),)),), (("wire_color_counts", (("BK", 2, 3), ("RD", 0, 1))),), True),
+    ((("wire_color_counts", (("BK", 1, 4),)),), (("wire_color_counts", (("BK", 0, 3),)),), False),
+    ((("wire_color_counts", (("BK", 1, 4), ("RD", 0, 1))),), (("wire_color_counts", (("BK", 2, 3),)),), False),
+    ((("body_color", "BK"),), (("body_color", "BK"), ("total_cavities", (1, 2))), True),
+    ((("body_color", "BK"),), (("body_color", "WH"),), False),
+])
+def test_subsumes(broad, narrow, expected):
+    assert result_cache.subsumes(broad, narrow) == expected
+
+
+def random_filters_walk(rng, prepared, steps):
+    # Yields filter dicts that mostly tighten the previous one, sometimes loosen or reset it, like a user
+    # dragging sliders and typing
+    range_maxima = {"total_cavities": prepared.max_total_cavities, "num_connected_cavities": prepared.max_connected_cavities,
+                    "num_unconnected_cavities": prepared.max_unconnected_cavities}
+    filters = {}
+    for _ in range(steps):
+        action = rng.random()
+        name = rng.choice(list(range_maxima) + ["max_wire_size", "tesla_part_number", "manufacturer_or_connector",
+                                                "body_color", "wire_color_counts"])
+        if action < 0.1:
+            filters = {}
+        elif action < 0.25:
+            filters.pop(name, None)
+        elif name in range_maxima:
+            low, high = filters.get(name, (0, range_maxima[name]))
+            low, high = sorted((rng.randint(low, high), rng.randint(low, high)))
+            filters[name] = (low, high)
+        elif name == "max_wire_size":
+            low, high = sorted(rng.sample(prepared.max_wire_sizes, 2))
+            filters[name] = (low, high)
+        elif name == "tesla_part_number":
+            filters[name] = rng.choice(["1", "10", "103", "1035", "2", "20", "-00", "-01-A"])
+        elif name == "manufacturer_or_connector":
+            filters[name] = rng.choice(["t", "te", "te c", "yaz", "YAZAKI", "1-", "1-1", "mol"])
+        elif name == "body_color":
+            filters[name] = rng.choice(prepared.body_colors)
+        else:
+            counts = dict((color, (low, high)) for color, low, high in filters.get(name, []))
+            color = rng.choice(prepared.wire_colors)
+            low, high = counts.get(color, (0, prepared.max_total_cavities))
+            counts[color] = tuple(sorted((rng.randint(low, high), rng.randint(low, high))))
+            filters[name] = [(color, low, high) for color, (low, high) in counts.items()]
+        yield dict(filters)
+
+
+def test_random_filter_sequences_match_a_full_scan():
+    rng = random.Random(20)
+    connectors = []
+    for number in range(60):
+        connector = make_connector(
+            f"A{number:03}", tesla_part_number=rng.choice(["1035000-00-A", "1035001-01-A", "2000000-00-A", "1035-01"]),
+            connector=rng.choice(["TE CONNECTIVITY 1-100", "TE CONN 1-200", "YAZAKI 7283-1234", "MOLEX 5-1"]),
+            color=rng.choice(["BK", "WH", "GY"]),
+            wire_colors=[rng.choice(["BK", "RD", "GN", "unused"]) for _ in range(rng.randint(0, 6))])
+        for pin in connector["pinout_table"]:
+            pin["Wire Size"] = rng.choice(["0.35", "0.5", "1.5", "2.5", "unused"])
+            if pin["Wire Color"] == "unused":
+                pin.update({header: "unused" for header in pin if header != "Cavity"})
+        connectors.append(connector)
+    prepared = connector_index.prepare_program(*connector_store.program_to_tables(connectors))
+
+    cache = result_cache.ResultCache(max_superset_candidates=16)
+    sources = {"hit": 0, "narrowed": 0, "miss": 0}
+    for filters in random_filters_walk(rng, prepared, 3000):
+        rows, source = cache.rows("program", prepared, filters)
+        sources[source] += 1
+        assert rows.tolist() == expected_rows(prepared, filters), filters
+    assert all(sources.values()) # Hits, narrowed lookups and misses were all exercised
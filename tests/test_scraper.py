@@ -0,0 +1,365 @@
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+import connector_store
+import scrape_tesla_connectors
+from conftest import make_connector
+from stub_site import StubSite
+
+
+def stub_programs(num_programs=2, connectors_per_program=20):
+    programs = []
+    for program in range(num_programs):
+        prog_info = {"model": "ModelT", "prog_id": f"prog-{program + 1}", "sop": f"SOP{program + 1}",
+                     "build_information": [f"Plant: build {program + 1}"]}
+        connectors = []
+        for position in range(connectors_per_program):
+            connector = make_connector(f"X{program + 1}{position:02d}", tesla_part_number=f"10{position:05d}-00-A",
+                                       wire_colors=("BK", "RD", "unused")[:1 + position % 3])
+            connector["description"] = f"Connector Location: position {position}"
+            connectors.append(connector)
+        programs.append((prog_info, connectors))
+    return programs
+
+
+def saved_connectors(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["connectors"]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    # Same backoff schedule, a hundredth of the delays
+    monkeypatch.setattr(scrape_tesla_connectors, "RETRY_BASE_DELAY", 0.005)
+
+
+@pytest.fixture
+def decreases(monkeypatch):
+    # (limit before, limit after) of every multiplicative decrease of a ConcurrencyController
+    events = []
+    decrease = scrape_tesla_connectors.ConcurrencyController._decrease
+    def recording_decrease(controller):
+        before = controller.limit
+        decrease(controller)
+        if controller.limit != before:
+            events.append((before, controller.limit))
+    monkeypatch.setattr(scrape_tesla_connectors.ConcurrencyController, "_decrease", recording_decrease)
+    return events
+
+
+def crawl(site, output_dir, max_workers=8, parse_workers=0, **kwargs):
+    session = scrape_tesla_connectors.ThrottledSession(scrape_tesla_connectors.make_session(max_workers), max_workers)
+    saved_files = scrape_tesla_connectors.crawl_programs(
+        [prog_info for prog_info, _ in site.programs], max_workers=max_workers, root_url=site.root_url,
+        output_dir=str(output_dir), parse_workers=parse_workers, session=session, **kwargs)
+    return saved_files, session
+
+
+def test_every_connector_is_recovered_and_concurrency_shrinks_under_errors(tmp_path, decreases):
+    programs = stub_programs()
+    with StubSite(programs, latency=0.02, failures_per_page=2) as site:
+        saved_files, session = crawl(site, tmp_path)
+
+    assert sorted(saved_files) == sorted(scrape_tesla_connectors.program_filename(prog_info, str(tmp_path))
+                                         for prog_info, _ in programs)
+    for prog_info, connectors in programs:
+        assert saved_connectors(scrape_tesla_connectors.program_filename(prog_info, str(tmp_path))) == connectors
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+    # Every page (indexes included) failed twice before it was served
+    assert session.counts["retries"] == 2 * len(site.pages)
+    assert session.counts["throttled"] == session.counts["server_errors"] == len(site.pages)
+    assert decreases and all(after < before for before, after in decreases)
+    assert min(after for _, after in decreases) < 4 # Below the initial limit
+
+
+def test_concurrency_grows_without_errors(tmp_path):
+    programs = stub_programs()
+    with StubSite(programs, latency=0.02) as site:
+        saved_files, session = crawl(site, tmp_path)
+
+    assert len(saved_files) == len(programs)
+    assert session.counts["retries"] == 0
+    # Slow start from 4 requests in flight (a latency spike on a busy machine may still back it off later)
+    assert session.controller.peak_limit > 4
+    assert site.peak_in_flight <= 8
+
+
+def test_parse_pool_recovers_every_connector(tmp_path):
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    with StubSite(programs, failures_per_page=1) as site:
+        saved_files, _ = crawl(site, tmp_path, parse_workers=1)
+
+    assert saved_connectors(saved_files[0]) == programs[0][1]
+
+
+def test_replaying_an_archive_reproduces_the_program_files_offline(tmp_path, monkeypatch):
+    programs = stub_programs(num_programs=2, connectors_per_program=10)
+    prog_infos = [prog_info for prog_info, _ in programs]
+    archive_dir = str(tmp_path / "archive")
+    archive = scrape_tesla_connectors.PageArchive(archive_dir)
+    with StubSite(programs) as site:
+        session = scrape_tesla_connectors.ThrottledSession(
+            scrape_tesla_connectors.RecordingSession(scrape_tesla_connectors.make_session(8), archive), 8)
+        recorded_files = scrape_tesla_connectors.crawl_programs(
+            prog_infos, max_workers=8, root_url=site.root_url, output_dir=str(tmp_path / "live"), parse_workers=0,
+            session=session)
+        requests_served = dict(site.requests)
+    archive.close()
+    assert len(scrape_tesla_connectors.PageArchive(archive_dir)) == len(site.pages)
+
+    # The site is gone and any network request fails the test
+    def no_network(*args, **kwargs):
+        raise AssertionError("replay made a network request")
+    monkeypatch.setattr(requests.Session, "request", no_network)
+    archive = scrape_tesla_connectors.PageArchive(archive_dir)
+    replayed_files = scrape_tesla_connectors.crawl_programs(
+        prog_infos, max_workers=4, root_url=site.root_url, output_dir=str(tmp_path / "replay"), parse_workers=2,
+        session=scrape_tesla_connectors.ArchiveSession(archive))
+    archive.close()
+
+    assert site.requests == requests_served
+    recorded_files, replayed_files = sorted(recorded_files), sorted(replayed_files) # Programs finish in any order
+    assert [os.path.basename(path) for path in replayed_files] == [os.path.basename(path) for path in recorded_files]
+    assert len(replayed_files) == len(programs)
+    for recorded, replayed in zip(recorded_files, replayed_files):
+        with open(recorded, encoding="utf-8") as f_recorded, open(replayed, encoding="utf-8") as f_replayed:
+            assert f_replayed.read() == f_recorded.read()
+
+
+def test_saved_programs_are_not_converted_to_columnar_while_a_dedup_store_is_in_use(tmp_path):
+    prog_info = stub_programs(num_programs=1, connectors_per_program=1)[0][0]
+    columnar_dir = tmp_path / "columnar"
+    program_file = scrape_tesla_connectors.save_program(prog_info, [make_connector("A001")], str(tmp_path))
+    assert connector_store.is_columnar_program(connector_store.columnar_path_for(program_file, str(columnar_dir)))
+
+    shutil.rmtree(columnar_dir)
+    (tmp_path / "dedup").mkdir()
+    (tmp_path / "dedup" / connector_store.DEDUP_OBJECTS_FILE).write_text("{}")
+    scrape_tesla_connectors.save_program(prog_info, [make_connector("A002")], str(tmp_path))
+    assert not columnar_dir.exists()
+
+
+def test_histogram_puts_each_value_in_the_first_bucket_whose_bound_it_does_not_exceed():
+    bounds = (0.01, 0.1, 1)
+    result = scrape_tesla_connectors.histogram([0.005, 0.01, 0.0101, 0.1, 1, 1.5], bounds)
+    assert result["counts"] == [2, 2, 1, 1] # The last bucket is the overflow above 1
+    assert result["count"] == 6
+    assert result["sum_seconds"] == pytest.approx(2.6251)
+    assert result["max_seconds"] == 1.5
+    assert scrape_tesla_connectors.histogram([], bounds)["counts"] == [0, 0, 0, 0]
+
+
+def test_crawl_metrics_count_pages_bytes_and_programs(tmp_path):
+    programs = stub_programs(num_programs=2, connectors_per_program=5)
+    metrics = {}
+    with StubSite(programs) as site:
+        crawl(site, tmp_path, metrics=metrics)
+    page_bytes = {prog_info["prog_id"]: sum(len(site.pages[urlsplit(connector["url"]).path].encode("utf-8"))
+                                            for connector in connectors)
+                  for prog_info, connectors in programs}
+
+    crawl_metrics = metrics["crawl"]
+    assert crawl_metrics["pages_fetched"] == crawl_metrics["pages_parsed"] == 10
+    assert crawl_metrics["bytes_fetched"] == sum(page_bytes.values())
+    assert crawl_metrics["failures"] == 0
+    for name in ("fetch_latency", "parse_time"):
+        assert crawl_metrics[name]["count"] == sum(crawl_metrics[name]["counts"]) == 10
+        assert 0 < crawl_metrics[name]["p50_seconds"] <= crawl_metrics[name]["p99_seconds"] <= crawl_metrics[name]["max_seconds"]
+    for prog_info, _ in programs:
+        program = crawl_metrics["programs"][prog_info["prog_id"]]
+        assert program["completed"]
+        assert program["connectors"] == program["pages_fetched"] == program["pages_parsed"] == 5
+        assert program["bytes_fetched"] == page_bytes[prog_info["prog_id"]]
+        assert program["pages_per_second"] == pytest.approx(5 / program["elapsed_seconds"])
+        assert program["cache_hits"] == program["failures"] == 0
+    # Index pages included, each answered at the first attempt
+    assert metrics["requests"]["counts"]["requests"] == metrics["requests"]["latency"]["count"] == 12
+
+
+def crawl_with_timeout(site, output_dir, timeout=60, **kwargs):
+    # A crawl whose main loop waits for a page that is never reported would hang; fail instead
+    outcome = {}
+    def run():
+        try:
+            outcome["saved_files"], _ = crawl(site, output_dir, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "crawl did not finish"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["saved_files"]
+
+
+class FailingPageCache:
+    def get(self, url):
+        raise OSError("disk error")
+
+    def put(self, url, validators, connector):
+        pass
+
+
+def test_unchanged_pages_reuse_the_cached_parse_until_the_parser_version_changes(tmp_path, monkeypatch):
+    parse_calls = []
+    parse_page_content = scrape_tesla_connectors.parse_page_content
+    def counting_parse(url, content, encoding):
+        parse_calls.append(url)
+        return parse_page_content(url, content, encoding)
+    monkeypatch.setattr(scrape_tesla_connectors, "parse_page_content", counting_parse)
+    page_cache = scrape_tesla_connectors.PageCache(str(tmp_path / "page_cache"))
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    program_file = scrape_tesla_connectors.program_filename(programs[0][0], str(tmp_path))
+
+    with StubSite(programs) as site:
+        crawl(site, tmp_path, page_cache=page_cache)
+        assert len(parse_calls) == 10
+        first_run = saved_connectors(program_file)
+
+        # Same bodies: every connector comes from the cache
+        crawl(site, tmp_path, page_cache=page_cache)
+        assert len(parse_calls) == 10
+        assert saved_connectors(program_file) == first_run
+
+        # A parser change invalidates every entry
+        monkeypatch.setattr(scrape_tesla_connectors, "PARSER_VERSION", scrape_tesla_connectors.PARSER_VERSION + 1)
+        crawl(site, tmp_path, page_cache=page_cache)
+        assert len(parse_calls) == 20
+        assert saved_connectors(program_file) == first_run
+
+
+def die(url, content, encoding):
+    os._exit(1) # A parse worker killed mid-parse, e.g. by the OOM killer
+
+
+def test_unexpected_fetch_errors_fail_the_page_not_the_crawl(tmp_path, capsys):
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    with StubSite(programs) as site:
+        crawl_with_timeout(site, tmp_path, page_cache=FailingPageCache())
+
+    assert capsys.readouterr().out.count("disk error") == 10
+    partial_file = scrape_tesla_connectors.PartialProgramFile(programs[0][0], str(tmp_path))
+    assert partial_file.read_records() == {}
+
+
+def test_broken_parse_pool_fails_the_pages_not_the_crawl(tmp_path, monkeypatch):
+    monkeypatch.setattr(scrape_tesla_connectors, "parse_page_content", die)
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    with StubSite(programs) as site:
+        crawl_with_timeout(site, tmp_path, parse_workers=1)
+
+    partial_file = scrape_tesla_connectors.PartialProgramFile(programs[0][0], str(tmp_path))
+    assert partial_file.read_records() == {}
+
+
+def test_ctrl_c_is_reported_once_by_the_main_process(tmp_path):
+    # Ctrl-C in a terminal signals the whole process group, parse workers included
+    prog_info = scrape_tesla_connectors.PROG_DETAILS_LIST[0]
+    programs = [(prog_info, stub_programs(num_programs=1, connectors_per_program=200)[0][1])]
+    with StubSite(programs, latency=0.05) as site:
+        process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(scrape_tesla_connectors.__file__), "--prog", prog_info["prog_id"],
+             "--root-url", site.root_url, "--output-dir", str(tmp_path), "--no-cache", "--workers", "2", "--parse-workers", "2"],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, start_new_session=True)
+        for line in process.stdout:
+            if line.startswith("Scraped 5/"):
+                break
+        os.killpg(process.pid, signal.SIGINT)
+        output = process.stdout.read()
+        assert process.wait(timeout=30) == 130
+
+    assert "Stopped; 1 unfinished programs will resume" in output
+    assert "KeyboardInterrupt" not in output
+    assert "Traceback" not in output
+    # The metrics file is written for the interrupted run too
+    with open(tmp_path / scrape_tesla_connectors.METRICS_FILENAME, encoding="utf-8") as f:
+        metrics = json.load(f)
+    assert not metrics["completed"]
+    assert not metrics["crawl"]["programs"][prog_info["prog_id"]]["completed"]
+    assert metrics["crawl"]["pages_fetched"] >= 5
+
+
+def test_an_interrupted_run_resumes_from_its_checkpoint_and_fetches_only_the_missing_pages(tmp_path):
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    prog_info, connectors = programs[0]
+    site = StubSite(programs) # Assigns the connector URLs
+
+    # What an interrupted run leaves behind: six connectors, then a line torn by a crash mid-write
+    partial_file = scrape_tesla_connectors.PartialProgramFile(prog_info, str(tmp_path))
+    for connector in connectors[:6]:
+        partial_file.append(connector["url"], connector)
+    partial_file.close()
+    with open(partial_file.path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"url": connectors[6]["url"], "connector": connectors[6]})[:40])
+    assert set(partial_file.read_records()) == {connector["url"] for connector in connectors[:6]}
+
+    with site:
+        saved_files, _ = crawl(site, tmp_path)
+    program_file = scrape_tesla_connectors.program_filename(prog_info, str(tmp_path))
+    assert saved_files == [program_file]
+    assert saved_connectors(program_file) == connectors
+    index_path = urlsplit(scrape_tesla_connectors.program_index_url(prog_info)).path
+    assert set(site.requests) == {index_path} | {urlsplit(connector["url"]).path for connector in connectors[6:]}
+    assert not os.path.exists(program_file + ".failed")
+    assert not os.path.exists(partial_file.path)
+
+
+def test_records_appended_after_a_torn_line_are_kept(tmp_path):
+    partial_file = scrape_tesla_connectors.PartialProgramFile(stub_programs(1, 1)[0][0], str(tmp_path))
+    partial_file.append("u1", {"name": "A001"})
+    partial_file.close()
+    with open(partial_file.path, "a", encoding="utf-8") as f:
+        f.write('{"url": "u2", "conn') # Crash mid-write
+
+    partial_file.append("u2", {"name": "A002"})
+    partial_file.append("u3", {"name": "A003"})
+    partial_file.close()
+    assert list(partial_file.read_records()) == ["u1", "u2", "u3"]
+
+
+def test_duplicate_sidebar_links_are_scraped_once(tmp_path):
+    programs = stub_programs(num_programs=1, connectors_per_program=5)
+    prog_info, connectors = programs[0]
+    listed = [connectors[0], *connectors, connectors[2]] # Linked twice from the sidebar
+    with StubSite([(prog_info, listed)]) as site:
+        saved_files = crawl_with_timeout(site, tmp_path)
+    assert saved_connectors(saved_files[0]) == connectors
+
+
+def test_failed_pages_are_left_out_and_listed(tmp_path):
+    programs = stub_programs(num_programs=1, connectors_per_program=10)
+    prog_info, connectors = programs[0]
+    program_file = scrape_tesla_connectors.program_filename(prog_info, str(tmp_path))
+    failed_file = program_file + ".failed"
+    partial_file = scrape_tesla_connectors.PartialProgramFile(prog_info, str(tmp_path))
+
+    # Two pages keep failing: the program is saved without them once retries run out
+    site = StubSite(programs) # Assigns the connector URLs
+    always_failing = [connectors[3]["url"], connectors[7]["url"]]
+    site.always_failing = set(always_failing)
+    with site:
+        saved_files, _ = crawl(site, tmp_path)
+        port = site.server.server_address[1]
+    assert saved_files == [program_file]
+    assert saved_connectors(program_file) == [c for c in connectors if c["url"] not in always_failing]
+    with open(failed_file, encoding="utf-8") as f:
+        assert json.load(f) == always_failing
+    assert not os.path.exists(partial_file.path)
+
+    # Once they succeed, the next run saves the complete program and drops the list
+    with StubSite(programs, port=port) as site:
+        saved_files, _ = crawl(site, tmp_path)
+    assert saved_files == [program_file]
+    assert saved_connectors(program_file) == connectors
+    assert not os.path.exists(failed_file)
+    assert not os.path.exists(partial_file.path)